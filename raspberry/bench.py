@@ -0,0 +1,324 @@
+# Offline benchmarks for the NDVI and MQTT hot paths, with JSON results for run-to-run comparison.
+import contextlib
+import logging
+import os
+import platform
+import resource
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .drone import camera
+from .drone.analysis import INDEX_KERNELS, IndexEngine, pack_ndvi_preview, run_ndvi_pipeline
+from .drone.synthetic import synthetic_bands, write_capture_pair
+from .irrigation.controller import IrrigationController
+from .utils.codecs import PayloadCodec
+from .utils.gpio import GPIOAdapter
+from .utils.loopback import LoopbackBroker
+from .utils.mqtt_client import MQTTClient, MQTTSettings
+
+DEFAULT_SIZES = ((640, 480), (1296, 972), (2592, 1944))
+# Stages whose median may grow by this factor before ``compare`` calls it a regression.
+DEFAULT_TOLERANCE = 1.10
+
+
+def parse_size(text: str) -> Tuple[int, int]:
+    """``"640x480"`` -> ``(640, 480)``."""
+    width, _, height = text.lower().partition("x")
+    return int(width), int(height)
+
+
+def _max_rss_kib() -> int:
+    # ru_maxrss is KiB on Linux (bytes on macOS); the Pi is what matters here.
+    return int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def measure(func: Callable[[], Any], repeats: int) -> Tuple[Dict[str, float], Any]:
+    """
+    Time ``func`` over ``repeats`` runs after one warm-up, then run it once
+    more under tracemalloc for its peak traced allocation (NumPy buffers
+    included). Timed runs are not traced, so tracing overhead stays out of
+    the latencies.
+    """
+    result = func()
+    samples = []
+    for _ in range(max(1, repeats)):
+        started = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - started) * 1000.0)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    samples.sort()
+    stats = {
+        "runs": len(samples),
+        "min_ms": samples[0],
+        "median_ms": statistics.median(samples),
+        "mean_ms": statistics.fmean(samples),
+        "p95_ms": samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))],
+        "max_ms": samples[-1],
+        "peak_traced_kib": peak / 1024.0,
+    }
+    return stats, result
+
+
+@contextlib.contextmanager
+def _quiet(level: int = logging.WARNING):
+    """Per-capture/per-message INFO logging would dominate the numbers; silence it while measuring."""
+    root = logging.getLogger()
+    previous = root.level
+    root.setLevel(max(previous, level))
+    try:
+        yield
+    finally:
+        root.setLevel(previous)
+
+
+# NDVI -------------------------------------------------------------------------
+def bench_ndvi(
+    size: Tuple[int, int],
+    workdir: str,
+    repeats: int = 5,
+    fmt: str = "jpg",
+    stress_threshold: float = 0.25,
+    histogram_bins: int = 10,
+    preview_max_side: int = 64,
+    codec: Optional[PayloadCodec] = None,
+) -> Dict[str, Any]:
+    """Per-stage timings for one capture size: decode, compute, summarize, serialize and the whole pipeline."""
+    width, height = size
+    codec = codec or PayloadCodec()
+    rgb_path, nir_path = write_capture_pair(workdir, width, height, fmt=fmt, name=f"bench_{width}x{height}")
+    resize = (width, height)
+    engine = IndexEngine(histogram_bins=histogram_bins)
+    stages: Dict[str, Dict[str, float]] = {}
+
+    stages["decode"], (red, nir) = measure(lambda: camera.load_red_and_nir(rgb_path, nir_path, resize), repeats)
+    stages["compute"], result = measure(lambda: engine.run(red, nir, stress_threshold, keep_map=True), repeats)
+    stages["compute_stats_only"], _ = measure(lambda: engine.run(red, nir, stress_threshold, keep_map=False), repeats)
+    ndvi_map = result.ndvi_map
+    stages["summarize"], _ = measure(lambda: engine.summarize(ndvi_map, stress_threshold), repeats)
+    stages["preview"], preview = measure(lambda: pack_ndvi_preview(ndvi_map, preview_max_side), repeats)
+
+    bands = synthetic_bands(width, height)
+    names = list(INDEX_KERNELS)
+    thresholds = {name: stress_threshold for name in names}
+    stages["indices_all"], _ = measure(lambda: engine.run_indices(bands, names, thresholds), repeats)
+
+    summary = result.to_summary()
+    summary["preview"] = preview
+    payload = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "telemetry": {"lat": 0.0, "lon": 0.0, "alt": 0.0, "status": "ok"},
+        "ndvi": summary,
+    }
+    stages["serialize"], encoded = measure(lambda: codec.encode(payload), repeats)
+    stages["pipeline"], _ = measure(
+        lambda: run_ndvi_pipeline(
+            rgb_path, nir_path, resize, stress_threshold, engine=engine, preview_max_side=preview_max_side
+        ),
+        repeats,
+    )
+    return {
+        "size": f"{width}x{height}",
+        "pixels": width * height,
+        "format": fmt,
+        "capture_bytes": os.path.getsize(rgb_path) + os.path.getsize(nir_path),
+        "payload_bytes": len(encoded),
+        "stages": stages,
+        "max_rss_kib": _max_rss_kib(),
+    }
+
+
+# MQTT -------------------------------------------------------------------------
+def _loopback_client(broker: LoopbackBroker, client_id: str, codec: PayloadCodec, workers: int = 2) -> MQTTClient:
+    settings = MQTTSettings(
+        broker="loopback",
+        port=0,
+        username="",
+        password="",
+        client_id=client_id,
+        keepalive=60,
+        dispatch_workers=workers,
+    )
+    client = MQTTClient(settings, codec=codec, transport=broker.client(client_id))
+    client.loop_start()
+    return client
+
+
+def _wait_for(condition: Callable[[], bool], timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def _analysis_payload() -> Dict[str, Any]:
+    """A representative analysis payload (10-bin histogram, no preview)."""
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "telemetry": {"lat": 45.0, "lon": 7.0, "alt": 30.0, "groundspeed": 5.0, "heading": 90, "status": "ok"},
+        "ndvi": {"mean": 0.42, "min": -0.3, "max": 0.91, "stress_ratio": 0.18, "histogram": list(range(10))},
+    }
+
+
+def bench_publish(codec: PayloadCodec, messages: int = 2000) -> Dict[str, Any]:
+    """``MQTTClient.publish`` throughput (encode + hand-off) for an NDVI analysis payload."""
+    broker = LoopbackBroker()
+    client = _loopback_client(broker, "bench-publisher", codec)
+    payload = _analysis_payload()
+    started = time.perf_counter()
+    with _quiet():
+        for _ in range(messages):
+            client.publish("bench/analysis", payload)
+    elapsed = time.perf_counter() - started
+    client.disconnect()
+    return {
+        "messages": messages,
+        "elapsed_s": elapsed,
+        "messages_per_s": messages / elapsed if elapsed > 0 else 0.0,
+        "avg_us": elapsed / messages * 1e6,
+        "payload_bytes": broker.counters["bytes"] // max(1, broker.counters["published"]),
+        "spooled": client.spool_stats()["enqueued"],
+    }
+
+
+def bench_irrigation(
+    cfg: dict,
+    codec: PayloadCodec,
+    commands: int = 2000,
+    workers: int = 2,
+    timeout: float = 60.0,
+) -> Dict[str, Any]:
+    """
+    End-to-end command throughput: publish -> loopback broker -> dispatcher ->
+    ``IrrigationController`` -> scheduler thread (dry-run GPIO) -> status publishes.
+    """
+    broker = LoopbackBroker()
+    controller_client = _loopback_client(broker, "bench-irrigation", codec, workers=workers)
+    sender = _loopback_client(broker, "bench-sender", codec)
+    controller = IrrigationController(cfg, controller_client, GPIOAdapter(dry_run=True))
+    topic = controller.topics.irrigation_command
+    valve_ids = list(controller.valves)
+    actions = ("start", "extend", "cancel")
+    with _quiet():
+        controller.scheduler.start()
+        controller.status.start()
+        controller_client.subscribe(topic, controller._handle_command)
+
+        def _done() -> bool:
+            stats = controller_client.dispatch_stats()
+            return stats["handlers"][topic]["calls"] + stats["counters"]["dropped"] >= commands
+
+        started = time.perf_counter()
+        for idx in range(commands):
+            valve_id = valve_ids[idx % len(valve_ids)]
+            action = actions[(idx // len(valve_ids)) % len(actions)]
+            sender.publish(topic, {"parcel_id": valve_id, "liters": 1.0, "action": action})
+        published = time.perf_counter() - started
+        completed = _wait_for(_done, timeout)
+        elapsed = time.perf_counter() - started
+        stats = controller_client.dispatch_stats()
+        controller.scheduler.stop()
+        controller.status.stop()
+        sender.disconnect()
+        controller_client.disconnect()
+    return {
+        "commands": commands,
+        "completed": completed,
+        "publish_s": published,
+        "elapsed_s": elapsed,
+        "commands_per_s": stats["handlers"][topic]["calls"] / elapsed if elapsed > 0 else 0.0,
+        "dropped": stats["counters"]["dropped"],
+        "handler": stats["handlers"][topic],
+        "max_queue_wait_ms": stats["max_wait_ms"],
+        "status_messages": broker.counters["published"] - commands,
+    }
+
+
+# Orchestration ------------------------------------------------------------------
+def run_benchmarks(
+    cfg: dict,
+    sizes: Sequence[Tuple[int, int]] = DEFAULT_SIZES,
+    repeats: int = 5,
+    fmt: str = "jpg",
+    messages: int = 2000,
+    commands: int = 2000,
+    ndvi: bool = True,
+    mqtt: bool = True,
+) -> Dict[str, Any]:
+    codec = PayloadCodec.from_config(cfg["mqtt"].get("payload"))
+    ndvi_cfg = cfg["drone"]["ndvi"]
+    results: Dict[str, Any] = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "host": platform.node(),
+            "machine": platform.machine(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "cpu_count": os.cpu_count(),
+            "repeats": repeats,
+            "codec": codec.content_type,
+        },
+    }
+    if ndvi:
+        results["ndvi"] = {}
+        with tempfile.TemporaryDirectory(prefix="ndvi-bench-") as workdir:
+            for size in sizes:
+                logging.info("Benchmarking NDVI at %dx%d...", *size)
+                with _quiet():
+                    entry = bench_ndvi(
+                        size,
+                        workdir,
+                        repeats=repeats,
+                        fmt=fmt,
+                        stress_threshold=float(ndvi_cfg["stress_threshold"]),
+                        histogram_bins=int(ndvi_cfg.get("histogram_bins", 10)),
+                        codec=codec,
+                    )
+                results["ndvi"][entry["size"]] = entry
+    if mqtt:
+        logging.info("Benchmarking MQTT publish and irrigation command paths...")
+        workers = int(cfg["mqtt"].get("dispatch", {}).get("workers", 2))
+        results["mqtt"] = {
+            "publish": bench_publish(codec, messages=messages),
+            "irrigation_commands": bench_irrigation(cfg, codec, commands=commands, workers=workers),
+        }
+    results["meta"]["max_rss_kib"] = _max_rss_kib()
+    return results
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """Human-readable comparison lines; entries ending in ``REGRESSION`` exceeded ``tolerance``."""
+    lines = []
+    for size, entry in current.get("ndvi", {}).items():
+        base = baseline.get("ndvi", {}).get(size)
+        if not base:
+            continue
+        for stage, stats in entry["stages"].items():
+            before = base["stages"].get(stage, {}).get("median_ms")
+            if not before:
+                continue
+            ratio = stats["median_ms"] / before
+            flag = " REGRESSION" if ratio > tolerance else ""
+            lines.append(f"ndvi {size} {stage}: {before:.2f} -> {stats['median_ms']:.2f} ms (x{ratio:.2f}){flag}")
+    rates = (("publish", "messages_per_s"), ("irrigation_commands", "commands_per_s"))
+    for name, key in rates:
+        now = current.get("mqtt", {}).get(name, {}).get(key)
+        before = baseline.get("mqtt", {}).get(name, {}).get(key)
+        if not now or not before:
+            continue
+        ratio = before / now  # > 1 means slower
+        flag = " REGRESSION" if ratio > tolerance else ""
+        lines.append(f"mqtt {name}: {before:.0f} -> {now:.0f} /s (x{1 / ratio:.2f}){flag}")
+    return lines
@@ -0,0 +1,184 @@
+# Resident drone process: warm MQTT/autopilot connections, drone-cycle jobs over a local Unix socket.
+import json
+import logging
+import os
+import pathlib
+import signal
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_SOCKET = "/tmp/agriculture-drone.sock"
+MAX_REQUEST_BYTES = 64 * 1024
+
+
+class DaemonUnavailable(ConnectionError):
+    """No daemon is listening on the socket."""
+
+
+@dataclass
+class DaemonSettings:
+    socket: str = DEFAULT_SOCKET
+    socket_mode: int = 0o660  # group members (e.g. the cron user) may submit jobs
+    request_timeout_seconds: float = 120.0
+
+    @classmethod
+    def from_config(cls, raw: Optional[dict]) -> "DaemonSettings":
+        raw = raw or {}
+        mode = raw.get("socket_mode", cls.socket_mode)
+        return cls(
+            socket=str(raw.get("socket", cls.socket)),
+            # YAML reads an unquoted 0660 as an int already; quoted strings are octal text.
+            socket_mode=mode if isinstance(mode, int) else int(str(mode), 8),
+            request_timeout_seconds=float(raw.get("request_timeout_seconds", cls.request_timeout_seconds)),
+        )
+
+
+def _reply_summary(ndvi_summary: Dict) -> Dict:
+    # The published payload carries the preview; the CLI only needs the numbers.
+    return {key: value for key, value in ndvi_summary.items() if key not in ("preview", "ndvi_map")}
+
+
+class DroneDaemon:
+    """
+    Serves newline-delimited JSON requests on a Unix stream socket.
+
+    Requests: ``{"command": "drone-cycle", "rgb": ..., "nir": ..., "exact"?: bool}``,
+    ``{"command": "ping"}`` and ``{"command": "stats"}``; every reply is one
+    JSON line with ``ok``. Cycles run one at a time on a single worker thread,
+    so its NDVI scratch buffers stay allocated between captures; connection
+    threads only parse requests and wait for their result.
+    """
+
+    def __init__(self, service, settings: DaemonSettings, on_stop: Optional[Callable[[], None]] = None):
+        self.service = service
+        self.settings = settings
+        self.on_stop = on_stop
+        self.started_at = time.time()
+        self.counters = {"cycles": 0, "failed": 0, "requests": 0}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="drone-cycle")
+        self._server: Optional[socketserver.ThreadingUnixStreamServer] = None
+        self._lock = threading.Lock()
+
+    # Requests ------------------------------------------------------------------
+    def _cycle(self, rgb: str, nir: str, exact: bool = False) -> Dict:
+        started = time.perf_counter()
+        summary = self.service.run_capture_and_publish(rgb, nir, exact=exact)
+        return {"ndvi": _reply_summary(summary), "elapsed_ms": (time.perf_counter() - started) * 1000.0}
+
+    def handle(self, request: Any) -> Dict[str, Any]:
+        with self._lock:
+            self.counters["requests"] += 1
+        command = request.get("command") if isinstance(request, dict) else None
+        if command == "ping":
+            return {"ok": True}
+        if command == "stats":
+            with self._lock:
+                counters = dict(self.counters)
+            return {"ok": True, "uptime_seconds": time.time() - self.started_at, "counters": counters}
+        if command != "drone-cycle":
+            return {"ok": False, "error": f"unknown command {command!r}"}
+        rgb, nir = request.get("rgb"), request.get("nir")
+        if not rgb or not nir:
+            return {"ok": False, "error": "drone-cycle needs rgb and nir paths"}
+        exact = request.get("exact", False)
+        if not isinstance(exact, bool):
+            return {"ok": False, "error": f"exact must be true or false, got {exact!r}"}
+        try:
+            result = self._executor.submit(self._cycle, str(rgb), str(nir), exact).result()
+        except Exception as exc:
+            with self._lock:
+                self.counters["failed"] += 1
+            logging.error("Daemon drone-cycle for %s / %s failed: %s", rgb, nir, exc)
+            return {"ok": False, "error": str(exc)}
+        with self._lock:
+            self.counters["cycles"] += 1
+        return {"ok": True, **result}
+
+    # Socket --------------------------------------------------------------------
+    def _claim_socket(self, path: pathlib.Path):
+        if not path.exists():
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(path))
+        except OSError:
+            path.unlink()  # stale socket left by a daemon that did not shut down cleanly
+            return
+        finally:
+            probe.close()
+        raise RuntimeError(f"Another daemon is already listening on {path}")
+
+    def serve_forever(self):
+        path = pathlib.Path(self.settings.socket)
+        self._claim_socket(path)
+        daemon = self
+
+        class _Handler(socketserver.StreamRequestHandler):
+            def reply(self, payload: dict):
+                self.wfile.write(json.dumps(payload, default=str).encode("utf-8") + b"\n")
+
+            def handle(self):
+                while True:
+                    # Bounded read: an oversized request is never buffered in full.
+                    line = self.rfile.readline(MAX_REQUEST_BYTES + 1)
+                    if not line:
+                        return
+                    if len(line) > MAX_REQUEST_BYTES:
+                        # The rest of the line is still unread, so the stream cannot be resynchronized.
+                        self.reply({"ok": False, "error": "request too large"})
+                        return
+                    try:
+                        request = json.loads(line)
+                    except ValueError as exc:
+                        self.reply({"ok": False, "error": f"invalid JSON: {exc}"})
+                        continue
+                    self.reply(daemon.handle(request))
+
+        self._server = socketserver.ThreadingUnixStreamServer(str(path), _Handler)
+        self._server.daemon_threads = True
+        os.chmod(path, self.settings.socket_mode)
+        logging.info("Drone daemon listening on %s", path)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self._executor.shutdown(wait=True)
+            path.unlink(missing_ok=True)
+            if self.on_stop:
+                self.on_stop()
+            logging.info("Drone daemon stopped (%s)", self.counters)
+
+    def stop(self):
+        if self._server is not None:
+            # shutdown() blocks until serve_forever returns, so never call it from the serving thread.
+            threading.Thread(target=self._server.shutdown, name="daemon-stop", daemon=True).start()
+
+    def run(self):
+        """``serve_forever`` until SIGINT/SIGTERM."""
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: self.stop())
+        self.serve_forever()
+
+
+def submit(socket_path: str, request: Dict, timeout: float = 120.0) -> Dict:
+    """Send one request to a running daemon and return its reply; ``DaemonUnavailable`` if none is listening."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        try:
+            sock.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError) as exc:
+            raise DaemonUnavailable(f"{socket_path}: {exc.strerror or exc}") from exc
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as reader:
+            line = reader.readline()
+    finally:
+        sock.close()
+    if not line:
+        raise DaemonUnavailable(f"{socket_path}: connection closed without a reply")
+    return json.loads(line)
@@ -1,53 +1,732 @@
 import logging
+import math
 import pathlib
-from dataclasses import dataclass
-from typing import Dict, Tuple
+import threading
+import dataclasses
+from dataclasses import dataclass, field
+from statistics import NormalDist
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 
 import numpy as np
 
+try:  # optional: fuses each expression into one cache-blocked, multi-threaded loop
+    import numexpr  # type: ignore
+except ImportError:  # pure-NumPy kernels below are the fallback
+    numexpr = None
+
+from ..utils import metrics
+from ..utils.settings import RawFormat
 from . import camera
+from .cache import NDVICache, cache_params
+
+DEFAULT_TILE_ROWS = 256
+
+# Shared with CapturePipeline so the threaded, async and one-shot paths report into the same series.
+NDVI_STAGE_MS = metrics.histogram("ndvi_stage_ms", "NDVI capture processing time per stage, ms.")
+NDVI_CAPTURES = metrics.counter("ndvi_captures_total", "NDVI captures by outcome.")
 
 
 @dataclass
 class NDVIResult:
-    ndvi_map: np.ndarray
+    ndvi_map: Optional[np.ndarray]  # None when the map was not materialized
     mean: float
     minimum: float
     maximum: float
     stress_ratio: float  # percentage of pixels below threshold
+    histogram: Optional[np.ndarray] = None  # pixel counts over equal-width bins on [-1, 1]
+    sampling: Optional[Dict] = None  # estimator details when the result comes from (or fell back from) sampling
 
+    def to_summary(self) -> Dict:
+        summary = {
+            "mean": self.mean,
+            "min": self.minimum,
+            "max": self.maximum,
+            "stress_ratio": self.stress_ratio,
+        }
+        if self.histogram is not None:
+            summary["histogram"] = self.histogram.tolist()
+        if self.sampling is not None:
+            summary["sampling"] = self.sampling
+        return summary
 
-def compute_ndvi(rgb: np.ndarray, nir: np.ndarray, epsilon: float = 1e-6) -> np.ndarray:
-    """NDVI = (NIR - Red) / (NIR + Red)."""
-    red_channel = rgb[:, :, 0].astype(np.float32)
-    denom = (nir + red_channel + epsilon)
-    ndvi = (nir - red_channel) / denom
-    ndvi = np.clip(ndvi, -1.0, 1.0)
-    return ndvi
 
+@dataclass
+class _TileStats:
+    """Running statistics accumulated tile by tile."""
+
+    stress_threshold: float
+    pixels: int = 0
+    total: float = 0.0
+    minimum: float = float("inf")
+    maximum: float = float("-inf")
+    stressed: int = 0
+    histogram: Optional[np.ndarray] = None
 
-def summarize_ndvi(ndvi: np.ndarray, stress_threshold: float) -> NDVIResult:
-    total_pixels = ndvi.size
-    stressed = float(np.sum(ndvi < stress_threshold))
-    stress_ratio = (stressed / total_pixels) if total_pixels else 0.0
+    def to_result(self, ndvi_map: Optional[np.ndarray]) -> NDVIResult:
+        if not self.pixels:
+            return NDVIResult(ndvi_map, 0.0, 0.0, 0.0, 0.0, self.histogram)
+        return NDVIResult(
+            ndvi_map=ndvi_map,
+            mean=self.total / self.pixels,
+            minimum=self.minimum,
+            maximum=self.maximum,
+            stress_ratio=self.stressed / self.pixels,
+            histogram=self.histogram,
+        )
+
+
+@dataclass
+class _Scratch:
+    rows: int
+    width: int
+    num: np.ndarray = field(init=False)
+    den: np.ndarray = field(init=False)
+    mask: np.ndarray = field(init=False)
+    bins: np.ndarray = field(init=False)
+
+    def __post_init__(self):
+        shape = (self.rows, self.width)
+        self.num = np.empty(shape, dtype=np.float32)
+        self.den = np.empty(shape, dtype=np.float32)
+        self.mask = np.empty(shape, dtype=bool)
+        self.bins = np.empty(shape, dtype=np.intp)
+
+
+class NDVIEngine:
+    """
+    Tiled NDVI kernel that computes the map and its statistics in one pass.
+
+    Rows are processed in bands of ``tile_rows`` through scratch buffers that
+    are allocated once per frame width and reused, so the working set stays
+    bounded no matter how large the capture is. Instances are not thread-safe;
+    use one engine per worker (see ``thread_engine``).
+    """
+
+    def __init__(self, tile_rows: int = DEFAULT_TILE_ROWS, histogram_bins: int = 0, epsilon: float = 1e-6):
+        if tile_rows <= 0:
+            raise ValueError("tile_rows must be positive")
+        self.tile_rows = int(tile_rows)
+        self.histogram_bins = max(0, int(histogram_bins))
+        self.epsilon = float(epsilon)
+        self._scratch: Optional[_Scratch] = None
+
+    def _buffers(self, width: int) -> _Scratch:
+        if self._scratch is None or self._scratch.width != width:
+            self._scratch = _Scratch(self.tile_rows, width)
+        return self._scratch
+
+    def _new_stats(self, stress_threshold: float) -> _TileStats:
+        histogram = np.zeros(self.histogram_bins, dtype=np.int64) if self.histogram_bins else None
+        return _TileStats(stress_threshold=float(stress_threshold), histogram=histogram)
+
+    def _accumulate(self, tile: np.ndarray, stats: _TileStats, scratch: _Scratch):
+        rows = tile.shape[0]
+        stats.pixels += tile.size
+        stats.total += float(tile.sum(dtype=np.float64))
+        stats.minimum = min(stats.minimum, float(tile.min()))
+        stats.maximum = max(stats.maximum, float(tile.max()))
+        mask = scratch.mask[:rows]
+        np.less(tile, stats.stress_threshold, out=mask)
+        stats.stressed += int(np.count_nonzero(mask))
+        if stats.histogram is not None:
+            # Map [-1, 1] onto [0, bins) in the scratch denominator, then bin by integer index.
+            scaled = scratch.den[:rows]
+            half = self.histogram_bins / 2.0
+            np.multiply(tile, half, out=scaled)
+            scaled += half
+            np.clip(scaled, 0, self.histogram_bins - 1, out=scaled)
+            idx = scratch.bins[:rows]
+            np.copyto(idx, scaled, casting="unsafe")
+            stats.histogram += np.bincount(idx.ravel(), minlength=self.histogram_bins)
+
+    def run(
+        self,
+        red: np.ndarray,
+        nir: np.ndarray,
+        stress_threshold: float,
+        keep_map: bool = True,
+    ) -> NDVIResult:
+        """Compute NDVI = (NIR - Red) / (NIR + Red) and its summary; skip the map when keep_map is False."""
+        if red.shape != nir.shape:
+            raise ValueError(f"Band shape mismatch: red={red.shape} nir={nir.shape}")
+        height, width = red.shape
+        scratch = self._buffers(width)
+        stats = self._new_stats(stress_threshold)
+        ndvi_map = np.empty((height, width), dtype=np.float32) if keep_map else None
+        for start in range(0, height, self.tile_rows):
+            stop = min(start + self.tile_rows, height)
+            rows = stop - start
+            red_t = red[start:stop]
+            nir_t = nir[start:stop]
+            num = ndvi_map[start:stop] if ndvi_map is not None else scratch.num[:rows]
+            den = scratch.den[:rows]
+            np.subtract(nir_t, red_t, out=num, dtype=np.float32)
+            np.add(nir_t, red_t, out=den, dtype=np.float32)
+            den += self.epsilon
+            np.divide(num, den, out=num)
+            np.clip(num, -1.0, 1.0, out=num)
+            self._accumulate(num, stats, scratch)
+        return stats.to_result(ndvi_map)
+
+    def summarize(self, ndvi: np.ndarray, stress_threshold: float) -> NDVIResult:
+        """Statistics over an already computed NDVI map, tile by tile."""
+        ndvi = np.asarray(ndvi, dtype=np.float32)
+        if ndvi.ndim == 1:
+            ndvi = ndvi.reshape(1, -1)
+        scratch = self._buffers(ndvi.shape[1])
+        stats = self._new_stats(stress_threshold)
+        for start in range(0, ndvi.shape[0], self.tile_rows):
+            self._accumulate(ndvi[start : start + self.tile_rows], stats, scratch)
+        return stats.to_result(ndvi)
+
+
+INDEX_EPSILON = 1e-6
+SAVI_L = 0.5
+
+# Shared sub-expressions: name -> (bands, numexpr expression, NumPy implementation writing into ``out``).
+_TERMS: Dict[str, Tuple[Tuple[str, ...], str, Callable[[Dict[str, np.ndarray], np.ndarray], None]]] = {
+    "nir_plus_red": (("nir", "red"), "nir + red", lambda v, out: np.add(v["nir"], v["red"], out=out, dtype=np.float32)),
+    "nir_minus_red": (
+        ("nir", "red"),
+        "nir - red",
+        lambda v, out: np.subtract(v["nir"], v["red"], out=out, dtype=np.float32),
+    ),
+    "nir_plus_green": (
+        ("nir", "green"),
+        "nir + green",
+        lambda v, out: np.add(v["nir"], v["green"], out=out, dtype=np.float32),
+    ),
+    "nir_minus_green": (
+        ("nir", "green"),
+        "nir - green",
+        lambda v, out: np.subtract(v["nir"], v["green"], out=out, dtype=np.float32),
+    ),
+    "nir_plus_rededge": (
+        ("nir", "rededge"),
+        "nir + rededge",
+        lambda v, out: np.add(v["nir"], v["rededge"], out=out, dtype=np.float32),
+    ),
+    "nir_minus_rededge": (
+        ("nir", "rededge"),
+        "nir - rededge",
+        lambda v, out: np.subtract(v["nir"], v["rededge"], out=out, dtype=np.float32),
+    ),
+}
+
+
+def _normalized_difference(diff: str, total: str):
+    def kernel(v: Dict[str, np.ndarray], out: np.ndarray, tmp: np.ndarray):
+        np.add(v[total], INDEX_EPSILON, out=tmp)
+        np.divide(v[diff], tmp, out=out)
+
+    return kernel
+
+
+def _savi(v: Dict[str, np.ndarray], out: np.ndarray, tmp: np.ndarray):
+    np.add(v["nir_plus_red"], SAVI_L * v["full_scale"], out=tmp)
+    np.divide(v["nir_minus_red"], tmp, out=out)
+    out *= 1.0 + SAVI_L
+
+
+def _evi(v: Dict[str, np.ndarray], out: np.ndarray, tmp: np.ndarray):
+    np.multiply(v["red"], 6.0, out=tmp, dtype=np.float32)
+    tmp += v["nir"]
+    np.multiply(v["blue"], 7.5, out=out, dtype=np.float32)
+    tmp -= out
+    tmp += v["full_scale"]
+    np.divide(v["nir_minus_red"], tmp, out=out)
+    out *= 2.5
+
+
+@dataclass(frozen=True)
+class IndexKernel:
+    name: str
+    bands: Tuple[str, ...]
+    terms: Tuple[str, ...]  # shared sub-expressions (see _TERMS) computed once per tile
+    expression: str  # numexpr form over band and term names (and ``full_scale``)
+    numpy: Callable[[Dict[str, np.ndarray], np.ndarray, np.ndarray], None]  # (values, out, tmp)
+    bounded: bool = True  # False if the denominator can reach zero (NaN/inf are then mapped into [-1, 1])
+
+
+INDEX_KERNELS: Dict[str, IndexKernel] = {}
+
+
+def register_index(kernel: IndexKernel):
+    """Add (or replace) a vegetation index; its bands must be known to ``camera.BAND_SOURCES``."""
+    unknown = [term for term in kernel.terms if term not in _TERMS]
+    if unknown:
+        raise ValueError(f"Index {kernel.name} uses unknown terms {unknown}")
+    INDEX_KERNELS[kernel.name] = kernel
+
+
+register_index(
+    IndexKernel(
+        "ndvi",
+        ("red", "nir"),
+        ("nir_minus_red", "nir_plus_red"),
+        f"nir_minus_red / (nir_plus_red + {INDEX_EPSILON})",
+        _normalized_difference("nir_minus_red", "nir_plus_red"),
+    )
+)
+register_index(
+    IndexKernel(
+        "gndvi",
+        ("green", "nir"),
+        ("nir_minus_green", "nir_plus_green"),
+        f"nir_minus_green / (nir_plus_green + {INDEX_EPSILON})",
+        _normalized_difference("nir_minus_green", "nir_plus_green"),
+    )
+)
+register_index(
+    IndexKernel(
+        "ndre",
+        ("rededge", "nir"),
+        ("nir_minus_rededge", "nir_plus_rededge"),
+        f"nir_minus_rededge / (nir_plus_rededge + {INDEX_EPSILON})",
+        _normalized_difference("nir_minus_rededge", "nir_plus_rededge"),
+    )
+)
+register_index(
+    IndexKernel(
+        "savi",
+        ("red", "nir"),
+        ("nir_minus_red", "nir_plus_red"),
+        f"{1.0 + SAVI_L} * nir_minus_red / (nir_plus_red + {SAVI_L} * full_scale)",
+        _savi,
+    )
+)
+register_index(
+    IndexKernel(
+        "evi",
+        ("red", "nir", "blue"),
+        ("nir_minus_red",),
+        "2.5 * nir_minus_red / (nir + 6.0 * red - 7.5 * blue + full_scale)",
+        _evi,
+        bounded=False,
+    )
+)
+
+
+def index_bands(indices: Sequence[str]) -> Tuple[str, ...]:
+    """Bands needed for ``indices``, in first-use order."""
+    bands: List[str] = []
+    for name in indices:
+        if name not in INDEX_KERNELS:
+            raise ValueError(f"Unknown vegetation index {name!r} (known: {', '.join(sorted(INDEX_KERNELS))})")
+        bands.extend(band for band in INDEX_KERNELS[name].bands if band not in bands)
+    return tuple(bands)
+
+
+def index_settings(ndvi_cfg: Optional[dict]) -> Tuple[Tuple[str, ...], Dict[str, float]]:
+    """``(indices, per-index stress thresholds)`` from ``drone.ndvi``; unknown index names raise ValueError."""
+    ndvi_cfg = ndvi_cfg or {}
+    indices = tuple(dict.fromkeys(str(name).lower() for name in ndvi_cfg.get("indices") or ("ndvi",)))
+    index_bands(indices)
+    thresholds = {str(k).lower(): float(v) for k, v in (ndvi_cfg.get("index_thresholds") or {}).items()}
+    return indices, thresholds
+
+
+def _extra_indices(indices: Sequence[str]) -> List[str]:
+    return [name for name in indices if name != "ndvi"]
+
+
+def _full_scale(bands: Sequence[np.ndarray]) -> float:
+    # SAVI/EVI constants are defined for reflectance in [0, 1]; scaling them to the sensor range
+    # instead of the bands keeps NDVI-style ratios identical to NDVIEngine's and saves a pass.
+    integer = [np.iinfo(band.dtype).max for band in bands if np.issubdtype(band.dtype, np.integer)]
+    return float(max(integer)) if integer else 1.0
+
+
+class IndexEngine(NDVIEngine):
+    """
+    Evaluates any set of registered indices in one tiled pass.
+
+    Shared terms such as NIR+Red are computed once per tile and reused by
+    every index that needs them; each index then writes straight into its
+    map or scratch tile before the usual statistics are accumulated.
+    Expressions run through numexpr (bands converted to float32 once per
+    tile) when it is installed and more than one core is available, and as
+    NumPy ufuncs over the native bands otherwise. Buffers are reused like
+    ``NDVIEngine``'s.
+    """
+
+    def __init__(
+        self,
+        tile_rows: int = DEFAULT_TILE_ROWS,
+        histogram_bins: int = 0,
+        use_numexpr: Optional[bool] = None,
+    ):
+        super().__init__(tile_rows=tile_rows, histogram_bins=histogram_bins, epsilon=INDEX_EPSILON)
+        if use_numexpr is None:
+            # numexpr's gain is its multi-threaded evaluation; on one core NumPy's ufuncs are faster.
+            use_numexpr = numexpr is not None and numexpr.detect_number_of_cores() > 1
+        self.use_numexpr = use_numexpr and numexpr is not None
+        self._work: Dict[str, np.ndarray] = {}
+        self._work_width = 0
+
+    def _work_buffer(self, name: str, width: int) -> np.ndarray:
+        if self._work_width != width:
+            self._work = {}
+            self._work_width = width
+        buf = self._work.get(name)
+        if buf is None:
+            buf = self._work[name] = np.empty((self.tile_rows, width), dtype=np.float32)
+        return buf
+
+    def run_indices(
+        self,
+        bands: Dict[str, np.ndarray],
+        indices: Sequence[str],
+        stress_thresholds: Dict[str, float],
+        keep_maps: Sequence[str] = (),
+    ) -> Dict[str, NDVIResult]:
+        """Results per index; maps are materialized only for names in ``keep_maps``."""
+        kernels = [INDEX_KERNELS[name] for name in indices]
+        needed = index_bands(indices)
+        shapes = {bands[band].shape for band in needed}
+        if len(shapes) != 1:
+            raise ValueError(f"Band shape mismatch: {dict((b, bands[b].shape) for b in needed)}")
+        height, width = shapes.pop()
+        full_scale = np.float32(_full_scale([bands[band] for band in needed]))
+        terms = [term for term in _TERMS if any(term in kernel.terms for kernel in kernels)]
+        scratch = self._buffers(width)
+        stats = {k.name: self._new_stats(stress_thresholds.get(k.name, 0.0)) for k in kernels}
+        maps = {
+            k.name: np.empty((height, width), dtype=np.float32) if k.name in keep_maps else None for k in kernels
+        }
+        for start in range(0, height, self.tile_rows):
+            stop = min(start + self.tile_rows, height)
+            rows = stop - start
+            values: Dict[str, np.ndarray] = {"full_scale": full_scale}
+            for band in needed:
+                if self.use_numexpr:  # numexpr has no uint8/uint16 support
+                    values[band] = self._work_buffer(band, width)[:rows]
+                    np.copyto(values[band], bands[band][start:stop], casting="unsafe")
+                else:
+                    values[band] = bands[band][start:stop]
+            for term in terms:
+                buf = self._work_buffer(term, width)[:rows]
+                _, expression, fallback = _TERMS[term]
+                if self.use_numexpr:
+                    numexpr.evaluate(expression, local_dict=values, out=buf, casting="same_kind")
+                else:
+                    fallback(values, buf)
+                values[term] = buf
+            tmp = self._work_buffer("_tmp", width)[:rows]
+            for kernel in kernels:
+                target = maps[kernel.name]
+                out = target[start:stop] if target is not None else scratch.num[:rows]
+                if self.use_numexpr:
+                    numexpr.evaluate(kernel.expression, local_dict=values, out=out, casting="same_kind")
+                else:
+                    with np.errstate(divide="ignore", invalid="ignore"):
+                        kernel.numpy(values, out, tmp)
+                np.clip(out, -1.0, 1.0, out=out)  # also maps +/-inf to +/-1
+                if not kernel.bounded:
+                    nan_mask = scratch.mask[:rows]
+                    np.isnan(out, out=nan_mask)
+                    out[nan_mask] = 0.0
+                self._accumulate(out, stats[kernel.name], scratch)
+        return {name: stats[name].to_result(maps[name]) for name in stats}
+
+
+def block_reduce(ndvi: np.ndarray, factor: int) -> np.ndarray:
+    """Mean over non-overlapping factor x factor blocks (edges that do not fill a block are cropped)."""
+    if factor <= 1:
+        return ndvi
+    height, width = (ndvi.shape[0] // factor) * factor, (ndvi.shape[1] // factor) * factor
+    blocks = ndvi[:height, :width].reshape(height // factor, factor, width // factor, factor)
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+
+NDVI_UINT8_SCALE = 2.0 / 255.0
+NDVI_UINT8_OFFSET = -1.0
+
+
+def quantize_ndvi(ndvi: np.ndarray) -> np.ndarray:
+    """NDVI in [-1, 1] as uint8; value = byte * NDVI_UINT8_SCALE + NDVI_UINT8_OFFSET."""
+    quantized = np.empty(ndvi.shape, dtype=np.uint8)
+    np.copyto(quantized, np.rint((np.clip(ndvi, -1.0, 1.0) + 1.0) * 127.5), casting="unsafe")
+    return quantized
+
+
+def pack_ndvi_uint8(ndvi: np.ndarray) -> Dict:
+    """Pack an (already small) NDVI map as the row-major uint8 preview payload."""
+    quantized = quantize_ndvi(ndvi)
+    return {
+        "width": int(quantized.shape[1]),
+        "height": int(quantized.shape[0]),
+        "encoding": "uint8",
+        "scale": NDVI_UINT8_SCALE,
+        "offset": NDVI_UINT8_OFFSET,
+        "data": quantized.tobytes(),
+    }
+
+
+def pack_ndvi_preview(ndvi: np.ndarray, max_side: int) -> Dict:
+    """
+    Downsample an NDVI map to at most ``max_side`` pixels per side and pack it
+    as row-major uint8 bytes; value = byte * scale + offset.
+    """
+    factor = max(1, -(-max(ndvi.shape) // max_side))
+    return pack_ndvi_uint8(block_reduce(ndvi, factor))
+
+
+NDVI_MODES = ("exact", "adaptive")
+
+
+@dataclass
+class SamplingSettings:
+    confidence: float = 0.95
+    mean_tolerance: float = 0.01  # confidence-interval half-width on mean NDVI
+    stress_tolerance: float = 0.02  # half-width on stress_ratio
+    initial_samples: int = 4096
+    max_fraction: float = 0.1  # past this share of the frame, stop sampling and run the exact pass
+    strata: int = 8  # the frame is split into strata x strata cells, each sampled in proportion to its area
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_config(cls, ndvi_cfg: Optional[dict]) -> Optional["SamplingSettings"]:
+        ndvi_cfg = ndvi_cfg or {}
+        mode = str(ndvi_cfg.get("mode", "exact"))
+        if mode not in NDVI_MODES:
+            raise ValueError(f"drone.ndvi.mode must be one of {', '.join(NDVI_MODES)}, got {mode!r}")
+        if mode == "exact":
+            return None
+        raw = ndvi_cfg.get("sampling") or {}
+        seed = raw.get("seed")
+        return cls(
+            confidence=float(raw.get("confidence", cls.confidence)),
+            mean_tolerance=float(raw.get("mean_tolerance", cls.mean_tolerance)),
+            stress_tolerance=float(raw.get("stress_tolerance", cls.stress_tolerance)),
+            initial_samples=max(64, int(raw.get("initial_samples", cls.initial_samples))),
+            max_fraction=min(1.0, float(raw.get("max_fraction", cls.max_fraction))),
+            strata=max(1, int(raw.get("strata", cls.strata))),
+            seed=None if seed is None else int(seed),
+        )
+
+    def cache_key(self) -> Dict:
+        # Every field changes the estimate (or whether the exact fallback runs).
+        return dataclasses.asdict(self)
+
+
+def estimate_ndvi(
+    red: np.ndarray,
+    nir: np.ndarray,
+    stress_threshold: float,
+    settings: SamplingSettings,
+    histogram_bins: int = 0,
+    epsilon: float = 1e-6,
+) -> NDVIResult:
+    """
+    Stratified-sampling estimate of mean NDVI and stress ratio.
+
+    NDVI is evaluated only at sampled pixels, drawn uniformly within each
+    grid stratum in proportion to its area. After each round the stratified
+    standard errors give normal-approximation intervals at
+    ``settings.confidence``; sampling stops once both half-widths are within
+    tolerance, otherwise the next round is sized from the current variance
+    (half-widths shrink as 1/sqrt(n)). ``sampling["converged"]`` is False when
+    ``max_fraction`` of the frame was drawn first. ``min``/``max`` are sample
+    extremes and the histogram is scaled to frame pixel counts.
+    """
+    if red.shape != nir.shape:
+        raise ValueError(f"Band shape mismatch: red={red.shape} nir={nir.shape}")
+    height, width = red.shape
+    pixels = height * width
+    grid_rows, grid_cols = min(settings.strata, height), min(settings.strata, width)
+    row_edges = np.linspace(0, height, grid_rows + 1).astype(np.intp)
+    col_edges = np.linspace(0, width, grid_cols + 1).astype(np.intp)
+    row_lo, row_hi = np.repeat(row_edges[:-1], grid_cols), np.repeat(row_edges[1:], grid_cols)
+    col_lo, col_hi = np.tile(col_edges[:-1], grid_rows), np.tile(col_edges[1:], grid_rows)
+    sizes = (row_hi - row_lo) * (col_hi - col_lo)
+    weights = sizes / pixels
+    strata = sizes.size
+
+    rng = np.random.default_rng(settings.seed)
+    z = NormalDist().inv_cdf(0.5 + settings.confidence / 2.0)
+    budget = int(settings.max_fraction * pixels)
+    red_flat, nir_flat = red.reshape(-1), nir.reshape(-1)
+    count = np.zeros(strata)
+    total = np.zeros(strata)
+    squares = np.zeros(strata)
+    stressed = np.zeros(strata)
+    bins = max(0, int(histogram_bins))
+    binned = np.zeros(strata * bins) if bins else None
+    minimum, maximum = float("inf"), float("-inf")
+    batch = max(settings.initial_samples, 2 * strata)
+    while True:
+        per_stratum = np.maximum(2, np.rint(batch * weights)).astype(np.intp)
+        stratum = np.repeat(np.arange(strata), per_stratum)
+        rows = rng.integers(row_lo[stratum], row_hi[stratum])
+        cols = rng.integers(col_lo[stratum], col_hi[stratum])
+        flat = rows * width + cols
+        red_s = red_flat[flat].astype(np.float32)
+        nir_s = nir_flat[flat].astype(np.float32)
+        ndvi = np.clip((nir_s - red_s) / (nir_s + red_s + epsilon), -1.0, 1.0)
+
+        count += per_stratum
+        total += np.bincount(stratum, ndvi, strata)
+        squares += np.bincount(stratum, np.square(ndvi, dtype=np.float64), strata)
+        stressed += np.bincount(stratum, ndvi < stress_threshold, strata)
+        minimum, maximum = min(minimum, float(ndvi.min())), max(maximum, float(ndvi.max()))
+        if binned is not None:
+            idx = np.clip(((ndvi + 1.0) * (bins / 2.0)).astype(np.intp), 0, bins - 1)
+            binned += np.bincount(stratum * bins + idx, minlength=strata * bins)
+
+        means = total / count
+        variances = np.maximum(squares / count - means**2, 0.0) * count / (count - 1)
+        # Add-half smoothing keeps strata with no (or only) stressed samples from claiming zero variance.
+        smoothed = (stressed + 0.5) / (count + 1.0)
+        stress_variances = smoothed * (1.0 - smoothed) * count / (count - 1)
+        mean = float(weights @ means)
+        mean_error = z * math.sqrt(float(np.sum(weights**2 * variances / count)))
+        stress_ratio = float(weights @ (stressed / count))
+        stress_error = z * math.sqrt(float(np.sum(weights**2 * stress_variances / count)))
+        drawn = int(count.sum())
+        converged = mean_error <= settings.mean_tolerance and stress_error <= settings.stress_tolerance
+        if converged or drawn >= budget:
+            break
+        shortfall = max(mean_error / settings.mean_tolerance, stress_error / settings.stress_tolerance) ** 2
+        batch = int(min(budget - drawn, max(drawn * (shortfall - 1.0), strata * 2)))
+
+    histogram = None
+    if binned is not None:
+        scaled = binned.reshape(strata, bins) / count[:, None] * sizes[:, None]
+        histogram = np.rint(scaled.sum(axis=0)).astype(np.int64)
     return NDVIResult(
-        ndvi_map=ndvi,
-        mean=float(np.mean(ndvi)),
-        minimum=float(np.min(ndvi)),
-        maximum=float(np.max(ndvi)),
+        ndvi_map=None,
+        mean=mean,
+        minimum=minimum,
+        maximum=maximum,
         stress_ratio=stress_ratio,
+        histogram=histogram,
+        sampling={
+            "mode": "adaptive",
+            "converged": converged,
+            "samples": drawn,
+            "fraction": drawn / pixels,
+            "confidence": settings.confidence,
+            "mean_error": mean_error,
+            "stress_ratio_error": stress_error,
+        },
     )
 
 
-def run_ndvi_pipeline(
+_thread_local = threading.local()
+
+
+def thread_engine(tile_rows: int = DEFAULT_TILE_ROWS, histogram_bins: int = 0) -> IndexEngine:
+    """Return an engine cached on the calling thread so its buffers are reused across captures."""
+    engine: Optional[IndexEngine] = getattr(_thread_local, "engine", None)
+    if engine is None or engine.tile_rows != tile_rows or engine.histogram_bins != histogram_bins:
+        engine = IndexEngine(tile_rows=tile_rows, histogram_bins=histogram_bins)
+        _thread_local.engine = engine
+    return engine
+
+
+def compute_ndvi(rgb: np.ndarray, nir: np.ndarray, epsilon: float = 1e-6) -> np.ndarray:
+    """NDVI = (NIR - Red) / (NIR + Red)."""
+    engine = NDVIEngine(epsilon=epsilon)
+    return engine.run(rgb[:, :, 0], nir, stress_threshold=0.0).ndvi_map
+
+
+def summarize_ndvi(ndvi: np.ndarray, stress_threshold: float) -> NDVIResult:
+    return thread_engine().summarize(ndvi, stress_threshold)
+
+
+def _analyze_bands(
+    engine: IndexEngine,
+    bands: Dict[str, np.ndarray],
+    stress_threshold: float,
+    indices: Sequence[str],
+    index_thresholds: Optional[Dict[str, float]],
+    keep_map: bool,
+    sampling: Optional[SamplingSettings] = None,
+) -> Tuple[NDVIResult, Dict[str, Dict]]:
+    """
+    NDVI result plus summaries of the other requested indices, all from one pass over ``bands``.
+    With ``sampling`` (and no map or extra index needed) NDVI is estimated instead, falling back
+    to the exact pass when the estimate does not converge.
+    """
+    extra = _extra_indices(indices)
+    if sampling is not None and not keep_map and not extra:
+        estimate = estimate_ndvi(
+            bands["red"], bands["nir"], stress_threshold, sampling, engine.histogram_bins, engine.epsilon
+        )
+        if estimate.sampling["converged"]:
+            return estimate, {}
+        exact = engine.run(bands["red"], bands["nir"], stress_threshold, keep_map=False)
+        exact.sampling = {"mode": "exact", "fallback": True, "samples": estimate.sampling["samples"]}
+        return exact, {}
+    if not extra:
+        return engine.run(bands["red"], bands["nir"], stress_threshold, keep_map=keep_map), {}
+    thresholds = dict(index_thresholds or {})
+    thresholds["ndvi"] = stress_threshold
+    for name in extra:
+        thresholds.setdefault(name, stress_threshold)
+    results = engine.run_indices(bands, ["ndvi", *extra], thresholds, keep_maps=("ndvi",) if keep_map else ())
+    return results["ndvi"], {name: results[name].to_summary() for name in extra}
+
+
+def summarize_bands(
+    red: np.ndarray,
+    nir: np.ndarray,
+    stress_threshold: float,
+    tile_rows: int = DEFAULT_TILE_ROWS,
+    histogram_bins: int = 0,
+    preview_max_side: int = 0,
+    return_map: bool = False,
+    indices: Sequence[str] = ("ndvi",),
+    index_thresholds: Optional[Dict[str, float]] = None,
+    sampling: Optional[SamplingSettings] = None,
+    **extra_bands: np.ndarray,
+) -> Dict:
+    """
+    Summary dict from already decoded bands; module-level so process pools can pickle it.
+    With ``return_map`` the NDVI map is attached under ``ndvi_map``; indices other than
+    NDVI (whose bands arrive as keyword arguments, e.g. ``green=``) go under ``indices``.
+    """
+    engine = thread_engine(tile_rows, histogram_bins)
+    bands = dict(extra_bands, red=red, nir=nir)
+    keep_map = preview_max_side > 0 or return_map
+    summary, others = _analyze_bands(engine, bands, stress_threshold, indices, index_thresholds, keep_map, sampling)
+    result = summary.to_summary()
+    if others:
+        result["indices"] = others
+    if preview_max_side > 0:
+        result["preview"] = pack_ndvi_preview(summary.ndvi_map, preview_max_side)
+    if return_map:
+        result["ndvi_map"] = summary.ndvi_map
+    return result
+
+
+def analyze_indices(
     rgb_path: pathlib.Path,
     nir_path: pathlib.Path,
     resize: Tuple[int, int],
     stress_threshold: float,
-) -> Dict:
-    rgb_np, nir_np = camera.load_rgb_and_nir(rgb_path, nir_path, resize)
-    ndvi_map = compute_ndvi(rgb_np, nir_np)
-    summary = summarize_ndvi(ndvi_map, stress_threshold)
+    indices: Sequence[str] = ("ndvi",),
+    index_thresholds: Optional[Dict[str, float]] = None,
+    engine: Optional[IndexEngine] = None,
+    keep_map: bool = False,
+    raw_format: Optional[RawFormat] = None,
+    sampling: Optional[SamplingSettings] = None,
+) -> Tuple[NDVIResult, Dict[str, Dict]]:
+    """NDVI result and summaries of the other ``indices``; each capture is decoded once."""
+    with NDVI_STAGE_MS.time(stage="decode"):
+        if _extra_indices(indices):
+            bands = camera.load_bands(
+                rgb_path, nir_path, index_bands(["ndvi", *indices]), resize, raw_format=raw_format
+            )
+        else:
+            red_np, nir_np = camera.load_red_and_nir(rgb_path, nir_path, resize, raw_format=raw_format)
+            bands = {"red": red_np, "nir": nir_np}
+    engine = engine or thread_engine()
+    with NDVI_STAGE_MS.time(stage="compute"):
+        summary, others = _analyze_bands(
+            engine, bands, stress_threshold, indices, index_thresholds, keep_map, sampling
+        )
     logging.info(
         "NDVI summary mean=%.3f min=%.3f max=%.3f stress=%.1f%%",
         summary.mean,
@@ -55,9 +734,86 @@ def run_ndvi_pipeline(
         summary.maximum,
         summary.stress_ratio * 100,
     )
-    return {
-        "mean": summary.mean,
-        "min": summary.minimum,
-        "max": summary.maximum,
-        "stress_ratio": summary.stress_ratio,
-    }
+    for name, other in others.items():
+        logging.info("%s summary mean=%.3f stress=%.1f%%", name.upper(), other["mean"], other["stress_ratio"] * 100)
+    return summary, others
+
+
+def analyze_capture(
+    rgb_path: pathlib.Path,
+    nir_path: pathlib.Path,
+    resize: Tuple[int, int],
+    stress_threshold: float,
+    engine: Optional[NDVIEngine] = None,
+    keep_map: bool = False,
+    raw_format: Optional[RawFormat] = None,
+) -> NDVIResult:
+    summary, _ = analyze_indices(
+        rgb_path, nir_path, resize, stress_threshold, engine=engine, keep_map=keep_map, raw_format=raw_format
+    )
+    return summary
+
+
+def run_ndvi_pipeline(
+    rgb_path: pathlib.Path,
+    nir_path: pathlib.Path,
+    resize: Tuple[int, int],
+    stress_threshold: float,
+    engine: Optional[IndexEngine] = None,
+    raw_format: Optional[RawFormat] = None,
+    cache: Optional[NDVICache] = None,
+    preview_max_side: int = 0,
+    return_map: bool = False,
+    indices: Sequence[str] = ("ndvi",),
+    index_thresholds: Optional[Dict[str, float]] = None,
+    sampling: Optional[SamplingSettings] = None,
+) -> Dict:
+    """
+    NDVI summary dict for a capture pair; ``return_map`` attaches the map under ``ndvi_map``.
+    Other vegetation ``indices`` (see ``INDEX_KERNELS``) are summarized under ``indices``.
+    ``sampling`` estimates NDVI from pixel samples when no map is needed (see ``estimate_ndvi``).
+    """
+    engine = engine or thread_engine()
+    key = None
+    if cache is not None:
+        params = cache_params(
+            resize,
+            stress_threshold,
+            engine.histogram_bins,
+            raw_format,
+            preview_max_side,
+            indices,
+            index_thresholds,
+            sampling=sampling.cache_key() if sampling is not None else None,
+        )
+        key = cache.key_for(rgb_path, nir_path, params)
+        entry = cache.get(key, need_map=return_map)
+        if entry is not None:
+            logging.info("NDVI cache hit for %s / %s", rgb_path, nir_path)
+            if return_map:
+                entry.summary["ndvi_map"] = entry.ndvi_map
+            return entry.summary
+    # Stored maps are a by-product of exact passes; keeping one for the cache would force adaptive mode exact.
+    keep_map = return_map or preview_max_side > 0 or (cache is not None and cache.store_maps and sampling is None)
+    summary, others = analyze_indices(
+        rgb_path,
+        nir_path,
+        resize,
+        stress_threshold,
+        indices=indices,
+        index_thresholds=index_thresholds,
+        engine=engine,
+        keep_map=keep_map,
+        raw_format=raw_format,
+        sampling=sampling,
+    )
+    result = summary.to_summary()
+    if others:
+        result["indices"] = others
+    if preview_max_side > 0:
+        result["preview"] = pack_ndvi_preview(summary.ndvi_map, preview_max_side)
+    if key is not None:
+        cache.put(key, result, summary.ndvi_map)
+    if return_map:
+        result["ndvi_map"] = summary.ndvi_map
+    return result
@@ -9,6 +9,7 @@ class AutopilotClient:
         self.connection_string = connection_string
         self._vehicle = None
         self._waypoint_listener = None
+        self._attribute_listeners = []
         try:
             from dronekit import connect  # type: ignore
         except Exception as exc:  # pragma: no cover - hardware dependent
@@ -23,23 +24,25 @@ class AutopilotClient:
         if self._vehicle:
             logging.debug("Autopilot connected, listeners can be registered.")
 
+    @staticmethod
+    def _position(vehicle):
+        location = getattr(vehicle, "location", None)
+        if location is None:
+            return None
+        return getattr(location, "global_relative_frame", location)
+
     def read_telemetry(self) -> dict:
         """Return a small telemetry snapshot."""
         if not self._vehicle:
             return {"status": "disconnected"}
         v = self._vehicle
         try:
+            position = self._position(v)  # resolved once for lat/lon/alt
             return {
                 "status": "ok",
-                "lat": getattr(getattr(v, "location", None), "global_relative_frame", getattr(v, "location", None)).lat
-                if getattr(v, "location", None)
-                else None,
-                "lon": getattr(getattr(v, "location", None), "global_relative_frame", getattr(v, "location", None)).lon
-                if getattr(v, "location", None)
-                else None,
-                "alt": getattr(getattr(v, "location", None), "global_relative_frame", getattr(v, "location", None)).alt
-                if getattr(v, "location", None)
-                else None,
+                "lat": getattr(position, "lat", None),
+                "lon": getattr(position, "lon", None),
+                "alt": getattr(position, "alt", None),
                 "groundspeed": getattr(v, "groundspeed", None),
                 "airspeed": getattr(v, "airspeed", None),
                 "battery": getattr(getattr(v, "battery", None), "level", None),
@@ -50,6 +53,42 @@ class AutopilotClient:
             logging.error("Error reading telemetry: %s", exc)
             return {"status": "error", "error": str(exc)}
 
+    @property
+    def connected(self) -> bool:
+        return self._vehicle is not None
+
+    def add_attribute_listener(self, attr_name: str, handler: Callable[[object], None]) -> bool:
+        """
+        Call ``handler(value)`` whenever dronekit updates ``attr_name``
+        (e.g. ``location.global_relative_frame``, ``heading``, ``battery``).
+        Returns True if registration succeeded, False otherwise.
+        """
+        if not self._vehicle:
+            logging.warning("Cannot register %s listener: autopilot not connected.", attr_name)
+            return False
+
+        def _listener(vehicle, name, value):  # pragma: no cover - hardware dependent
+            try:
+                handler(value)
+            except Exception as exc:
+                logging.error("Error in %s listener: %s", name, exc)
+
+        try:
+            self._vehicle.add_attribute_listener(attr_name, _listener)
+            self._attribute_listeners.append((attr_name, _listener))
+            return True
+        except Exception as exc:  # pragma: no cover - hardware dependent
+            logging.error("Failed to register %s listener: %s", attr_name, exc)
+            return False
+
+    def remove_attribute_listeners(self):
+        for attr_name, listener in self._attribute_listeners:
+            try:
+                self._vehicle.remove_attribute_listener(attr_name, listener)
+            except Exception:  # pragma: no cover - hardware dependent
+                pass
+        self._attribute_listeners = []
+
     def close(self):
         if self._vehicle:
             try:
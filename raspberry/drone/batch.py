@@ -0,0 +1,280 @@
+# Offline survey mode: NDVI over every RGB/NIR pair in a capture directory.
+import json
+import logging
+import os
+import pathlib
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..utils.settings import RawFormat
+from .analysis import DEFAULT_TILE_ROWS, SamplingSettings, analyze_indices, index_settings, thread_engine
+from .cache import NDVICache, cache_params
+
+CAPTURE_SUFFIXES = {".jpg", ".jpeg", ".png", ".tif", ".tiff", ".npy", ".raw", ".bin"}
+_RGB_TOKEN = re.compile(r"(?<![a-z0-9])rgb(?![a-z0-9])", re.IGNORECASE)
+_NAME_SEPARATORS = re.compile(r"[/\\_\-.]+")
+
+
+@dataclass(frozen=True)
+class CapturePair:
+    name: str
+    rgb_path: pathlib.Path
+    nir_path: pathlib.Path
+
+
+@dataclass(frozen=True)
+class BatchOptions:
+    analysis_dir: pathlib.Path
+    resize: Tuple[int, int]
+    stress_threshold: float
+    tile_rows: int = DEFAULT_TILE_ROWS
+    histogram_bins: int = 0
+    raw_format: Optional[RawFormat] = None
+    write_maps: bool = True
+    cache_dir: Optional[pathlib.Path] = None
+    cache_max_bytes: int = 0
+    cache_store_maps: bool = False
+    indices: Tuple[str, ...] = ("ndvi",)
+    index_thresholds: Dict[str, float] = field(default_factory=dict)
+    sampling: Optional[SamplingSettings] = None  # drone.ndvi.mode adaptive; only used without maps or extra indices
+
+    @classmethod
+    def from_config(cls, drone_cfg: dict, write_maps: bool = True) -> "BatchOptions":
+        cache_cfg = drone_cfg.get("cache") or {}
+        indices, index_thresholds = index_settings(drone_cfg["ndvi"])
+        sampling = SamplingSettings.from_config(drone_cfg["ndvi"])
+        if sampling is not None and (write_maps or any(name != "ndvi" for name in indices)):
+            logging.warning("drone.ndvi.mode adaptive has no effect while NDVI maps or extra indices are written.")
+        cache_dir = None
+        if cache_cfg.get("enabled", False):
+            cache_dir = pathlib.Path(cache_cfg.get("dir") or pathlib.Path(drone_cfg["analysis_dir"]) / "cache")
+        return cls(
+            analysis_dir=pathlib.Path(drone_cfg["analysis_dir"]),
+            resize=(int(drone_cfg["camera"]["width"]), int(drone_cfg["camera"]["height"])),
+            stress_threshold=float(drone_cfg["ndvi"]["stress_threshold"]),
+            tile_rows=int(drone_cfg["ndvi"].get("tile_rows", DEFAULT_TILE_ROWS)),
+            histogram_bins=int(drone_cfg["ndvi"].get("histogram_bins", 0)),
+            raw_format=RawFormat.from_config(drone_cfg["camera"]),
+            write_maps=write_maps,
+            cache_dir=cache_dir,
+            cache_max_bytes=int(float(cache_cfg.get("max_mb", 256)) * 1024 * 1024),
+            # Written maps must come back from the cache, or every cached re-run decodes again.
+            cache_store_maps=write_maps or bool(cache_cfg.get("store_maps", False)),
+            indices=indices,
+            index_thresholds=index_thresholds,
+            sampling=sampling,
+        )
+
+
+@dataclass
+class BatchReport:
+    processed: int
+    failed: int
+    elapsed_seconds: float
+
+    @property
+    def images_per_second(self) -> float:
+        return self.processed / self.elapsed_seconds if self.elapsed_seconds > 0 else 0.0
+
+
+def _swap_token(match: re.Match) -> str:
+    token = match.group(0)
+    return "NIR" if token.isupper() else "nir"
+
+
+def _find_nir(directory: pathlib.Path, nir_rel: str) -> Optional[pathlib.Path]:
+    candidate = directory / nir_rel
+    if candidate.is_file():
+        return candidate
+    # Same stem, different container (e.g. rgb.jpg + nir.png or nir.npy).
+    for suffix in sorted(CAPTURE_SUFFIXES):
+        alt = candidate.with_suffix(suffix)
+        if alt.is_file():
+            return alt
+    return None
+
+
+def discover_pairs(directory: pathlib.Path) -> List[CapturePair]:
+    """
+    Find RGB/NIR pairs under ``directory``. A capture pairs with the file whose
+    relative path has its ``rgb`` token replaced by ``nir``, e.g.
+    ``0001_rgb.jpg``/``0001_nir.jpg`` or ``rgb/0001.jpg``/``nir/0001.jpg``.
+    """
+    directory = pathlib.Path(directory)
+    pairs: List[CapturePair] = []
+    for path in sorted(directory.rglob("*")):
+        if path.suffix.lower() not in CAPTURE_SUFFIXES or not path.is_file():
+            continue
+        rel = path.relative_to(directory).as_posix()
+        if not _RGB_TOKEN.search(rel):
+            continue
+        nir_path = _find_nir(directory, _RGB_TOKEN.sub(_swap_token, rel))
+        if nir_path is None:
+            logging.warning("No NIR capture found for %s; skipping.", path)
+            continue
+        stem = rel[: -len(path.suffix)] if path.suffix else rel
+        name = _NAME_SEPARATORS.sub("_", _RGB_TOKEN.sub("", stem)).strip("_") or "capture"
+        pairs.append(CapturePair(name=name, rgb_path=path, nir_path=nir_path))
+    return pairs
+
+
+_worker_options: Optional[BatchOptions] = None
+_worker_cache: Optional[NDVICache] = None
+
+
+def _init_worker(options: BatchOptions):
+    global _worker_options, _worker_cache
+    _worker_options = options
+    options.analysis_dir.mkdir(parents=True, exist_ok=True)
+    if options.cache_dir is not None:
+        # float32 maps, so a cached run writes the same <name>_ndvi.npy as an uncached one.
+        _worker_cache = NDVICache(
+            options.cache_dir,
+            options.cache_max_bytes,
+            options.cache_store_maps,
+            map_dtype=np.float32 if options.write_maps else np.float16,
+            sweep=False,  # the parent swept before starting the pool; siblings may be mid-write
+        )
+
+
+def _open_cache(options: BatchOptions) -> Optional[NDVICache]:
+    if options.cache_dir is None:
+        return None
+    return NDVICache(options.cache_dir, options.cache_max_bytes, options.cache_store_maps)
+
+
+def _previous_key(path: pathlib.Path) -> Optional[str]:
+    """Cache key recorded in the ``<name>.json`` of an earlier run, if any."""
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f).get("cache_key")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def process_pair(pair: CapturePair, options: BatchOptions, cache: Optional[NDVICache] = None) -> Dict:
+    """Compute NDVI for one pair and write `<name>.json` (and `<name>_ndvi.npy`) into analysis_dir."""
+    started = time.perf_counter()
+    record_path = options.analysis_dir / f"{pair.name}.json"
+    map_path = options.analysis_dir / f"{pair.name}_ndvi.npy"
+    key = entry = None
+    keep_written_map = False
+    if cache is not None:
+        params = cache_params(
+            options.resize,
+            options.stress_threshold,
+            options.histogram_bins,
+            options.raw_format,
+            indices=options.indices,
+            index_thresholds=options.index_thresholds,
+            sampling=options.sampling.cache_key() if options.sampling is not None else None,
+        )
+        key = cache.key_for(pair.rgb_path, pair.nir_path, params)
+        # The map an earlier run wrote for this exact key is still valid; only the summary is needed then.
+        keep_written_map = options.write_maps and map_path.exists() and _previous_key(record_path) == key
+        entry = cache.get(key, need_map=options.write_maps and not keep_written_map)
+        keep_written_map = keep_written_map and entry is not None
+    if entry is not None:
+        summary, ndvi_map = entry.summary, entry.ndvi_map
+    else:
+        result, others = analyze_indices(
+            pair.rgb_path,
+            pair.nir_path,
+            options.resize,
+            options.stress_threshold,
+            indices=options.indices,
+            index_thresholds=options.index_thresholds,
+            engine=thread_engine(options.tile_rows, options.histogram_bins),
+            keep_map=options.write_maps or (cache is not None and cache.store_maps and options.sampling is None),
+            raw_format=options.raw_format,
+            sampling=options.sampling,
+        )
+        summary, ndvi_map = result.to_summary(), result.ndvi_map
+        if others:
+            summary["indices"] = others
+        if key is not None:
+            cache.put(key, summary, ndvi_map)
+    record = {
+        "capture": pair.name,
+        "rgb": str(pair.rgb_path),
+        "nir": str(pair.nir_path),
+        "ndvi": summary,
+        "cached": entry is not None,
+    }
+    if key is not None:
+        record["cache_key"] = key
+    if options.write_maps:
+        if not keep_written_map:
+            np.save(map_path, ndvi_map)
+        record["ndvi_map"] = str(map_path)
+    record["elapsed_ms"] = (time.perf_counter() - started) * 1000.0
+    with record_path.open("w", encoding="utf-8") as f:
+        json.dump(record, f)
+    return record
+
+
+def _process_chunk(chunk: Sequence[CapturePair]) -> List[Dict]:
+    records = []
+    for pair in chunk:
+        try:
+            records.append(process_pair(pair, _worker_options, _worker_cache))
+        except Exception as exc:
+            logging.error("NDVI failed for %s: %s", pair.name, exc)
+            records.append(
+                {"capture": pair.name, "rgb": str(pair.rgb_path), "nir": str(pair.nir_path), "error": str(exc)}
+            )
+    return records
+
+
+def _chunks(pairs: Sequence[CapturePair], size: int) -> Iterator[Sequence[CapturePair]]:
+    for start in range(0, len(pairs), size):
+        yield pairs[start : start + size]
+
+
+def run_batch(
+    pairs: Sequence[CapturePair],
+    options: BatchOptions,
+    workers: Optional[int] = None,
+    chunksize: int = 4,
+    ordered: bool = True,
+    on_result: Optional[Callable[[Dict], None]] = None,
+) -> BatchReport:
+    """
+    Process pairs on a process pool in chunks of ``chunksize``. Results reach
+    ``on_result`` in input order when ``ordered``, otherwise as chunks finish.
+
+    Every worker opens its own view of the result cache and evicts against
+    ``cache_max_bytes`` alone, so during a run the cache can grow to about
+    ``workers`` times the cap and workers do not see each other's new
+    entries. The parent trims it back to the cap once the pool is done.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, chunksize)
+    processed = failed = 0
+    started = time.perf_counter()
+    _open_cache(options)  # sweeps partial writes before any worker starts writing
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(options,)) as pool:
+        chunks = list(_chunks(pairs, chunksize))
+        if ordered:
+            results = pool.map(_process_chunk, chunks)
+        else:
+            results = (future.result() for future in as_completed([pool.submit(_process_chunk, c) for c in chunks]))
+        for records in results:
+            for record in records:
+                if "error" in record:
+                    failed += 1
+                else:
+                    processed += 1
+                if on_result:
+                    on_result(record)
+    cache = _open_cache(options)
+    if cache is not None:
+        evicted = cache.trim()
+        if evicted:
+            logging.info("Evicted %d NDVI cache entries to stay within %d bytes", evicted, cache.max_bytes)
+    return BatchReport(processed=processed, failed=failed, elapsed_seconds=time.perf_counter() - started)
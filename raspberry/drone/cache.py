@@ -0,0 +1,267 @@
+# On-disk NDVI result cache keyed by capture content and analysis parameters.
+import base64
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..utils import metrics
+from ..utils.settings import RawFormat
+
+_LOOKUPS = metrics.counter("ndvi_cache_lookups_total", "NDVI cache lookups by result (hit or miss).")
+
+_SAMPLE_BYTES = 64 * 1024
+
+
+@dataclass
+class CacheEntry:
+    summary: Dict
+    ndvi_map: Optional[np.ndarray] = None
+
+
+def cache_params(
+    resize: Optional[Tuple[int, int]],
+    stress_threshold: float,
+    histogram_bins: int = 0,
+    raw_format: Optional[RawFormat] = None,
+    preview_max_side: int = 0,
+    indices: Sequence[str] = (),
+    index_thresholds: Optional[Dict[str, float]] = None,
+    sampling: Optional[Dict] = None,
+) -> Dict:
+    """Parameters that change the NDVI result and therefore belong in the cache key."""
+    params = {
+        "resize": list(resize) if resize else None,
+        "stress_threshold": float(stress_threshold),
+        "histogram_bins": int(histogram_bins),
+        "raw_shape": [raw_format.height, raw_format.width, raw_format.dtype] if raw_format else None,
+        "preview_max_side": int(preview_max_side),
+    }
+    extra = [name for name in indices if name != "ndvi"]
+    if extra:
+        # Only present with extra indices, so NDVI-only keys from earlier runs stay valid.
+        params["indices"] = extra
+        params["index_thresholds"] = {name: float(v) for name, v in sorted((index_thresholds or {}).items())}
+    if sampling:
+        params["sampling"] = sampling  # estimates and exact results are cached apart
+    return params
+
+
+def _encode_bytes(value):
+    # Packed previews are bytes; keep them round-trippable through the JSON sidecar.
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(bytes(value)).decode("ascii")}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode_bytes(obj: Dict):
+    if len(obj) == 1 and "__bytes__" in obj:
+        return base64.b64decode(obj["__bytes__"])
+    return obj
+
+
+class NDVICache:
+    """
+    LRU cache of NDVI summaries (and optionally compressed maps) on disk.
+
+    Keys combine each capture's size, mtime and a sampled content hash with
+    the analysis parameters. Content hashes are memoized per (path, size,
+    mtime) so an unchanged file is only stat'ed on a repeat lookup. Entries
+    are evicted least-recently-used first once their total size exceeds
+    ``max_bytes``. Temporary files left by interrupted writes, and maps
+    without a summary, are deleted when the cache opens. Maps are stored as
+    ``map_dtype``: float16 by default (NDVI rounded to about 3 decimals),
+    float32 where a cached map must match a fresh one exactly.
+
+    Each instance tracks its own total, so processes sharing a directory
+    (``drone-batch`` workers) each evict against ``max_bytes``; the cap
+    holds across runs once one instance re-opens the directory and ``trim``s.
+    Such instances should pass ``sweep=False`` so they leave each other's
+    in-flight writes alone.
+    """
+
+    def __init__(
+        self,
+        directory: pathlib.Path,
+        max_bytes: int = 256 * 1024 * 1024,
+        store_maps: bool = False,
+        map_dtype=np.float16,
+        sweep: bool = True,
+    ):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_bytes)
+        self.store_maps = store_maps
+        self.map_dtype = np.dtype(map_dtype)
+        self._lock = threading.Lock()
+        self._digests: Dict[str, Tuple[int, int, str]] = {}
+        self._index: Dict[str, Tuple[int, float]] = {}  # key -> (bytes, last access)
+        self._total = 0
+        if sweep:
+            self._sweep_partial()
+        for meta in self.directory.glob("*.json"):
+            key = meta.stem
+            try:
+                size = self._entry_size(key)
+                self._index[key] = (size, meta.stat().st_mtime)
+                self._total += size
+            except FileNotFoundError:
+                continue
+        if sweep:
+            for blob in self.directory.glob("*.npz"):
+                if blob.stem not in self._index:
+                    self._unlink(blob)
+
+    def _sweep_partial(self):
+        # ``put`` writes <key>.tmp and <key>.tmp.npz before renaming them into place.
+        swept = 0
+        for pattern in ("*.tmp", "*.tmp.npz"):
+            for path in self.directory.glob(pattern):
+                swept += self._unlink(path)
+        if swept:
+            logging.info("Removed %d partial NDVI cache file(s) from %s", swept, self.directory)
+
+    @staticmethod
+    def _unlink(path: pathlib.Path) -> int:
+        try:
+            path.unlink()
+            return 1
+        except FileNotFoundError:
+            return 0
+
+    @classmethod
+    def from_config(cls, drone_cfg: dict) -> Optional["NDVICache"]:
+        cache_cfg = drone_cfg.get("cache") or {}
+        if not cache_cfg.get("enabled", False):
+            return None
+        directory = cache_cfg.get("dir") or pathlib.Path(drone_cfg["analysis_dir"]) / "cache"
+        return cls(
+            pathlib.Path(directory),
+            max_bytes=int(float(cache_cfg.get("max_mb", 256)) * 1024 * 1024),
+            store_maps=bool(cache_cfg.get("store_maps", False)),
+        )
+
+    def _paths(self, key: str) -> Tuple[pathlib.Path, pathlib.Path]:
+        return self.directory / f"{key}.json", self.directory / f"{key}.npz"
+
+    def _entry_size(self, key: str) -> int:
+        meta, blob = self._paths(key)
+        size = meta.stat().st_size
+        if blob.exists():
+            size += blob.stat().st_size
+        return size
+
+    def _digest(self, path: pathlib.Path) -> str:
+        stat = path.stat()
+        memo = self._digests.get(str(path))
+        if memo and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+            return memo[2]
+        hasher = hashlib.blake2b(digest_size=16)
+        hasher.update(str(stat.st_size).encode())
+        with path.open("rb") as f:
+            # Head, middle and tail samples: cheap, and catches rewritten captures of equal size.
+            for offset in (0, max(0, stat.st_size // 2 - _SAMPLE_BYTES // 2), max(0, stat.st_size - _SAMPLE_BYTES)):
+                f.seek(offset)
+                hasher.update(f.read(_SAMPLE_BYTES))
+        digest = f"{stat.st_size}-{stat.st_mtime_ns}-{hasher.hexdigest()}"
+        self._digests[str(path)] = (stat.st_size, stat.st_mtime_ns, digest)
+        return digest
+
+    def key_for(self, rgb_path: pathlib.Path, nir_path: pathlib.Path, params: Dict) -> str:
+        material = json.dumps(
+            {
+                "rgb": self._digest(pathlib.Path(rgb_path)),
+                "nir": self._digest(pathlib.Path(nir_path)),
+                "params": params,
+            },
+            sort_keys=True,
+        )
+        return hashlib.blake2b(material.encode(), digest_size=20).hexdigest()
+
+    def get(self, key: str, need_map: bool = False) -> Optional[CacheEntry]:
+        entry = self._read(key, need_map)
+        _LOOKUPS.inc(result="miss" if entry is None else "hit")
+        return entry
+
+    def _read(self, key: str, need_map: bool) -> Optional[CacheEntry]:
+        meta, blob = self._paths(key)
+        with self._lock:
+            if key not in self._index:
+                return None
+        try:
+            with meta.open("r", encoding="utf-8") as f:
+                summary = json.load(f, object_hook=_decode_bytes)
+            ndvi_map = None
+            if need_map:
+                if not blob.exists():
+                    return None
+                with np.load(blob) as data:
+                    ndvi_map = data["ndvi"].astype(np.float32)
+            os.utime(meta)
+        except (OSError, ValueError, KeyError) as exc:
+            logging.warning("Dropping unreadable NDVI cache entry %s: %s", key, exc)
+            self._remove(key)
+            return None
+        with self._lock:
+            if key in self._index:
+                self._index[key] = (self._index[key][0], meta.stat().st_mtime)
+        return CacheEntry(summary=summary, ndvi_map=ndvi_map)
+
+    def put(self, key: str, summary: Dict, ndvi_map: Optional[np.ndarray] = None):
+        meta, blob = self._paths(key)
+        if self.store_maps and ndvi_map is not None:
+            tmp_blob = blob.with_name(f"{blob.stem}.tmp.npz")
+            np.savez_compressed(tmp_blob, ndvi=ndvi_map.astype(self.map_dtype))
+            os.replace(tmp_blob, blob)
+        tmp_meta = meta.with_suffix(".tmp")
+        with tmp_meta.open("w", encoding="utf-8") as f:
+            json.dump(summary, f, default=_encode_bytes)
+        os.replace(tmp_meta, meta)
+        size = self._entry_size(key)
+        with self._lock:
+            previous = self._index.get(key)
+            if previous:
+                self._total -= previous[0]
+            self._index[key] = (size, meta.stat().st_mtime)
+            self._total += size
+            victims = self._select_victims()
+        for victim in victims:
+            self._remove(victim)
+
+    def trim(self) -> int:
+        """Evict least-recently-used entries until the directory fits ``max_bytes``; returns how many."""
+        with self._lock:
+            victims = self._select_victims()
+        for victim in victims:
+            self._remove(victim)
+        return len(victims)
+
+    def _select_victims(self):
+        victims = []
+        if self._total <= self.max_bytes:
+            return victims
+        for key, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._total <= self.max_bytes:
+                break
+            victims.append(key)
+            self._total -= size
+            del self._index[key]
+        return victims
+
+    def _remove(self, key: str):
+        with self._lock:
+            entry = self._index.pop(key, None)
+            if entry:
+                self._total -= entry[0]
+        for path in self._paths(key):
+            self._unlink(path)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
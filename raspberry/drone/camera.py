@@ -1,23 +1,161 @@
 import logging
 import pathlib
-from typing import Tuple
+import re
+from typing import Dict, Iterable, Optional, Sequence, Tuple
 
 import numpy as np
 from PIL import Image
 
+from ..utils.settings import RawFormat
 
-def _load_band(path: pathlib.Path, resize: Tuple[int, int]) -> np.ndarray:
-    img = Image.open(path).convert("L").resize(resize)
-    return np.asarray(img, dtype=np.float32)
+# Band dumps written by the capture process are read through np.memmap instead of decoded.
+ARRAY_SUFFIXES = {".npy", ".raw", ".bin"}
+RESAMPLE = Image.Resampling.BILINEAR
 
+# Band name -> (capture it comes from, RGB channel). Red-edge is a separate capture named like the NIR one.
+BAND_SOURCES: Dict[str, Tuple[str, Optional[str]]] = {
+    "red": ("rgb", "R"),
+    "green": ("rgb", "G"),
+    "blue": ("rgb", "B"),
+    "nir": ("nir", None),
+    "rededge": ("rededge", None),
+}
+_NIR_TOKEN = re.compile(r"(?<![a-z0-9])nir(?![a-z0-9])", re.IGNORECASE)
 
-def load_rgb_and_nir(
-    rgb_path: pathlib.Path, nir_path: pathlib.Path, resize: Tuple[int, int]
+
+def _resize_image(img: Image.Image, resize: Optional[Tuple[int, int]]) -> Image.Image:
+    if resize and img.size != tuple(resize):
+        img = img.resize(tuple(resize), RESAMPLE, reducing_gap=2.0)
+    return img
+
+
+def _open_image(path: pathlib.Path, mode: str, resize: Optional[Tuple[int, int]]) -> Image.Image:
+    img = Image.open(path)
+    if resize and img.format == "JPEG":
+        # Let libjpeg decode at the smallest DCT scale that still covers the target size.
+        img.draft(mode, tuple(resize))
+    return img
+
+
+def _load_array_band(
+    path: pathlib.Path,
+    resize: Optional[Tuple[int, int]],
+    channel: Optional[int],
+    raw_format: Optional[RawFormat],
+) -> np.ndarray:
+    """One band of an array dump; ``channel`` indexes an RGB dump, None reads a single-band one."""
+    if path.suffix.lower() == ".npy":
+        arr = np.load(path, mmap_mode="r")
+    else:
+        if raw_format is None:
+            raise ValueError(f"Raw band {path} needs camera.raw_shape to be configured")
+        shape = raw_format.shape(1 if channel is None else 3)
+        expected = int(np.prod(shape)) * np.dtype(raw_format.dtype).itemsize
+        size = path.stat().st_size
+        if size != expected:
+            raise ValueError(
+                f"Raw band {path} is {size} bytes; camera.raw_shape/raw_dtype {shape} {raw_format.dtype} "
+                f"expects {expected}"
+            )
+        arr = np.memmap(path, dtype=raw_format.dtype, mode="r", shape=shape)
+    if arr.ndim == 3:
+        arr = arr[:, :, channel or 0]
+    if resize and (arr.shape[1], arr.shape[0]) != tuple(resize):
+        img = Image.fromarray(np.ascontiguousarray(arr))
+        arr = np.asarray(_resize_image(img, resize))
+    return arr
+
+
+def load_band(
+    path: pathlib.Path,
+    resize: Optional[Tuple[int, int]],
+    channel: Optional[str] = None,
+    raw_format: Optional[RawFormat] = None,
+) -> np.ndarray:
+    """
+    Load a single band as a 2-D array in its native dtype (uint8 for images).
+
+    ``channel`` picks one RGB channel ("R", "G" or "B"); None reads luminance.
+    Raises FileNotFoundError if missing.
+    """
+    path = pathlib.Path(path)
+    if path.suffix.lower() in ARRAY_SUFFIXES:
+        index = "RGB".index(channel) if channel else None
+        return _load_array_band(path, resize, index, raw_format)
+    img = _open_image(path, "RGB" if channel else "L", resize)
+    if channel:
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img = img.getchannel(channel)
+    elif img.mode != "L":
+        img = img.convert("L")
+    return np.asarray(_resize_image(img, resize))
+
+
+def load_red_and_nir(
+    rgb_path: pathlib.Path,
+    nir_path: pathlib.Path,
+    resize: Optional[Tuple[int, int]],
+    raw_format: Optional[RawFormat] = None,
 ) -> Tuple[np.ndarray, np.ndarray]:
-    """Load the RGB and NIR images. Raises FileNotFoundError if missing."""
+    """Load the red channel of the RGB capture and the NIR band. Raises FileNotFoundError if missing."""
     logging.info("Loading RGB from %s", rgb_path)
     logging.info("Loading NIR from %s", nir_path)
-    rgb = Image.open(rgb_path).convert("RGB").resize(resize)
-    rgb_np = np.asarray(rgb, dtype=np.float32)
-    nir_np = _load_band(nir_path, resize)
-    return rgb_np, nir_np
+    red = load_band(rgb_path, resize, channel="R", raw_format=raw_format)
+    nir = load_band(nir_path, resize, raw_format=raw_format)
+    return red, nir
+
+
+def sibling_band_path(nir_path: pathlib.Path, band: str) -> pathlib.Path:
+    """Path of another single-band capture named like the NIR one, e.g. ``0001_nir.png`` -> ``0001_rededge.png``."""
+    nir_path = pathlib.Path(nir_path)
+    name, count = _NIR_TOKEN.subn(lambda m: band.upper() if m.group(0).isupper() else band, nir_path.name)
+    if not count:
+        raise FileNotFoundError(f"Cannot derive the {band} capture from {nir_path} (no 'nir' token in its name)")
+    return nir_path.with_name(name)
+
+
+def band_path(rgb_path: pathlib.Path, nir_path: pathlib.Path, band: str) -> pathlib.Path:
+    source = BAND_SOURCES[band][0]
+    if source == "rgb":
+        return pathlib.Path(rgb_path)
+    if source == "nir":
+        return pathlib.Path(nir_path)
+    return sibling_band_path(nir_path, source)
+
+
+def load_channels(
+    path: pathlib.Path,
+    resize: Optional[Tuple[int, int]],
+    channels: Sequence[str],
+    raw_format: Optional[RawFormat] = None,
+) -> Dict[str, np.ndarray]:
+    """Several RGB channels from one capture, decoding the image only once."""
+    path = pathlib.Path(path)
+    if path.suffix.lower() in ARRAY_SUFFIXES:
+        return {c: _load_array_band(path, resize, "RGB".index(c), raw_format) for c in channels}
+    img = _open_image(path, "RGB", resize)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return {c: np.asarray(_resize_image(img.getchannel(c), resize)) for c in channels}
+
+
+def load_bands(
+    rgb_path: pathlib.Path,
+    nir_path: pathlib.Path,
+    bands: Iterable[str],
+    resize: Optional[Tuple[int, int]],
+    raw_format: Optional[RawFormat] = None,
+) -> Dict[str, np.ndarray]:
+    """Load each requested band (see ``BAND_SOURCES``) once. Raises FileNotFoundError if a capture is missing."""
+    bands = list(bands)
+    rgb_bands = [band for band in bands if BAND_SOURCES[band][0] == "rgb"]
+    loaded: Dict[str, np.ndarray] = {}
+    if rgb_bands:
+        channels = load_channels(rgb_path, resize, [BAND_SOURCES[b][1] for b in rgb_bands], raw_format=raw_format)
+        loaded.update({band: channels[BAND_SOURCES[band][1]] for band in rgb_bands})
+    for band in bands:
+        if band not in loaded:
+            loaded[band] = load_band(band_path(rgb_path, nir_path, band), resize, raw_format=raw_format)
+    logging.info("Loaded bands %s from %s / %s", ",".join(bands), rgb_path, nir_path)
+    return loaded
@@ -0,0 +1,211 @@
+# Several drones from one process: per-drone MQTT identity and topics, NDVI compute sharded over shared processes.
+import copy
+import logging
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from ..utils import metrics
+from ..utils.mqtt_client import MQTTClient
+from .autopilot import AutopilotClient
+from .pipeline import CapturePipeline
+from .service import DroneService
+
+# Drone-side topics that get a per-drone namespace; irrigation topics stay shared.
+DRONE_TOPICS = ("telemetry", "analysis", "parcel_analysis")
+
+_RATE = metrics.gauge("fleet_captures_per_minute", "Published NDVI captures per minute, by drone.")
+
+
+@dataclass
+class DroneSpec:
+    drone_id: str
+    autopilot_connection: str
+    field_name: str = ""
+    overrides: Dict = field(default_factory=dict)  # merged over the `drone` config section
+
+
+@dataclass
+class FleetSettings:
+    drones: List[DroneSpec]
+    shards: int = 2
+    topic_template: str = "{topic}/{drone_id}"
+    stats_interval_seconds: float = 60.0
+
+    @classmethod
+    def from_config(cls, raw: Optional[dict]) -> "FleetSettings":
+        raw = raw or {}
+        drones: List[DroneSpec] = []
+        for entry in raw.get("drones") or []:
+            entry = dict(entry)
+            drone_id = str(entry.pop("id"))
+            if any(spec.drone_id == drone_id for spec in drones):
+                raise ValueError(f"Duplicate fleet drone id {drone_id!r}")
+            drones.append(
+                DroneSpec(
+                    drone_id=drone_id,
+                    autopilot_connection=str(entry.pop("autopilot_connection")),
+                    field_name=str(entry.pop("field", "")),
+                    overrides=entry,
+                )
+            )
+        return cls(
+            drones=drones,
+            shards=max(1, int(raw.get("shards", cls.shards))),
+            topic_template=str(raw.get("topic_template", cls.topic_template)),
+            stats_interval_seconds=float(raw.get("stats_interval_seconds", cls.stats_interval_seconds)),
+        )
+
+
+def _merge(base: dict, overrides: dict) -> dict:
+    merged = dict(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def drone_config(cfg: dict, spec: DroneSpec, topic_template: str) -> dict:
+    """Full config for one fleet member: its `drone` overrides, autopilot, mosaic field and namespaced topics."""
+    member = copy.deepcopy(cfg)
+    member["drone"] = _merge(member["drone"], spec.overrides)
+    member["drone"]["autopilot_connection"] = spec.autopilot_connection
+    if spec.field_name and member["drone"].get("mosaic"):
+        member["drone"]["mosaic"]["field"] = spec.field_name
+    topics = member["mqtt"]["topics"]
+    for key in DRONE_TOPICS:
+        if key in topics:
+            topics[key] = topic_template.format(
+                topic=topics[key], drone_id=spec.drone_id, field=spec.field_name or "default"
+            )
+    return member
+
+
+@dataclass
+class FleetMember:
+    spec: DroneSpec
+    mqtt: MQTTClient
+    service: DroneService
+    shard: int
+    pipeline: Optional[CapturePipeline] = None
+    completed_at_last_report: int = 0
+
+
+class Fleet:
+    """
+    Serves N drones from one process.
+
+    Each drone gets its own MQTT connection (client id suffixed with the
+    drone id, so spools and sessions never collide), its own topic namespace
+    and its own waypoint pipeline for decode and publish. NDVI compute goes to
+    ``shards`` single-process pools shared by the whole fleet; a drone's jobs
+    always land on the shard picked by its field (or id), which keeps that
+    process's engine buffers and parcel label images warm for the field and
+    stops one busy drone from starving drones on other shards. ``process``
+    publishes per-drone throughput every ``stats_interval_seconds``.
+    """
+
+    def __init__(self, cfg: dict, settings: FleetSettings, build_mqtt: Callable[[dict, str], MQTTClient]):
+        if not settings.drones:
+            raise ValueError("fleet.drones is empty")
+        self.cfg = cfg
+        self.settings = settings
+        self.build_mqtt = build_mqtt
+        self.members: List[FleetMember] = []
+        self._pools: List[ProcessPoolExecutor] = []
+        self.status_mqtt: Optional[MQTTClient] = None
+        self._next_report = time.monotonic() + settings.stats_interval_seconds
+        self._last_report = time.monotonic()
+
+    def shard_for(self, spec: DroneSpec) -> int:
+        # crc32 rather than hash(): stable across restarts, like the MQTT dispatcher's topic pinning.
+        return zlib.crc32((spec.field_name or spec.drone_id).encode("utf-8")) % self.settings.shards
+
+    def start(self):
+        self._pools = [ProcessPoolExecutor(max_workers=1) for _ in range(self.settings.shards)]
+        specs = self.settings.drones
+        # Each dronekit connect may take its full 10 s timeout, so connect to every autopilot at once.
+        with ThreadPoolExecutor(max_workers=len(specs), thread_name_prefix="fleet-connect") as executor:
+            autopilots = list(executor.map(lambda spec: AutopilotClient(spec.autopilot_connection), specs))
+        mosaics = {}
+        for spec, autopilot in zip(specs, autopilots):
+            member_cfg = drone_config(self.cfg, spec, self.settings.topic_template)
+            mqtt_client = self.build_mqtt(member_cfg, f"drone-{spec.drone_id}")
+            mqtt_client.loop_start()
+            identity = {"id": spec.drone_id, "field": spec.field_name} if spec.field_name else {"id": spec.drone_id}
+            service = DroneService(member_cfg, mqtt_client, autopilot, identity=identity)
+            if service.mosaic is not None:
+                # Drones over the same field write one mosaic (it is thread-safe), never two copies of its files.
+                service.mosaic = mosaics.setdefault(service.mosaic.settings.directory, service.mosaic)
+            member = FleetMember(spec, mqtt_client, service, self.shard_for(spec))
+            member.pipeline = service.start_waypoint_pipeline(compute_pool=self._pools[member.shard])
+            self.members.append(member)
+            logging.info(
+                "Fleet drone %s (field=%s) on shard %d, topics under %s",
+                spec.drone_id,
+                spec.field_name or "-",
+                member.shard,
+                member_cfg["mqtt"]["topics"]["analysis"],
+            )
+        self.status_mqtt = self.build_mqtt(self.cfg, "fleet")
+        self.status_mqtt.loop_start()
+
+    def stats(self, elapsed: Optional[float] = None) -> Dict[str, Dict]:
+        report = {}
+        for member in self.members:
+            entry = {
+                "field": member.spec.field_name or None,
+                "shard": member.shard,
+                "connected": member.service.autopilot.connected,
+            }
+            if member.pipeline is not None:
+                stats = member.pipeline.stats()
+                completed = stats["counters"]["completed"]
+                entry.update(stats["counters"], queue_depth=stats["queue_depth"])
+                entry["compute_avg_ms"] = stats["stages"]["compute"]["avg_ms"]
+                if elapsed:
+                    rate = (completed - member.completed_at_last_report) * 60.0 / elapsed
+                    entry["captures_per_minute"] = rate
+                    _RATE.set(rate, drone=member.spec.drone_id)
+                    member.completed_at_last_report = completed
+            report[member.spec.drone_id] = entry
+        return report
+
+    def publish_stats(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        drones = self.stats(elapsed=max(1e-6, now - self._last_report))
+        self._last_report = now
+        payload = {"timestamp": datetime.now(timezone.utc).isoformat(), "drones": drones}
+        topic = self.cfg["mqtt"]["topics"].get("fleet_status", "agriculture/fleet/status")
+        if self.status_mqtt is not None:
+            self.status_mqtt.publish(topic, payload)
+        logging.info(
+            "Fleet throughput: %s",
+            ", ".join(f"{d}={s.get('captures_per_minute', 0.0):.1f}/min" for d, s in drones.items()),
+        )
+
+    def process(self, now: Optional[float] = None) -> float:
+        """Publish per-drone throughput when due; return the next due time."""
+        now = time.monotonic() if now is None else now
+        if now >= self._next_report:
+            self.publish_stats(now)
+            self._next_report = now + self.settings.stats_interval_seconds
+        return self._next_report
+
+    def stop(self):
+        for member in self.members:
+            # Closing a shared mosaic again is a no-op, so fields flown by several drones are flushed once.
+            if member.pipeline is not None:
+                member.service.stop_waypoint_pipeline(member.pipeline)
+        self.publish_stats()
+        for pool in self._pools:
+            pool.shutdown(wait=True)
+        for client in [member.mqtt for member in self.members] + [self.status_mqtt]:
+            if client is not None:
+                client.flush()
+                client.disconnect()
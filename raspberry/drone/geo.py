@@ -0,0 +1,41 @@
+# Small geodesy helpers for field-scale work (a few km): local equirectangular projection.
+import math
+from typing import Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def project(lat, lon, origin: Tuple[float, float]):
+    """Lat/lon (degrees, scalars or arrays) to east/north metres relative to ``origin``."""
+    lat0, lon0 = origin
+    east = np.radians(np.asarray(lon, dtype=np.float64) - lon0) * EARTH_RADIUS_M * math.cos(math.radians(lat0))
+    north = np.radians(np.asarray(lat, dtype=np.float64) - lat0) * EARTH_RADIUS_M
+    return east, north
+
+
+def unproject(east, north, origin: Tuple[float, float]):
+    """Inverse of ``project``."""
+    lat0, lon0 = origin
+    lat = lat0 + np.degrees(np.asarray(north, dtype=np.float64) / EARTH_RADIUS_M)
+    lon = lon0 + np.degrees(np.asarray(east, dtype=np.float64) / (EARTH_RADIUS_M * math.cos(math.radians(lat0))))
+    return lat, lon
+
+
+def points_in_polygon(x: np.ndarray, y: np.ndarray, polygon: Sequence[Sequence[float]]) -> np.ndarray:
+    """Even-odd rule, vectorized over points (loops over polygon edges only)."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    inside = np.zeros(np.broadcast(x, y).shape, dtype=bool)
+    vertices = np.asarray(polygon, dtype=np.float64)
+    count = len(vertices)
+    for idx in range(count):
+        x1, y1 = vertices[idx]
+        x2, y2 = vertices[(idx + 1) % count]
+        if y1 == y2:
+            continue
+        crosses = (y1 > y) != (y2 > y)
+        x_at_y = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+        inside ^= crosses & (x < x_at_y)
+    return inside
@@ -0,0 +1,358 @@
+# Geo-referenced NDVI mosaic: per-field grid of memory-mapped tiles plus a capture index.
+import collections
+import json
+import logging
+import math
+import pathlib
+import threading
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .geo import points_in_polygon, project, unproject
+
+TileKey = Tuple[int, int]
+BBox = Tuple[float, float, float, float]  # (min_east, min_north, max_east, max_north) in metres
+
+
+@dataclass
+class MosaicSettings:
+    directory: pathlib.Path
+    origin: Tuple[float, float]  # field reference (lat, lon)
+    resolution_m: float = 0.05
+    tile_size: int = 256
+    hfov_deg: float = 62.2
+    vfov_deg: float = 48.8
+    max_open_tiles: int = 64
+    parcels: Dict[str, List[Tuple[float, float]]] = field(default_factory=dict)  # id -> [(lat, lon), ...]
+
+    @classmethod
+    def from_config(cls, drone_cfg: dict) -> Optional["MosaicSettings"]:
+        mosaic_cfg = drone_cfg.get("mosaic") or {}
+        if not mosaic_cfg.get("enabled", False):
+            return None
+        if "origin" not in mosaic_cfg:
+            raise ValueError("drone.mosaic.origin ([lat, lon]) is required when the mosaic is enabled")
+        field_name = str(mosaic_cfg.get("field", "default"))
+        directory = mosaic_cfg.get("dir") or pathlib.Path(drone_cfg["analysis_dir"]) / "mosaic" / field_name
+        lat, lon = mosaic_cfg["origin"]
+        return cls(
+            directory=pathlib.Path(directory),
+            origin=(float(lat), float(lon)),
+            resolution_m=float(mosaic_cfg.get("resolution_m", cls.resolution_m)),
+            tile_size=int(mosaic_cfg.get("tile_size", cls.tile_size)),
+            hfov_deg=float(mosaic_cfg.get("hfov_deg", cls.hfov_deg)),
+            vfov_deg=float(mosaic_cfg.get("vfov_deg", cls.vfov_deg)),
+            max_open_tiles=int(mosaic_cfg.get("max_open_tiles", cls.max_open_tiles)),
+            parcels={
+                str(pid): [(float(p[0]), float(p[1])) for p in polygon]
+                for pid, polygon in (mosaic_cfg.get("parcels") or {}).items()
+            },
+        )
+
+
+@dataclass
+class Footprint:
+    center: Tuple[float, float]  # east, north
+    size: Tuple[float, float]  # ground width (across track), height (along track)
+    heading_rad: float
+    bbox: BBox
+
+
+class NDVIMosaic:
+    """
+    NDVI mosaic for one field, stored as fixed-size tiles on a metric grid.
+
+    Tile ``(tx, ty)`` covers ``tile_size`` x ``tile_size`` cells of
+    ``resolution_m`` metres starting at east ``tx * span``, north ``ty * span``
+    from the field origin (row 0 is the southern edge). Each tile is a
+    memory-mapped ``.npy`` of shape ``(2, T, T)`` holding the NDVI sum and the
+    sample weight, so overlapping captures average out and only touched tiles
+    exist on disk. Captures are appended to ``captures.jsonl`` and indexed by
+    the tiles they touch, so region queries only read the relevant tiles and
+    capture lookups never scan the whole history.
+    """
+
+    def __init__(self, settings: MosaicSettings):
+        self.settings = settings
+        self.tile_dir = settings.directory / "tiles"
+        self.tile_dir.mkdir(parents=True, exist_ok=True)
+        self._index_path = settings.directory / "captures.jsonl"
+        self._lock = threading.RLock()
+        self._open: "collections.OrderedDict[TileKey, np.ndarray]" = collections.OrderedDict()
+        self._captures: Dict[str, dict] = {}
+        self._grid: Dict[TileKey, List[str]] = collections.defaultdict(list)
+        self._load_index()
+
+    @property
+    def tile_span_m(self) -> float:
+        return self.settings.tile_size * self.settings.resolution_m
+
+    def _load_index(self):
+        if not self._index_path.exists():
+            return
+        with self._index_path.open("r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                self._register(record)
+        logging.info("Mosaic index loaded: %d captures, %d tiles", len(self._captures), len(self._grid))
+
+    def _register(self, record: dict):
+        self._captures[record["id"]] = record
+        for tx, ty in record["tiles"]:
+            self._grid[(tx, ty)].append(record["id"])
+
+    def _tile_path(self, key: TileKey) -> pathlib.Path:
+        return self.tile_dir / f"{key[0]}_{key[1]}.npy"
+
+    def _tile(self, key: TileKey, create: bool = False) -> Optional[np.ndarray]:
+        tile = self._open.get(key)
+        if tile is not None:
+            self._open.move_to_end(key)
+            return tile
+        path = self._tile_path(key)
+        size = self.settings.tile_size
+        if path.exists():
+            tile = np.lib.format.open_memmap(path, mode="r+")
+        elif create:
+            tile = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(2, size, size))
+        else:
+            return None
+        self._open[key] = tile
+        while len(self._open) > self.settings.max_open_tiles:
+            _, evicted = self._open.popitem(last=False)
+            evicted.flush()
+        return tile
+
+    def footprint(self, telemetry: dict) -> Optional[Footprint]:
+        """Ground footprint of a nadir capture from lat/lon/alt/heading telemetry."""
+        try:
+            lat, lon, alt = float(telemetry["lat"]), float(telemetry["lon"]), float(telemetry["alt"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if alt <= 0:
+            return None
+        heading = math.radians(float(telemetry.get("heading") or 0.0))
+        east, north = project(lat, lon, self.settings.origin)
+        width = 2.0 * alt * math.tan(math.radians(self.settings.hfov_deg) / 2.0)
+        height = 2.0 * alt * math.tan(math.radians(self.settings.vfov_deg) / 2.0)
+        cos_h, sin_h = math.cos(heading), math.sin(heading)
+        corners_e, corners_n = [], []
+        for right, fwd in ((-0.5, 0.5), (0.5, 0.5), (0.5, -0.5), (-0.5, -0.5)):
+            r, f = right * width, fwd * height
+            corners_e.append(float(east) + r * cos_h + f * sin_h)
+            corners_n.append(float(north) - r * sin_h + f * cos_h)
+        bbox = (min(corners_e), min(corners_n), max(corners_e), max(corners_n))
+        return Footprint(center=(float(east), float(north)), size=(width, height), heading_rad=heading, bbox=bbox)
+
+    def _tile_windows(self, bbox: BBox) -> Iterator[Tuple[TileKey, int, int, int, int]]:
+        """Yield (tile, r0, r1, c0, c1) local cell windows covering a metric bbox."""
+        res, size = self.settings.resolution_m, self.settings.tile_size
+        gx0, gx1 = math.floor(bbox[0] / res), math.ceil(bbox[2] / res)
+        gy0, gy1 = math.floor(bbox[1] / res), math.ceil(bbox[3] / res)
+        for ty in range(gy0 // size, (gy1 - 1) // size + 1):
+            for tx in range(gx0 // size, (gx1 - 1) // size + 1):
+                c0, c1 = max(gx0, tx * size) - tx * size, min(gx1, (tx + 1) * size) - tx * size
+                r0, r1 = max(gy0, ty * size) - ty * size, min(gy1, (ty + 1) * size) - ty * size
+                if c1 > c0 and r1 > r0:
+                    yield (tx, ty), r0, r1, c0, c1
+
+    def _cell_centers(self, key: TileKey, r0: int, r1: int, c0: int, c1: int):
+        res, size = self.settings.resolution_m, self.settings.tile_size
+        east = (key[0] * size + np.arange(c0, c1) + 0.5) * res
+        north = (key[1] * size + np.arange(r0, r1) + 0.5) * res
+        return east, north
+
+    def add_capture(
+        self,
+        ndvi_map: np.ndarray,
+        telemetry: dict,
+        capture_id: Optional[str] = None,
+        timestamp: Optional[str] = None,
+    ) -> Optional[dict]:
+        """Splat an NDVI map into the mosaic; returns the index record or None without a usable pose."""
+        fp = self.footprint(telemetry)
+        if fp is None:
+            logging.debug("Mosaic: telemetry has no usable position; capture not placed.")
+            return None
+        height_px, width_px = ndvi_map.shape
+        cos_h, sin_h = math.cos(fp.heading_rad), math.sin(fp.heading_rad)
+        touched: List[List[int]] = []
+        with self._lock:
+            for key, r0, r1, c0, c1 in self._tile_windows(fp.bbox):
+                east, north = self._cell_centers(key, r0, r1, c0, c1)
+                de = east[None, :] - fp.center[0]
+                dn = north[:, None] - fp.center[1]
+                right = de * cos_h - dn * sin_h
+                fwd = de * sin_h + dn * cos_h
+                col = np.floor((right / fp.size[0] + 0.5) * width_px).astype(np.intp)
+                row = np.floor((0.5 - fwd / fp.size[1]) * height_px).astype(np.intp)
+                valid = (col >= 0) & (col < width_px) & (row >= 0) & (row < height_px)
+                if not valid.any():
+                    continue
+                tile = self._tile(key, create=True)
+                sums = tile[0, r0:r1, c0:c1]
+                weights = tile[1, r0:r1, c0:c1]
+                sums[valid] += ndvi_map[row[valid], col[valid]]
+                weights[valid] += 1.0
+                touched.append([key[0], key[1]])
+            lat, lon = float(telemetry["lat"]), float(telemetry["lon"])
+            record = {
+                "id": capture_id or uuid.uuid4().hex,
+                "timestamp": timestamp,
+                "lat": lat,
+                "lon": lon,
+                "alt": float(telemetry["alt"]),
+                "heading": math.degrees(fp.heading_rad),
+                "bbox": list(fp.bbox),
+                "tiles": touched,
+            }
+            with self._index_path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+            self._register(record)
+        logging.info("Mosaic: placed capture %s over %d tile(s)", record["id"], len(touched))
+        return record
+
+    def bbox_from_latlon(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> BBox:
+        e0, n0 = project(min_lat, min_lon, self.settings.origin)
+        e1, n1 = project(max_lat, max_lon, self.settings.origin)
+        return (float(min(e0, e1)), float(min(n0, n1)), float(max(e0, e1)), float(max(n0, n1)))
+
+    def captures_in_bbox(self, bbox: BBox) -> List[dict]:
+        """Captures whose footprint intersects ``bbox`` (metres), found through the tile index."""
+        with self._lock:
+            ids = set()
+            for key, *_ in self._tile_windows(bbox):
+                ids.update(self._grid.get(key, ()))
+            records = [self._captures[i] for i in ids]
+        return [
+            r
+            for r in records
+            if r["bbox"][0] <= bbox[2]
+            and r["bbox"][2] >= bbox[0]
+            and r["bbox"][1] <= bbox[3]
+            and r["bbox"][3] >= bbox[1]
+        ]
+
+    def _windows_with_data(self, bbox: BBox):
+        for key, r0, r1, c0, c1 in self._tile_windows(bbox):
+            if key not in self._grid:
+                continue
+            tile = self._tile(key)
+            if tile is None:
+                continue
+            yield key, r0, r1, c0, c1, tile
+
+    def read_bbox(self, bbox: BBox) -> np.ndarray:
+        """Mean NDVI raster for a metric bbox (north-up, NaN where nothing was captured)."""
+        res = self.settings.resolution_m
+        size = self.settings.tile_size
+        gx0, gy0 = math.floor(bbox[0] / res), math.floor(bbox[1] / res)
+        gx1, gy1 = math.ceil(bbox[2] / res), math.ceil(bbox[3] / res)
+        out = np.full((gy1 - gy0, gx1 - gx0), np.nan, dtype=np.float32)
+        with self._lock:
+            for key, r0, r1, c0, c1, tile in self._windows_with_data(bbox):
+                weights = tile[1, r0:r1, c0:c1]
+                block = np.divide(
+                    tile[0, r0:r1, c0:c1],
+                    weights,
+                    out=np.full(weights.shape, np.nan, np.float32),
+                    where=weights > 0,
+                )
+                oy, ox = key[1] * size + r0 - gy0, key[0] * size + c0 - gx0
+                out[oy : oy + (r1 - r0), ox : ox + (c1 - c0)] = block
+        return out[::-1]
+
+    def region_stats(
+        self,
+        stress_threshold: float,
+        bbox: Optional[BBox] = None,
+        polygon: Optional[Sequence[Tuple[float, float]]] = None,
+    ) -> Dict:
+        """NDVI stats over a bbox (metres) or a lat/lon polygon, accumulated tile by tile."""
+        poly_m = None
+        if polygon is not None:
+            lat, lon = np.asarray(polygon, dtype=np.float64).T
+            east, north = project(lat, lon, self.settings.origin)
+            poly_m = np.column_stack([east, north])
+            bbox = (float(east.min()), float(north.min()), float(east.max()), float(north.max()))
+        if bbox is None:
+            raise ValueError("region_stats needs a bbox or a polygon")
+        pixels = stressed = 0
+        total = 0.0
+        minimum, maximum = float("inf"), float("-inf")
+        with self._lock:
+            for key, r0, r1, c0, c1, tile in self._windows_with_data(bbox):
+                weights = tile[1, r0:r1, c0:c1]
+                mask = weights > 0
+                if poly_m is not None:
+                    east, north = self._cell_centers(key, r0, r1, c0, c1)
+                    mask &= points_in_polygon(east[None, :], north[:, None], poly_m)
+                if not mask.any():
+                    continue
+                values = tile[0, r0:r1, c0:c1][mask] / weights[mask]
+                pixels += values.size
+                total += float(values.sum(dtype=np.float64))
+                minimum = min(minimum, float(values.min()))
+                maximum = max(maximum, float(values.max()))
+                stressed += int(np.count_nonzero(values < stress_threshold))
+        if not pixels:
+            return {"pixels": 0, "mean": None, "min": None, "max": None, "stress_ratio": None}
+        return {
+            "pixels": pixels,
+            "area_m2": pixels * self.settings.resolution_m ** 2,
+            "mean": total / pixels,
+            "min": minimum,
+            "max": maximum,
+            "stress_ratio": stressed / pixels,
+        }
+
+    def parcel_stats(self, parcel_id: str, stress_threshold: float) -> Dict:
+        polygon = self.settings.parcels.get(parcel_id)
+        if polygon is None:
+            raise KeyError(f"Unknown mosaic parcel {parcel_id!r}")
+        return self.region_stats(stress_threshold, polygon=polygon)
+
+    def hotspots(self, bbox: BBox, stress_threshold: float, cell_px: int = 16, min_coverage: float = 0.5) -> List[Dict]:
+        """Cells of ``cell_px`` x ``cell_px`` whose mean NDVI is below the threshold, worst first."""
+        size = self.settings.tile_size
+        if size % cell_px:
+            raise ValueError("cell_px must divide tile_size")
+        cells_per_side = size // cell_px
+        cell_m = cell_px * self.settings.resolution_m
+        found: List[Dict] = []
+        with self._lock:
+            tiles = {key: tile for key, *_, tile in self._windows_with_data(bbox)}
+            for key, tile in tiles.items():
+                shape = (cells_per_side, cell_px, cells_per_side, cell_px)
+                sums = tile[0].reshape(shape).sum(axis=(1, 3))
+                weights = tile[1].reshape(shape)
+                filled = np.count_nonzero(weights, axis=(1, 3))
+                weights = weights.sum(axis=(1, 3))
+                covered = filled >= max(1.0, min_coverage * cell_px * cell_px)
+                means = np.divide(sums, weights, out=np.full(sums.shape, np.nan), where=covered)
+                rows, cols = np.nonzero(covered & (means < stress_threshold))
+                for r, c in zip(rows, cols):
+                    east = key[0] * self.tile_span_m + (c + 0.5) * cell_m
+                    north = key[1] * self.tile_span_m + (r + 0.5) * cell_m
+                    if not (bbox[0] <= east <= bbox[2] and bbox[1] <= north <= bbox[3]):
+                        continue
+                    lat, lon = unproject(east, north, self.settings.origin)
+                    found.append({"lat": float(lat), "lon": float(lon), "mean": float(means[r, c]), "size_m": cell_m})
+        found.sort(key=lambda item: item["mean"])
+        return found
+
+    def flush(self):
+        with self._lock:
+            for tile in self._open.values():
+                tile.flush()
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._open.clear()
@@ -0,0 +1,302 @@
+# Bounded decode -> compute -> publish pipeline for waypoint-triggered NDVI.
+import collections
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from ..utils import metrics
+from . import camera
+from .analysis import NDVI_CAPTURES, NDVI_STAGE_MS
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "coalesce")
+
+BandLoader = Callable[[str, Sequence[Optional[str]]], Sequence[np.ndarray]]  # (path, channels) -> one band each
+Compute = Callable[..., Any]  # called with one keyword argument per band, e.g. red=, nir=
+
+
+@dataclass
+class CaptureJob:
+    rgb_path: str
+    nir_path: str
+    seq: Optional[int] = None
+    triggered_at: float = field(default_factory=time.time)
+    telemetry: Optional[dict] = None
+    _enqueued: float = field(default_factory=time.monotonic, repr=False)
+
+    @property
+    def key(self):
+        return (self.rgb_path, self.nir_path)
+
+
+@dataclass
+class PipelineSettings:
+    workers: int = 2
+    executor: str = "thread"  # "thread" or "process"
+    queue_depth: int = 4
+    overflow: str = "drop_oldest"  # see OVERFLOW_POLICIES
+
+    @classmethod
+    def from_config(cls, raw: Optional[dict]) -> "PipelineSettings":
+        raw = raw or {}
+        settings = cls(
+            workers=max(1, int(raw.get("workers", cls.workers))),
+            executor=str(raw.get("executor", cls.executor)),
+            queue_depth=max(1, int(raw.get("queue_depth", cls.queue_depth))),
+            overflow=str(raw.get("overflow", cls.overflow)),
+        )
+        if settings.executor not in ("thread", "process"):
+            raise ValueError(f"Unknown pipeline executor {settings.executor!r}")
+        if settings.overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown pipeline overflow policy {settings.overflow!r}")
+        return settings
+
+
+class StageStats:
+    """Latency counters for one pipeline stage (milliseconds)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+
+    def record(self, elapsed_ms: float):
+        with self._lock:
+            self.count += 1
+            self.total_ms += elapsed_ms
+            self.last_ms = elapsed_ms
+            if elapsed_ms > self.max_ms:
+                self.max_ms = elapsed_ms
+
+    def as_dict(self) -> Dict[str, float]:
+        with self._lock:
+            avg = self.total_ms / self.count if self.count else 0.0
+            return {"count": self.count, "avg_ms": avg, "max_ms": self.max_ms, "last_ms": self.last_ms}
+
+
+class CapturePipeline:
+    """
+    Bounded pipeline: both bands are decoded concurrently, NDVI runs on a
+    fixed pool of workers and results are handed to a single publisher thread.
+
+    The intake queue holds at most ``queue_depth`` jobs; when it is full the
+    overflow policy either blocks the caller, drops the oldest job, or (for
+    ``coalesce``) folds the new trigger into a queued job for the same capture
+    paths. The publish queue is bounded too, so a slow broker backs up into
+    the compute stage instead of growing memory. Optional ``lookup``/``store``
+    hooks let a result cache answer a job before anything is decoded.
+    """
+
+    STAGES = ("queue", "decode", "compute", "publish")
+    # Publishing is timed into ndvi_stage_ms by the publish callback (DroneService._handle_result).
+    METRIC_STAGES = ("queue", "decode", "compute")
+
+    def __init__(
+        self,
+        settings: PipelineSettings,
+        load_band: BandLoader,
+        compute: Compute,
+        publish: Callable[[CaptureJob, Any], None],
+        lookup: Optional[Callable[[CaptureJob], Optional[Any]]] = None,
+        store: Optional[Callable[[CaptureJob, Any], None]] = None,
+        bands: Sequence[str] = ("red", "nir"),
+        compute_pool: Optional[Executor] = None,
+        name: str = "default",
+    ):
+        self.settings = settings
+        self.name = name  # ``drone`` label of this pipeline's metrics (the drone id in fleet mode)
+        self.bands = tuple(bands)
+        self._load_band = load_band
+        self._compute = compute
+        self._publish = publish
+        self._lookup = lookup
+        self._store = store
+        self._queue: Deque[CaptureJob] = collections.deque()
+        self._cond = threading.Condition()
+        self._publish_queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=settings.queue_depth)
+        self._decode_pool = ThreadPoolExecutor(max_workers=2 * settings.workers, thread_name_prefix="ndvi-decode")
+        # A caller-provided pool (e.g. a fleet shard) is shared with other pipelines and outlives this one.
+        self._owns_compute_pool = compute_pool is None
+        self._compute_pool: Optional[Executor] = compute_pool or (
+            ProcessPoolExecutor(max_workers=settings.workers) if settings.executor == "process" else None
+        )
+        self._threads: List[threading.Thread] = []
+        self._running = False
+        self.stage_stats = {name: StageStats() for name in self.STAGES}
+        self.counters = {"submitted": 0, "dropped": 0, "coalesced": 0, "completed": 0, "failed": 0, "cache_hits": 0}
+        self._queue_depth = metrics.gauge(
+            "ndvi_queue_depth",
+            "Captures waiting for an NDVI worker, by drone.",
+            fn=self._queued,
+            labels={"drone": name},
+        )
+
+    def _queued(self) -> int:
+        return len(self._queue)
+
+    def _count(self, name: str):
+        with self._cond:
+            self.counters[name] += 1
+
+    def start(self):
+        self._running = True
+        for idx in range(self.settings.workers):
+            thread = threading.Thread(target=self._worker, name=f"ndvi-worker-{idx}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        publisher = threading.Thread(target=self._publisher, name="ndvi-publisher", daemon=True)
+        publisher.start()
+        self._threads.append(publisher)
+        logging.info(
+            "NDVI pipeline started (workers=%s executor=%s queue_depth=%s overflow=%s)",
+            self.settings.workers,
+            self.settings.executor,
+            self.settings.queue_depth,
+            self.settings.overflow,
+        )
+
+    def submit(self, job: CaptureJob) -> bool:
+        """Queue a capture job; returns False if the pipeline is stopped."""
+        with self._cond:
+            if not self._running:
+                return False
+            self.counters["submitted"] += 1
+            if self.settings.overflow == "coalesce":
+                for idx, queued in enumerate(self._queue):
+                    if queued.key == job.key:
+                        # Same files: the newest trigger (seq, telemetry) wins, position is kept.
+                        job._enqueued = queued._enqueued
+                        self._queue[idx] = job
+                        self.counters["coalesced"] += 1
+                        return True
+            while len(self._queue) >= self.settings.queue_depth:
+                if self.settings.overflow == "block":
+                    self._cond.wait()
+                    if not self._running:
+                        return False
+                    continue
+                dropped = self._queue.popleft()
+                self.counters["dropped"] += 1
+                NDVI_CAPTURES.inc(result="dropped")
+                logging.warning("NDVI queue full; dropping capture for waypoint seq=%s", dropped.seq)
+            self._queue.append(job)
+            self._cond.notify_all()
+            return True
+
+    def set_stages(self, load_band: BandLoader, compute: Compute):
+        """Swap the decode and compute callables (after a config reload); jobs already past a stage keep the old one."""
+        self._load_band, self._compute = load_band, compute
+
+    def _next_job(self) -> Optional[CaptureJob]:
+        with self._cond:
+            while self._running and not self._queue:
+                self._cond.wait()
+            if not self._running:
+                return None
+            job = self._queue.popleft()
+            self._cond.notify_all()
+            return job
+
+    def _decode(self, job: CaptureJob) -> Dict[str, np.ndarray]:
+        # One decode task per source capture, so the RGB channels share a single image decode.
+        sources: Dict[str, List[str]] = {}
+        for band in self.bands:
+            sources.setdefault(str(camera.band_path(job.rgb_path, job.nir_path, band)), []).append(band)
+        futures = {
+            path: self._decode_pool.submit(self._load_band, path, [camera.BAND_SOURCES[b][1] for b in bands])
+            for path, bands in sources.items()
+        }
+        decoded: Dict[str, np.ndarray] = {}
+        for path, bands in sources.items():
+            decoded.update(zip(bands, futures[path].result()))
+        return decoded
+
+    def _record(self, stage: str, elapsed_ms: float):
+        self.stage_stats[stage].record(elapsed_ms)
+        if stage in self.METRIC_STAGES:
+            NDVI_STAGE_MS.observe(elapsed_ms, stage=stage)
+
+    def _timed(self, stage: str, func, *args):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self._record(stage, (time.perf_counter() - started) * 1000.0)
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self._record("queue", (time.monotonic() - job._enqueued) * 1000.0)
+            try:
+                result = self._lookup(job) if self._lookup else None
+                if result is not None:
+                    self._count("cache_hits")
+                    self._publish_queue.put((job, result))
+                    continue
+                bands = self._timed("decode", self._decode, job)
+                if self._compute_pool is not None:
+                    result = self._timed("compute", lambda: self._compute_pool.submit(self._compute, **bands).result())
+                else:
+                    result = self._timed("compute", lambda: self._compute(**bands))
+                if self._store:
+                    self._store(job, result)
+            except Exception as exc:
+                self._count("failed")
+                NDVI_CAPTURES.inc(result="failed")
+                logging.error("NDVI processing failed for waypoint seq=%s: %s", job.seq, exc)
+                continue
+            self._publish_queue.put((job, result))
+
+    def _publisher(self):
+        while True:
+            item = self._publish_queue.get()
+            if item is None:
+                return
+            job, result = item
+            try:
+                self._timed("publish", self._publish, job, result)
+                self._count("completed")
+            except Exception as exc:
+                self._count("failed")
+                NDVI_CAPTURES.inc(result="failed")
+                logging.error("Publishing NDVI result for waypoint seq=%s failed: %s", job.seq, exc)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            counters = dict(self.counters)
+            depth = len(self._queue)
+        return {
+            "queue_depth": depth,
+            "publish_queue_depth": self._publish_queue.qsize(),
+            "counters": counters,
+            "stages": {name: stats.as_dict() for name, stats in self.stage_stats.items()},
+        }
+
+    def stop(self, timeout: float = 5.0):
+        with self._cond:
+            self._running = False
+            pending = len(self._queue)
+            self._queue.clear()
+            self._cond.notify_all()
+        self._queue_depth.set_function(None, drone=self.name)
+        if pending:
+            logging.info("NDVI pipeline stopping; discarded %s queued capture(s).", pending)
+        workers = self._threads[:-1]
+        for thread in workers:
+            thread.join(timeout)
+        self._publish_queue.put(None)
+        if self._threads:
+            self._threads[-1].join(timeout)
+        self._threads = []
+        self._decode_pool.shutdown(wait=False)
+        if self._compute_pool is not None and self._owns_compute_pool:
+            self._compute_pool.shutdown(wait=False)
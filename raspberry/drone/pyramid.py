@@ -0,0 +1,221 @@
+# Multi-resolution NDVI pyramids: block-mean levels stored as quantized chunks, coarsest level first.
+import json
+import logging
+import os
+import pathlib
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ..utils import metrics
+from .analysis import NDVI_STAGE_MS, NDVI_UINT8_OFFSET, NDVI_UINT8_SCALE, block_reduce, pack_ndvi_uint8, quantize_ndvi
+
+PYRAMID_DTYPES = ("uint8", "float16")
+MANIFEST = "pyramid.json"
+
+_DROPPED = metrics.counter("ndvi_pyramid_dropped_total", "Pyramids whose finer levels were skipped (writer backlog).")
+
+
+@dataclass
+class PyramidSettings:
+    directory: pathlib.Path
+    max_levels: int = 6  # full resolution plus up to 5 halvings
+    min_side: int = 32  # stop halving before the longer side drops below this
+    dtype: str = "uint8"  # uint8 (2/255 NDVI steps) or float16
+    chunk_size: int = 256
+    keep_captures: int = 200  # older pyramids are deleted
+    max_pending: int = 4  # captures waiting for their fine levels; beyond this only the coarse levels are kept
+    preview_max_side: int = 0  # published preview: the largest level within this side (0 = coarsest level)
+
+    @classmethod
+    def from_config(cls, drone_cfg: dict) -> Optional["PyramidSettings"]:
+        raw = drone_cfg.get("pyramid") or {}
+        if not raw.get("enabled", False):
+            return None
+        dtype = str(raw.get("dtype", cls.dtype))
+        if dtype not in PYRAMID_DTYPES:
+            raise ValueError(f"drone.pyramid.dtype must be one of {', '.join(PYRAMID_DTYPES)}, got {dtype!r}")
+        return cls(
+            directory=pathlib.Path(raw.get("dir") or pathlib.Path(drone_cfg["analysis_dir"]) / "pyramid"),
+            max_levels=max(1, int(raw.get("max_levels", cls.max_levels))),
+            min_side=max(1, int(raw.get("min_side", cls.min_side))),
+            dtype=dtype,
+            chunk_size=max(16, int(raw.get("chunk_size", cls.chunk_size))),
+            keep_captures=max(1, int(raw.get("keep_captures", cls.keep_captures))),
+            max_pending=max(0, int(raw.get("max_pending", cls.max_pending))),
+            preview_max_side=int(raw.get("preview_max_side", cls.preview_max_side)),
+        )
+
+
+def build_levels(ndvi: np.ndarray, max_levels: int, min_side: int) -> List[np.ndarray]:
+    """
+    Full map, then 2x2 block means of the previous level until ``max_levels``
+    levels or the longer side would drop below ``min_side``. Each level is
+    reduced from the one above it, so the whole pyramid costs about a third
+    of one pass over the map. An odd last row/column is cropped, as in
+    ``block_reduce``.
+    """
+    levels = [ndvi]
+    while len(levels) < max_levels and max(levels[-1].shape) // 2 >= min_side and min(levels[-1].shape) >= 2:
+        levels.append(block_reduce(levels[-1], 2))
+    return levels
+
+
+class NDVIPyramid:
+    """
+    Writes one pyramid per capture under ``<directory>/<capture_id>/``:
+    ``L<level>/<row>_<col>.npy`` chunks plus a ``pyramid.json`` manifest.
+
+    ``add`` builds every level from the NDVI map, writes the coarse levels
+    (no larger than ``chunk_size``, so one chunk each) before returning, and
+    hands the finer ones to a background writer, coarse to fine. The
+    manifest is rewritten atomically as each level lands, so readers always
+    see complete levels and ``complete`` turns true once full resolution is
+    on disk.
+    """
+
+    def __init__(self, settings: PyramidSettings):
+        self.settings = settings
+        self.settings.directory.mkdir(parents=True, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ndvi-pyramid")
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    # Writing -------------------------------------------------------------------
+    def _encode(self, level: np.ndarray) -> np.ndarray:
+        if self.settings.dtype == "uint8":
+            return quantize_ndvi(level)
+        return level.astype(np.float16)
+
+    def _write_level(self, root: pathlib.Path, index: int, level: np.ndarray) -> Dict:
+        chunk = self.settings.chunk_size
+        encoded = self._encode(level)
+        level_dir = root / f"L{index}"
+        level_dir.mkdir(exist_ok=True)
+        for row in range(0, encoded.shape[0], chunk):
+            for col in range(0, encoded.shape[1], chunk):
+                np.save(level_dir / f"{row // chunk}_{col // chunk}.npy", encoded[row : row + chunk, col : col + chunk])
+        entry = {
+            "level": index,
+            "factor": 2**index,
+            "width": int(level.shape[1]),
+            "height": int(level.shape[0]),
+            "chunk_size": chunk,
+            "dtype": self.settings.dtype,
+        }
+        if self.settings.dtype == "uint8":
+            entry.update(scale=NDVI_UINT8_SCALE, offset=NDVI_UINT8_OFFSET)
+        return entry
+
+    @staticmethod
+    def _write_manifest(root: pathlib.Path, manifest: Dict):
+        tmp = root / (MANIFEST + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, root / MANIFEST)
+
+    def _write_fine(self, root: pathlib.Path, manifest: Dict, levels: Dict[int, np.ndarray]):
+        try:
+            with NDVI_STAGE_MS.time(stage="pyramid"):
+                for index in sorted(levels, reverse=True):
+                    manifest["levels"].append(self._write_level(root, index, levels[index]))
+                    manifest["complete"] = index == 0
+                    self._write_manifest(root, manifest)
+        except Exception as exc:
+            logging.error("Failed to write NDVI pyramid %s: %s", root.name, exc)
+        finally:
+            with self._lock:
+                self._pending -= 1
+        self._prune()
+
+    def add(self, capture_id: str, ndvi: np.ndarray, timestamp: Optional[str] = None) -> Dict:
+        """Store a capture's pyramid; returns the preview payload taken from its coarse levels."""
+        s = self.settings
+        levels = build_levels(ndvi, s.max_levels, s.min_side)
+        root = s.directory / capture_id
+        root.mkdir(parents=True, exist_ok=True)
+        manifest = {
+            "capture": capture_id,
+            "timestamp": timestamp,
+            "width": int(ndvi.shape[1]),
+            "height": int(ndvi.shape[0]),
+            "levels": [],
+            "complete": False,
+        }
+        coarse = [i for i, level in enumerate(levels) if max(level.shape) <= s.chunk_size] or [len(levels) - 1]
+        for index in sorted(coarse, reverse=True):
+            manifest["levels"].append(self._write_level(root, index, levels[index]))
+        manifest["complete"] = 0 in coarse
+        self._write_manifest(root, manifest)
+
+        fine = {i: levels[i] for i in range(len(levels)) if i not in coarse}
+        if fine:
+            with self._lock:
+                accept = self._pending < s.max_pending
+                if accept:
+                    self._pending += 1
+            if accept:
+                self._executor.submit(self._write_fine, root, manifest, fine)
+            else:
+                _DROPPED.inc()
+                logging.warning("NDVI pyramid writer behind; kept only the coarse levels of %s", capture_id)
+        else:
+            self._prune()
+        return self._preview(levels)
+
+    def _preview(self, levels: List[np.ndarray]) -> Dict:
+        max_side = self.settings.preview_max_side
+        if max_side > 0:
+            fitting = [level for level in levels if max(level.shape) <= max_side]
+            if fitting:
+                return pack_ndvi_uint8(fitting[0])
+        return pack_ndvi_uint8(levels[-1])
+
+    def _prune(self):
+        try:
+            entries = sorted(
+                (entry for entry in os.scandir(self.settings.directory) if entry.is_dir()),
+                key=lambda entry: entry.stat().st_mtime,
+            )
+        except OSError:
+            return
+        for entry in entries[: max(0, len(entries) - self.settings.keep_captures)]:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+    def close(self):
+        """Wait for pending background levels."""
+        self._executor.shutdown(wait=True)
+
+    # Reading -------------------------------------------------------------------
+    def manifest(self, capture_id: str) -> Optional[Dict]:
+        try:
+            return json.loads((self.settings.directory / capture_id / MANIFEST).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+
+    def captures(self) -> List[str]:
+        """Stored capture ids, oldest first."""
+        entries = [entry for entry in os.scandir(self.settings.directory) if entry.is_dir()]
+        return [entry.name for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime)]
+
+    def read_level(self, capture_id: str, level: int) -> Optional[np.ndarray]:
+        """One level as float32 NDVI, or None while it is not written yet."""
+        manifest = self.manifest(capture_id)
+        entry = next((e for e in (manifest or {}).get("levels", []) if e["level"] == level), None)
+        if entry is None:
+            return None
+        chunk = entry["chunk_size"]
+        out = np.empty((entry["height"], entry["width"]), dtype=np.float32)
+        level_dir = self.settings.directory / capture_id / f"L{level}"
+        for row in range(0, entry["height"], chunk):
+            for col in range(0, entry["width"], chunk):
+                data = np.load(level_dir / f"{row // chunk}_{col // chunk}.npy")
+                out[row : row + data.shape[0], col : col + data.shape[1]] = data
+        if entry["dtype"] == "uint8":
+            out *= entry["scale"]
+            out += entry["offset"]
+        return out
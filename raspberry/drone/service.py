@@ -1,14 +1,34 @@
-import json
+import functools
 import logging
+import os
 import pathlib
-import threading
 import time
+from concurrent.futures import Executor
 from datetime import datetime, timezone
 from typing import Dict, Optional
 
+from ..utils.codecs import LazyJSON
+from ..utils.history import HistoryStore, analysis_values
 from ..utils.mqtt_client import MQTTClient
-from .analysis import run_ndvi_pipeline
+from ..utils.settings import ConfigError, Settings
+from . import camera
+from .analysis import (
+    NDVI_CAPTURES,
+    NDVI_STAGE_MS,
+    SamplingSettings,
+    index_bands,
+    index_settings,
+    run_ndvi_pipeline,
+    summarize_bands,
+    thread_engine,
+)
 from .autopilot import AutopilotClient
+from .cache import NDVICache, cache_params
+from .mosaic import MosaicSettings, NDVIMosaic
+from .pipeline import CaptureJob, CapturePipeline, PipelineSettings
+from .pyramid import NDVIPyramid, PyramidSettings
+from .telemetry import TelemetrySettings, TelemetryStreamer
+from .zonal import ZonalStats
 
 
 class DroneService:
@@ -17,61 +37,318 @@ class DroneService:
         config: dict,
         mqtt_client: MQTTClient,
         autopilot: AutopilotClient,
+        identity: Optional[Dict[str, str]] = None,
+        settings: Optional[Settings] = None,
     ):
         self.config = config
+        self.settings = settings or Settings.compile(config)
+        if self.settings.drone is None:
+            raise ConfigError(["drone section is required"])
+        self.identity = identity  # e.g. {"id": ..., "field": ...} in fleet mode; added to published payloads
         self.mqtt = mqtt_client
         self.autopilot = autopilot
-        self.topics = config["mqtt"]["topics"]
+        self.topics = self.settings.topics
         self.drone_cfg = config["drone"]
-
-    def run_capture_and_publish(self, rgb_path: str, nir_path: str):
-        resize = (
-            int(self.drone_cfg["camera"]["width"]),
-            int(self.drone_cfg["camera"]["height"]),
+        self.indices, self.index_thresholds = index_settings(self.drone_cfg["ndvi"])
+        self.sampling = SamplingSettings.from_config(self.drone_cfg["ndvi"])
+        self.cache = NDVICache.from_config(self.drone_cfg)
+        mosaic_settings = MosaicSettings.from_config(self.drone_cfg)
+        self.mosaic = NDVIMosaic(mosaic_settings) if mosaic_settings else None
+        self.zonal = ZonalStats.from_config(self.drone_cfg)
+        pyramid_settings = PyramidSettings.from_config(self.drone_cfg)
+        self.pyramid = NDVIPyramid(pyramid_settings) if pyramid_settings else None
+        self.history = HistoryStore.from_config(config.get("history"))
+        extra_indices = any(name != "ndvi" for name in self.indices)
+        if self.sampling is not None and (self._needs_map() or self._preview_max_side() or extra_indices):
+            logging.warning(
+                "drone.ndvi.mode adaptive has no effect while NDVI maps, previews or extra indices are configured."
+            )
+        telemetry_settings = TelemetrySettings.from_config(self.drone_cfg.get("telemetry"))
+        self.telemetry = (
+            TelemetryStreamer(autopilot, self._publish_telemetry, telemetry_settings) if telemetry_settings else None
         )
-        ndvi_summary = run_ndvi_pipeline(
-            pathlib.Path(rgb_path),
-            pathlib.Path(nir_path),
-            resize=resize,
-            stress_threshold=float(self.drone_cfg["ndvi"]["stress_threshold"]),
+        self.pipeline: Optional[CapturePipeline] = None  # the waypoint pipeline, while it runs
+
+    def apply_settings(self, config: dict, settings: Settings):
+        """
+        Swap in a reloaded config without a restart: topics, camera paths and
+        size, stress threshold and engine options. A running waypoint pipeline
+        gets new decode/compute stages; captures already in flight finish
+        with the old ones.
+        """
+        if settings.drone is None:
+            raise ConfigError(["drone section is required"])
+        self.config, self.drone_cfg = config, config["drone"]
+        self.settings, self.topics = settings, settings.topics
+        if self.pipeline is not None:
+            self.pipeline.set_stages(self._pipeline_loader(), self._pipeline_compute())
+        camera_settings = settings.drone.camera
+        logging.info(
+            "Drone settings applied: %dx%d, stress threshold %.2f",
+            camera_settings.width,
+            camera_settings.height,
+            settings.drone.ndvi.stress_threshold,
         )
-        telemetry = self.autopilot.read_telemetry()
+
+    def _resize(self):
+        return self.settings.drone.camera.resize
+
+    def _preview_max_side(self) -> int:
+        if self.pyramid is not None:
+            return 0  # the preview comes from the pyramid's coarse levels instead
+        return self.settings.drone.ndvi.preview_max_side
+
+    def _needs_map(self) -> bool:
+        return self.mosaic is not None or self.zonal is not None or self.pyramid is not None
+
+    def _capture_id(self, timestamp: datetime) -> str:
+        stamp = timestamp.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+        return f"{self.identity['id']}-{stamp}" if self.identity else stamp
+
+    def _engine_options(self) -> Dict:
+        ndvi = self.settings.drone.ndvi
+        return {"tile_rows": ndvi.tile_rows, "histogram_bins": ndvi.histogram_bins}
+
+    def _publish_analysis(self, ndvi_summary: Dict, telemetry: dict, timestamp: Optional[datetime] = None):
         payload = {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "timestamp": (timestamp or datetime.now(timezone.utc)).isoformat(),
             "telemetry": telemetry,
             "ndvi": ndvi_summary,
         }
-        logging.info("Publishing NDVI analysis to %s", self.topics["analysis"])
-        self.mqtt.publish(self.topics["analysis"], payload)
-        logging.debug("Payload: %s", json.dumps(payload, indent=2))
+        if self.identity:
+            payload["drone"] = self.identity
+        logging.info("Publishing NDVI analysis to %s", self.topics.analysis)
+        self.mqtt.publish(self.topics.analysis, payload)
+        logging.debug("Payload: %s", LazyJSON(payload, indent=2))
+
+    def _handle_result(self, ndvi_summary: Dict, telemetry: dict, timestamp: Optional[datetime] = None):
+        """Feed the NDVI map (if any) to the map consumers, then publish the summary."""
+        ndvi_map = ndvi_summary.pop("ndvi_map", None)
+        timestamp = timestamp or datetime.now(timezone.utc)
+        with NDVI_STAGE_MS.time(stage="publish"):
+            if ndvi_map is not None and self.mosaic is not None:
+                try:
+                    self.mosaic.add_capture(ndvi_map, telemetry, timestamp=timestamp.isoformat())
+                except Exception as exc:
+                    logging.error("Failed to add capture to NDVI mosaic: %s", exc)
+            if ndvi_map is not None and self.pyramid is not None:
+                capture_id = self._capture_id(timestamp)
+                try:
+                    ndvi_summary["preview"] = self.pyramid.add(capture_id, ndvi_map, timestamp.isoformat())
+                    ndvi_summary["pyramid"] = capture_id
+                except Exception as exc:
+                    logging.error("Failed to write NDVI pyramid: %s", exc)
+            self._publish_analysis(ndvi_summary, telemetry, timestamp=timestamp)
+            parcels = None
+            if ndvi_map is not None and self.zonal is not None:
+                parcels = self._publish_parcels(ndvi_map, timestamp)
+        NDVI_CAPTURES.inc(result="published")
+        if self.history is not None:
+            self.history.record(timestamp.timestamp(), analysis_values(ndvi_summary, parcels))
+
+    def _publish_parcels(self, ndvi_map, timestamp: datetime) -> Dict[str, Dict]:
+        parcels = self.zonal.compute(ndvi_map, self.settings.drone.ndvi.stress_threshold)
+        topic = self.topics.parcel_analysis
+        logging.info("Publishing per-parcel NDVI for %d parcel(s) to %s", len(parcels), topic)
+        payload = {"timestamp": timestamp.isoformat(), "parcels": parcels}
+        if self.identity:
+            payload["drone"] = self.identity
+        self.mqtt.publish(topic, payload)
+        return parcels
+
+    def analyze(self, rgb_path: str, nir_path: str, exact: bool = False) -> Dict:
+        """
+        NDVI summary for one capture (cache-aware); includes ``ndvi_map`` when map consumers are configured.
+        ``exact`` forces the full pass when `drone.ndvi.mode` is adaptive.
+        """
+        drone = self.settings.drone  # one snapshot per capture, even if a reload lands meanwhile
+        return run_ndvi_pipeline(
+            pathlib.Path(rgb_path),
+            pathlib.Path(nir_path),
+            resize=drone.camera.resize,
+            stress_threshold=drone.ndvi.stress_threshold,
+            engine=thread_engine(tile_rows=drone.ndvi.tile_rows, histogram_bins=drone.ndvi.histogram_bins),
+            raw_format=drone.camera.raw_format,
+            cache=self.cache,
+            preview_max_side=self._preview_max_side(),
+            return_map=self._needs_map(),
+            indices=self.indices,
+            index_thresholds=self.index_thresholds,
+            sampling=None if exact else self.sampling,
+        )
+
+    def telemetry_at(self, timestamp: float) -> dict:
+        """Streamed sample nearest to ``timestamp`` (epoch seconds); a direct read when none is close enough."""
+        if self.telemetry is not None:
+            sample = self.telemetry.nearest(timestamp)
+            if sample is not None:
+                return sample
+        return self.autopilot.read_telemetry()
+
+    def run_capture_and_publish(self, rgb_path: str, nir_path: str, exact: bool = False) -> Dict:
+        # Pose at capture time (file mtime), sampled before the NDVI work rather than after it.
+        try:
+            captured_at = os.path.getmtime(rgb_path)
+        except OSError:
+            captured_at = time.time()
+        telemetry = self.telemetry_at(captured_at)
+        ndvi_summary = self.analyze(rgb_path, nir_path, exact=exact)
+        self._handle_result(ndvi_summary, telemetry)
+        if self.mosaic is not None:
+            self.mosaic.flush()
+        return ndvi_summary
 
     def publish_telemetry_only(self):
         telemetry = self.autopilot.read_telemetry()
         payload = {"timestamp": datetime.now(timezone.utc).isoformat(), "telemetry": telemetry}
-        logging.info("Publishing telemetry to %s", self.topics["telemetry"])
-        self.mqtt.publish(self.topics["telemetry"], payload)
+        logging.info("Publishing telemetry to %s", self.topics.telemetry)
+        self.mqtt.publish(self.topics.telemetry, payload)
 
-    def start_waypoint_ndvi_listener(self, rgb_path: Optional[str] = None, nir_path: Optional[str] = None):
+    def _publish_telemetry(self, payload: dict):
+        logging.debug("Publishing %d telemetry sample(s) to %s", len(payload["samples"]), self.topics.telemetry)
+        self.mqtt.publish(self.topics.telemetry, payload)
+
+    def build_pipeline(self, compute_pool: Optional[Executor] = None) -> CapturePipeline:
+        """Decode/compute/publish pipeline configured from `drone.pipeline`; ``compute_pool`` overrides its executor."""
+        settings = PipelineSettings.from_config(self.drone_cfg.get("pipeline"))
+        lookup = store = None
+        if self.cache is not None:
+            lookup, store = self._cache_lookup, self._cache_store
+        bands = index_bands(("ndvi",) + self.indices)
+        return CapturePipeline(
+            settings,
+            self._pipeline_loader(),
+            self._pipeline_compute(),
+            self._publish_job,
+            lookup=lookup,
+            store=store,
+            bands=bands,
+            compute_pool=compute_pool,
+            name=self.identity["id"] if self.identity else "default",
+        )
+
+    def _pipeline_loader(self):
+        camera_settings = self.settings.drone.camera
+        return functools.partial(self._load_bands, resize=camera_settings.resize, raw_format=camera_settings.raw_format)
+
+    def _pipeline_compute(self):
+        # A partial of a module-level function, so it pickles for process executors.
+        return functools.partial(
+            summarize_bands,
+            stress_threshold=self.settings.drone.ndvi.stress_threshold,
+            preview_max_side=self._preview_max_side(),
+            return_map=self._needs_map(),
+            indices=self.indices,
+            index_thresholds=self.index_thresholds,
+            sampling=self.sampling,
+            **self._engine_options(),
+        )
+
+    def _cache_key(self, job: CaptureJob) -> str:
+        drone = self.settings.drone
+        params = cache_params(
+            drone.camera.resize,
+            drone.ndvi.stress_threshold,
+            drone.ndvi.histogram_bins,
+            drone.camera.raw_format,
+            self._preview_max_side(),
+            self.indices,
+            self.index_thresholds,
+            sampling=self.sampling.cache_key() if self.sampling is not None else None,
+        )
+        return self.cache.key_for(pathlib.Path(job.rgb_path), pathlib.Path(job.nir_path), params)
+
+    def _cache_lookup(self, job: CaptureJob) -> Optional[Dict]:
+        need_map = self._needs_map()
+        entry = self.cache.get(self._cache_key(job), need_map=need_map)
+        if entry is None:
+            return None
+        if need_map:
+            entry.summary["ndvi_map"] = entry.ndvi_map
+        return entry.summary
+
+    def _cache_store(self, job: CaptureJob, ndvi_summary: Dict):
+        summary = {key: value for key, value in ndvi_summary.items() if key != "ndvi_map"}
+        self.cache.put(self._cache_key(job), summary, ndvi_summary.get("ndvi_map"))
+
+    @staticmethod
+    def _load_bands(path: str, channels, resize, raw_format):
+        if len(channels) == 1:
+            return [camera.load_band(pathlib.Path(path), resize, channel=channels[0], raw_format=raw_format)]
+        loaded = camera.load_channels(pathlib.Path(path), resize, channels, raw_format=raw_format)
+        return [loaded[channel] for channel in channels]
+
+    def _publish_job(self, job: CaptureJob, ndvi_summary: Dict):
+        logging.info(
+            "NDVI summary seq=%s mean=%.3f min=%.3f max=%.3f stress=%.1f%%",
+            job.seq,
+            ndvi_summary["mean"],
+            ndvi_summary["min"],
+            ndvi_summary["max"],
+            ndvi_summary["stress_ratio"] * 100,
+        )
+        timestamp = datetime.fromtimestamp(job.triggered_at, timezone.utc)
+        self._handle_result(ndvi_summary, job.telemetry or {}, timestamp=timestamp)
+
+    def start_waypoint_pipeline(
+        self,
+        rgb_path: Optional[str] = None,
+        nir_path: Optional[str] = None,
+        compute_pool: Optional[Executor] = None,
+    ) -> Optional[CapturePipeline]:
         """
-        Register a waypoint-reached handler that triggers NDVI processing.
-        Uses config camera paths if none are provided.
+        Register a waypoint-reached handler feeding a started NDVI pipeline (and
+        start telemetry streaming); None when the autopilot is disconnected.
+        Uses the (reloadable) config camera paths if none are provided.
         """
-        rgb = rgb_path or self.drone_cfg["camera"]["rgb_path"]
-        nir = nir_path or self.drone_cfg["camera"]["nir_path"]
+        pipeline = self.build_pipeline(compute_pool)
 
         def _handle(seq: Optional[int]):
             logging.info("Triggering NDVI capture on waypoint seq=%s", seq)
-            # Offload heavy work to avoid blocking autopilot callback thread.
-            threading.Thread(target=self.run_capture_and_publish, args=(rgb, nir), daemon=True).start()
+            # Telemetry is matched to trigger time; heavy work runs on the pipeline, not the autopilot thread.
+            triggered_at = time.time()
+            telemetry = self.telemetry_at(triggered_at)
+            rgb, nir = self._capture_paths(rgb_path, nir_path)
+            pipeline.submit(CaptureJob(rgb, nir, seq=seq, triggered_at=triggered_at, telemetry=telemetry))
 
         registered = self.autopilot.add_waypoint_reached_handler(_handle)
         if not registered:
             logging.error("Waypoint listener not started because autopilot is disconnected.")
-            return
+            return None
 
+        pipeline.start()
+        self.pipeline = pipeline
+        if self.telemetry is not None:
+            self.telemetry.start()
+        rgb, nir = self._capture_paths(rgb_path, nir_path)
         logging.info("Waiting for waypoint events to trigger NDVI (RGB=%s, NIR=%s)...", rgb, nir)
+        return pipeline
+
+    def _capture_paths(self, rgb_path: Optional[str] = None, nir_path: Optional[str] = None):
+        camera_settings = self.settings.drone.camera
+        return rgb_path or camera_settings.rgb_path, nir_path or camera_settings.nir_path
+
+    def stop_waypoint_pipeline(self, pipeline: CapturePipeline):
+        if self.telemetry is not None:
+            self.telemetry.stop()
+        if self.pipeline is pipeline:
+            self.pipeline = None
+        pipeline.stop()
+        logging.info("NDVI pipeline stats: %s", pipeline.stats())
+        if self.mosaic is not None:
+            self.mosaic.close()
+        if self.pyramid is not None:
+            self.pyramid.close()
+
+    def start_waypoint_ndvi_listener(self, rgb_path: Optional[str] = None, nir_path: Optional[str] = None):
+        """Run the waypoint NDVI pipeline until Ctrl+C."""
+        pipeline = self.start_waypoint_pipeline(rgb_path, nir_path)
+        if pipeline is None:
+            return
         try:
             while True:
                 time.sleep(1)
         except KeyboardInterrupt:
             logging.info("Stopping waypoint NDVI listener...")
+        finally:
+            self.stop_waypoint_pipeline(pipeline)
@@ -0,0 +1,87 @@
+# Synthetic RGB/NIR(/red-edge) captures of a row-crop field for benchmarks and dry runs.
+import pathlib
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+CAPTURE_FORMATS = ("jpg", "png", "npy")
+
+
+def synthetic_bands(width: int, height: int, seed: int = 0, stress_patches: int = 3) -> Dict[str, np.ndarray]:
+    """
+    uint8 bands of crop rows over soil with a few stressed patches.
+
+    Healthy canopy is bright in NIR and dark in red (NDVI around 0.6-0.8), soil
+    sits near zero and stressed patches in between, so every NDVI histogram
+    bin and the stress ratio get realistic traffic.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0.0, 1.0, width, dtype=np.float32)
+    y = np.linspace(0.0, 1.0, height, dtype=np.float32)[:, None]
+    rows = 0.5 + 0.5 * np.sin(2.0 * np.pi * (x * 24.0 + 0.15 * np.sin(2.0 * np.pi * y)))
+    canopy = np.clip(rows * 1.4 - 0.2, 0.0, 1.0).astype(np.float32)
+    for _ in range(stress_patches):
+        cx, cy, r = rng.uniform(0.1, 0.9), rng.uniform(0.1, 0.9), rng.uniform(0.05, 0.15)
+        canopy *= 1.0 - 0.7 * np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2.0 * r * r))
+    noise = rng.normal(0.0, 6.0, (height, width)).astype(np.float32)
+
+    def _band(soil: float, plant: float) -> np.ndarray:
+        band = soil + (plant - soil) * canopy + noise
+        return np.clip(band, 0, 255).astype(np.uint8)
+
+    return {
+        "red": _band(110.0, 30.0),
+        "green": _band(100.0, 70.0),
+        "blue": _band(85.0, 35.0),
+        "nir": _band(120.0, 200.0),
+        "rededge": _band(115.0, 140.0),
+    }
+
+
+def _save(path: pathlib.Path, array: np.ndarray):
+    if path.suffix == ".npy":
+        np.save(path, array)
+    elif path.suffix == ".jpg":
+        Image.fromarray(array).save(path, quality=92)
+    else:
+        Image.fromarray(array).save(path)
+
+
+def write_capture_pair(
+    directory: pathlib.Path,
+    width: int,
+    height: int,
+    fmt: str = "jpg",
+    seed: int = 0,
+    name: str = "0001",
+    rededge: bool = False,
+) -> Tuple[pathlib.Path, pathlib.Path]:
+    """Write ``<name>_rgb.<fmt>`` and ``<name>_nir.<fmt>`` (plus ``<name>_rededge.<fmt>``); return (rgb, nir)."""
+    if fmt not in CAPTURE_FORMATS:
+        raise ValueError(f"Unknown capture format {fmt!r} (expected one of {', '.join(CAPTURE_FORMATS)})")
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    bands = synthetic_bands(width, height, seed=seed)
+    rgb_path = directory / f"{name}_rgb.{fmt}"
+    nir_path = directory / f"{name}_nir.{fmt}"
+    _save(rgb_path, np.dstack([bands["red"], bands["green"], bands["blue"]]))
+    _save(nir_path, bands["nir"])
+    if rededge:
+        _save(directory / f"{name}_rededge.{fmt}", bands["rededge"])
+    return rgb_path, nir_path
+
+
+def write_survey(
+    directory: pathlib.Path,
+    count: int,
+    width: int,
+    height: int,
+    fmt: str = "jpg",
+    seed: Optional[int] = None,
+) -> int:
+    """A directory of ``count`` capture pairs in the layout ``drone-batch`` discovers."""
+    base = 0 if seed is None else seed
+    for idx in range(count):
+        write_capture_pair(directory, width, height, fmt=fmt, seed=base + idx, name=f"{idx + 1:04d}")
+    return count
@@ -0,0 +1,210 @@
+# Listener-driven telemetry: latest-value snapshot, timestamped history, decimated batched publishing.
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from .autopilot import AutopilotClient
+
+# dronekit attribute -> (snapshot fields) extractor
+_ATTRIBUTES: Dict[str, Callable[[object], Dict]] = {
+    "location.global_relative_frame": lambda v: {
+        "lat": getattr(v, "lat", None),
+        "lon": getattr(v, "lon", None),
+        "alt": getattr(v, "alt", None),
+    },
+    "groundspeed": lambda v: {"groundspeed": v},
+    "airspeed": lambda v: {"airspeed": v},
+    "heading": lambda v: {"heading": v},
+    "battery": lambda v: {"battery": getattr(v, "level", None)},
+    "mode": lambda v: {"mode": str(v)},
+}
+
+
+@dataclass
+class TelemetrySettings:
+    publish_hz: float = 2.0  # samples taken from the latest snapshot per second
+    batch_size: int = 5  # samples per MQTT message
+    history_seconds: float = 120.0  # window kept for nearest-sample lookups
+    max_skew_seconds: float = 2.0  # nearest() gives up beyond this distance
+
+    @classmethod
+    def from_config(cls, raw: Optional[dict], force: bool = False) -> Optional["TelemetrySettings"]:
+        """None unless ``enabled`` (or ``force``, for the dedicated CLI)."""
+        raw = raw or {}
+        if not (raw.get("enabled", False) or force):
+            return None
+        return cls(
+            publish_hz=max(0.01, float(raw.get("publish_hz", cls.publish_hz))),
+            batch_size=max(1, int(raw.get("batch_size", cls.batch_size))),
+            history_seconds=float(raw.get("history_seconds", cls.history_seconds)),
+            max_skew_seconds=float(raw.get("max_skew_seconds", cls.max_skew_seconds)),
+        )
+
+
+class _History:
+    """
+    Fixed-size ring of ``(time, sample)`` pairs backed by preallocated lists.
+
+    Both are written together under one lock, so a reader never pairs a
+    time with another sample, and ``nearest`` binary-searches the ring in
+    O(log n) (indexing a list is O(1), unlike the middle of a deque).
+    """
+
+    def __init__(self, capacity: int):
+        self._times: List[float] = [0.0] * capacity
+        self._samples: List[Optional[Dict]] = [None] * capacity
+        self._head = 0  # slot of the oldest pair
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def append(self, t: float, sample: Dict):
+        capacity = len(self._times)
+        with self._lock:
+            slot = (self._head + self._count) % capacity
+            self._times[slot] = t
+            self._samples[slot] = sample
+            if self._count < capacity:
+                self._count += 1
+            else:
+                self._head = (self._head + 1) % capacity
+
+    def nearest(self, timestamp: float, max_skew: float) -> Optional[Dict]:
+        capacity = len(self._times)
+        with self._lock:
+            times, head, count = self._times, self._head, self._count
+            lo, hi = 0, count  # first pair at or after ``timestamp``, in age order
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if times[(head + mid) % capacity] < timestamp:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            slots = [(head + i) % capacity for i in (lo - 1, lo) if 0 <= i < count]
+            if not slots:
+                return None
+            best = min(slots, key=lambda slot: abs(times[slot] - timestamp))
+            if abs(times[best] - timestamp) > max_skew:
+                return None
+            return self._samples[best]
+
+
+class TelemetryStreamer:
+    """
+    Keeps telemetry current from dronekit attribute listeners instead of polling.
+
+    Listener callbacks build a new snapshot dict and swap the reference, so
+    readers take ``latest()`` without a lock. Position updates are also kept
+    as ``(time.time(), snapshot)`` history for ``nearest(ts)``, which is how
+    NDVI captures are matched to the pose at trigger time. ``process`` takes
+    one sample per ``1 / publish_hz`` (only if something changed) and
+    publishes ``batch_size`` samples per message; it can be driven by
+    ``start``'s thread or by the asyncio runtime.
+    """
+
+    def __init__(
+        self,
+        autopilot: AutopilotClient,
+        publish: Callable[[dict], None],
+        settings: Optional[TelemetrySettings] = None,
+    ):
+        self.autopilot = autopilot
+        self.publish = publish
+        self.settings = settings or TelemetrySettings()
+        self._latest: Dict = {"status": "ok"}
+        self._version = 0
+        self._sampled_version = -1
+        history_len = max(1, int(self.settings.history_seconds * 50))  # generous for ~10-50 Hz position streams
+        self._history = _History(history_len)
+        self._batch: List[Dict] = []
+        self._next_sample = time.monotonic()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.counters = {"updates": 0, "samples": 0, "messages": 0}
+
+    # Listener side (dronekit thread) ----------------------------------------------
+    def _on_update(self, fields: Dict, record: bool):
+        now = time.time()
+        snapshot = dict(self._latest)
+        snapshot.update(fields)
+        snapshot["t"] = now
+        self._latest = snapshot  # atomic reference swap; readers never see a half-updated dict
+        self._version += 1
+        self.counters["updates"] += 1
+        if record:
+            self._history.append(now, snapshot)
+
+    def attach(self) -> bool:
+        """Register the attribute listeners; False if the autopilot is not connected."""
+        if not self.autopilot.connected:
+            logging.error("Telemetry streaming not started because autopilot is disconnected.")
+            return False
+        # Seed with a full snapshot so fields that rarely change are present from the start.
+        seed = self.autopilot.read_telemetry()
+        self._on_update({k: v for k, v in seed.items() if k != "status"}, record=True)
+        for attr_name, extract in _ATTRIBUTES.items():
+            record = attr_name.startswith("location")
+            self.autopilot.add_attribute_listener(
+                attr_name, lambda value, extract=extract, record=record: self._on_update(extract(value), record)
+            )
+        logging.info("Telemetry streaming from %d attribute listener(s).", len(_ATTRIBUTES))
+        return True
+
+    # Reader side --------------------------------------------------------------------
+    def latest(self) -> Dict:
+        return self._latest
+
+    def nearest(self, timestamp: float) -> Optional[Dict]:
+        """History sample closest to ``timestamp`` (epoch seconds), or None beyond ``max_skew_seconds``."""
+        return self._history.nearest(timestamp, self.settings.max_skew_seconds)
+
+    # Decimated, batched publishing -------------------------------------------------
+    def process(self, now: Optional[float] = None) -> float:
+        """Take a sample if due and publish a full batch; return the next sample time (monotonic)."""
+        now = time.monotonic() if now is None else now
+        if now >= self._next_sample:
+            self._next_sample = max(now, self._next_sample + 1.0 / self.settings.publish_hz)
+            if self._version != self._sampled_version:
+                self._sampled_version = self._version
+                self._batch.append(self._latest)
+                self.counters["samples"] += 1
+            if len(self._batch) >= self.settings.batch_size:
+                self.flush()
+        return self._next_sample
+
+    def flush(self):
+        if not self._batch:
+            return
+        samples, self._batch = self._batch, []
+        payload = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "telemetry": samples[-1],
+            "samples": samples,
+        }
+        try:
+            self.publish(payload)
+            self.counters["messages"] += 1
+        except Exception as exc:
+            logging.error("Telemetry publish failed: %s", exc)
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            next_sample = self.process()
+            self._stopped.wait(max(0.0, next_sample - time.monotonic()))
+
+    def start(self) -> bool:
+        if not self.attach():
+            return False
+        self._thread = threading.Thread(target=self._loop, name="telemetry", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, timeout: float = 2.0):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self.autopilot.remove_attribute_listeners()
+        self.flush()
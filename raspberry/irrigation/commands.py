@@ -0,0 +1,189 @@
+# Irrigation command batches: parsing, per-parcel merging and replay detection by command id.
+import collections
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..utils.gpio import Valve
+
+ACTIONS = ("start", "extend", "cancel")
+
+# (action, valve_id, seconds, priority), as queued by ValveScheduler.submit.
+ScheduleOp = Tuple[str, str, float, int]
+
+
+@dataclass
+class CommandSettings:
+    dedup_ttl_seconds: float = 600.0  # a command id seen within this window is a replay
+    max_ids: int = 10000  # ids remembered at most; the oldest are forgotten first
+    ack: bool = True  # publish a per-batch acknowledgement to mqtt.topics.irrigation_ack
+
+    @classmethod
+    def from_config(cls, raw: Optional[dict]) -> "CommandSettings":
+        raw = raw or {}
+        return cls(
+            dedup_ttl_seconds=float(raw.get("dedup_ttl_seconds", cls.dedup_ttl_seconds)),
+            max_ids=max(1, int(raw.get("max_ids", cls.max_ids))),
+            ack=bool(raw.get("ack", cls.ack)),
+        )
+
+
+class IdempotencyCache:
+    """
+    Command ids seen in the last ``ttl`` seconds, with the ack each one got.
+
+    Entries expire in insertion order (the TTL is fixed), so expiry and the
+    ``max_ids`` bound both pop from the front of one ordered dict and a
+    lookup is a single hash probe.
+    """
+
+    def __init__(self, ttl: float, max_ids: int, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_ids = max_ids
+        self.clock = clock
+        self._entries: "collections.OrderedDict[str, Tuple[float, Optional[Dict]]]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        entries = self._entries
+        while entries and next(iter(entries.values()))[0] <= now:
+            entries.popitem(last=False)
+
+    def check(self, command_id: str) -> Tuple[bool, Optional[Dict]]:
+        """``(seen, ack)``; an unseen id is remembered until ``remember`` stores its ack."""
+        now = self.clock()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(command_id)
+            if entry is not None:
+                return True, entry[1]
+            self._entries[command_id] = (now + self.ttl, None)
+            if len(self._entries) > self.max_ids:
+                self._entries.popitem(last=False)
+            return False, None
+
+    def remember(self, command_id: str, ack: Optional[Dict]):
+        with self._lock:
+            entry = self._entries.get(command_id)
+            if entry is not None:
+                self._entries[command_id] = (entry[0], ack)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+@dataclass
+class _Run:
+    cancel: bool = False
+    action: Optional[str] = None  # "start" or "extend" after merging
+    liters: float = 0.0
+    priority: int = 0
+    items: int = 0
+
+
+@dataclass
+class CommandBatch:
+    command_id: Optional[str]
+    ops: List[ScheduleOp] = field(default_factory=list)
+    accepted: List[Dict[str, Any]] = field(default_factory=list)  # one entry per parcel after merging
+    rejected: List[Dict[str, Any]] = field(default_factory=list)
+    duplicates: List[str] = field(default_factory=list)  # replayed item ids
+    items: int = 0
+    merged: int = 0  # items folded into another item's run
+
+    def ack(self) -> Dict[str, Any]:
+        return {
+            "id": self.command_id,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "duplicates": self.duplicates,
+            "merged": self.merged,
+        }
+
+
+def _item_error(item: Any, default_action: str, default_priority: int) -> Tuple[Optional[str], tuple]:
+    if not isinstance(item, dict):
+        return "not an object", ()
+    action = str(item.get("action", default_action))
+    if action not in ACTIONS:
+        return f"unknown action {action!r}", ()
+    try:
+        valve_id = str(item["parcel_id"])
+        liters = float(item["liters"]) if action != "cancel" else 0.0
+        priority = int(item.get("priority", default_priority))
+    except (KeyError, ValueError, TypeError):
+        return "needs parcel_id and numeric liters", ()
+    if not math.isfinite(liters) or liters < 0:
+        return "liters must be a non-negative number", ()
+    return None, (action, valve_id, liters, priority)
+
+
+def parse_batch(payload: Dict, valves: Dict[str, Valve], cache: Optional[IdempotencyCache] = None) -> CommandBatch:
+    """
+    One command message as scheduler operations.
+
+    A message is either a single ``{parcel_id, liters, action?, priority?, id?}``
+    or a batch ``{id?, action?, priority?, commands: [...]}`` whose items take
+    the same fields (top-level ``action``/``priority`` are their defaults).
+    Items for the same parcel are merged in order into one run: liters add
+    up, the highest priority wins, and a ``cancel`` discards what came before
+    it. Starts in batches and id'd messages become ``top_up`` operations, so
+    they extend a run that is already open instead of being dropped as a
+    duplicate; item ids already in ``cache`` are skipped.
+    """
+    command_id = payload.get("id")
+    batch = CommandBatch(command_id=None if command_id is None else str(command_id))
+    items = payload.get("commands")
+    is_batch = isinstance(items, list)
+    if not is_batch:
+        items = [payload]
+    default_action = str(payload.get("action", "start")) if is_batch else "start"
+    default_priority = payload.get("priority", 0) if is_batch else 0
+    start_op = "top_up" if is_batch or batch.command_id is not None else "start"
+    runs: Dict[str, _Run] = {}
+    for index, item in enumerate(items):
+        batch.items += 1
+        error, parsed = _item_error(item, default_action, default_priority)
+        if error is None and parsed[1] not in valves:
+            error = f"unknown parcel {parsed[1]!r}"
+        if error is not None:
+            batch.rejected.append({"index": index, "parcel_id": _field(item, "parcel_id"), "error": error})
+            continue
+        item_id = item.get("id") if is_batch else None
+        if item_id is not None and cache is not None and cache.check(str(item_id))[0]:
+            batch.duplicates.append(str(item_id))
+            continue
+        action, valve_id, liters, priority = parsed
+        run = runs.setdefault(valve_id, _Run())
+        batch.merged += run.items > 0
+        run.items += 1
+        if action == "cancel":
+            run.cancel, run.action, run.liters, run.priority = True, None, 0.0, 0
+            continue
+        run.liters += liters
+        run.priority = max(run.priority, priority) if run.action else priority
+        run.action = "start" if action == "start" or run.action == "start" else "extend"
+
+    for valve_id, run in runs.items():
+        valve = valves[valve_id]
+        seconds = run.liters / valve.flow_lpm * 60.0
+        if run.cancel:
+            batch.ops.append(("cancel", valve_id, 0.0, 0))
+        if run.action is not None:
+            batch.ops.append((start_op if run.action == "start" else "extend", valve_id, seconds, run.priority))
+        batch.accepted.append(
+            {
+                "parcel_id": valve_id,
+                "action": run.action or "cancel",
+                "cancel": run.cancel,
+                "liters": round(run.liters, 3),
+                "seconds": round(seconds, 1),
+            }
+        )
+    return batch
+
+
+def _field(item: Any, name: str) -> Any:
+    return item.get(name) if isinstance(item, dict) else None
@@ -1,96 +1,294 @@
-import json
 import logging
 import threading
 import time
+import weakref
 from datetime import datetime, timezone
-from typing import Dict, Optional
+from typing import Callable, Dict, Optional
 
-from ..utils.gpio import GPIOAdapter, Valve, load_valves
+from ..utils import metrics
+from ..utils.gpio import GPIOAdapter, Valve
+from ..utils.history import HistoryStore
 from ..utils.mqtt_client import MQTTClient
+from ..utils.settings import ConfigError, IrrigationSettings, Settings
+from .commands import CommandSettings, IdempotencyCache, parse_batch
+from .scheduler import ValveScheduler
+from .status import StatusPublisher
+
+_COMMANDS = metrics.counter("irrigation_commands_total", "Irrigation commands received, by action.")
+_VALVE_CHANGES = metrics.counter("irrigation_valve_changes_total", "Valve open/close transitions.")
+_PLANNED_LITERS = metrics.counter("irrigation_planned_liters_total", "Liters scheduled by the NDVI planner.")
+# Valve gauges sum over every live controller rather than reporting whichever one was built last.
+_CONTROLLERS: "weakref.WeakSet[IrrigationController]" = weakref.WeakSet()
+metrics.gauge(
+    "irrigation_valves_active",
+    "Valves currently open.",
+    fn=lambda: sum(len(controller.scheduler.active()) for controller in list(_CONTROLLERS)),
+)
+metrics.gauge(
+    "irrigation_valves_queued",
+    "Valve requests waiting for a free slot.",
+    fn=lambda: sum(controller._queued_count() for controller in list(_CONTROLLERS)),
+)
 
 
 class IrrigationController:
-    def __init__(self, config: dict, mqtt_client: MQTTClient, gpio: GPIOAdapter):
+    def __init__(
+        self, config: dict, mqtt_client: MQTTClient, gpio: GPIOAdapter, settings: Optional[Settings] = None
+    ):
         self.config = config
-        self.topics = config["mqtt"]["topics"]
-        self.valves: Dict[str, Valve] = load_valves(config["irrigation"]["valves"])
+        self.settings = settings or Settings.compile(config)
+        irrigation = self.settings.irrigation
+        if irrigation is None:
+            raise ConfigError(["irrigation section is required"])
+        self.topics = self.settings.topics
         self.gpio = gpio
         self.mqtt = mqtt_client
-        self._active_threads: Dict[str, threading.Thread] = {}
-        self._lock = threading.Lock()
-        for valve in self.valves.values():
-            self.gpio.setup_output(valve.gpio_pin)
+        self.history = HistoryStore.from_config(config.get("history"))
+        self.valves: Dict[str, Valve] = {}
+        self.valves = self._valve_table(irrigation)
+        self.scheduler = ValveScheduler(
+            self.valves,
+            self.gpio,
+            max_parallel=irrigation.max_parallel_valves,
+            on_change=self._on_valve_change,
+        )
+        self.status = StatusPublisher(
+            mqtt_client,
+            self.topics.irrigation_status,
+            self.valves,
+            queued=self.scheduler.queued,
+            coalesce_seconds=irrigation.status_coalesce_seconds,
+            heartbeat_seconds=irrigation.publish_interval_seconds,
+        )
+        irrigation_cfg = config["irrigation"]
+        self.command_settings = CommandSettings.from_config(irrigation_cfg.get("commands"))
+        self.seen = IdempotencyCache(self.command_settings.dedup_ttl_seconds, self.command_settings.max_ids)
+        self.planner = None
+        planner_cfg = irrigation_cfg.get("planner") or {}
+        if planner_cfg.get("enabled", False):
+            # Imported only when planning is on: it is the one irrigation module that needs NumPy.
+            from .planner import IrrigationPlanner, PlannerSettings
+
+            self.planner = IrrigationPlanner(
+                self.valves, self.scheduler.max_parallel, PlannerSettings.from_config(planner_cfg)
+            )
+        self._plan_lock = threading.Lock()
+        self._plan_due: Optional[float] = None
+        self._last_plan = float("-inf")
+        self.plan_wakeup: Optional[Callable[[], None]] = None  # notifier for non-thread drivers
+        self._subscribed: Dict[str, Callable[[dict], None]] = {}  # topic -> handler, for subscriptions made by start()
+        _CONTROLLERS.add(self)
+
+    def _valve_table(self, irrigation: IrrigationSettings) -> Dict[str, Valve]:
+        """Valves for ``irrigation.valves``; a valve keeps its ``Valve`` (and open state) when its id and pin match."""
+        table: Dict[str, Valve] = {}
+        for spec in irrigation.valves:
+            valve = self.valves.get(spec.valve_id)
+            if valve is None or valve.gpio_pin != spec.gpio_pin:
+                valve = Valve(valve_id=spec.valve_id, gpio_pin=spec.gpio_pin, flow_lpm=spec.flow_lpm)
+                self.gpio.setup_output(valve.gpio_pin)
+            else:
+                valve.flow_lpm = spec.flow_lpm
+            table[spec.valve_id] = valve
+        return table
+
+    def apply_settings(self, config: dict, settings: Settings):
+        """
+        Swap in a reloaded config without a restart: valve table, parallelism,
+        status topic and timings, command dedup, planner settings and the
+        command topic (re-subscribed when ``start`` owns the subscription).
+        Runs on valves whose id and pin are unchanged carry on; a removed or
+        re-pinned valve is closed. Commands are validated against the new
+        table as soon as this returns.
+        """
+        irrigation = settings.irrigation
+        if irrigation is None:
+            raise ConfigError(["irrigation section is required"])
+        valves = self._valve_table(irrigation)
+        self.scheduler.reconfigure(valves, irrigation.max_parallel_valves)
+        self.status.reconfigure(
+            settings.topics.irrigation_status,
+            valves,
+            irrigation.status_coalesce_seconds,
+            irrigation.publish_interval_seconds,
+        )
+        old_topics = self.topics
+        self.config, self.settings, self.topics, self.valves = config, settings, settings.topics, valves
+        self.command_settings = CommandSettings.from_config(config["irrigation"].get("commands"))
+        self.seen.ttl, self.seen.max_ids = self.command_settings.dedup_ttl_seconds, self.command_settings.max_ids
+        if self.planner is not None:
+            from .planner import PlannerSettings
+
+            planner_settings = PlannerSettings.from_config(config["irrigation"].get("planner"))
+            if planner_settings is not None:
+                with self._plan_lock:
+                    self.planner.reconfigure(valves, irrigation.max_parallel_valves, planner_settings)
+        moves = [(old_topics.irrigation_command, self.topics.irrigation_command)]
+        if self.planner is not None:
+            moves.append((old_topics.parcel_analysis, self.topics.parcel_analysis))
+        for old_topic, topic in moves:
+            if old_topic == topic:
+                continue
+            handler = self._subscribed.pop(old_topic, None)
+            if handler is None:
+                # Subscribed by another runtime (e.g. `serve`), which only subscribes at startup.
+                logging.warning("Irrigation topic %s -> %s takes effect after a restart.", old_topic, topic)
+                continue
+            self.mqtt.unsubscribe(old_topic)
+            self._subscribe(topic, handler)
+            logging.info("Irrigation controller moved from %s to %s", old_topic, topic)
+        logging.info(
+            "Irrigation settings applied: %d valve(s), %d in parallel", len(valves), irrigation.max_parallel_valves
+        )
+
+    def _subscribe(self, topic: str, handler: Callable[[dict], None]):
+        self._subscribed[topic] = handler
+        self.mqtt.subscribe(topic, handler)
+
+    def _queued_count(self) -> int:
+        return len(self.scheduler.queued())
+
+    @property
+    def parcel_topic(self) -> str:
+        return self.topics.parcel_analysis
 
     def _publish_status(self):
-        status = {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "valves": {
-                valve_id: {
-                    "is_open": valve._is_open,
-                    "last_opened_at": valve._last_opened_at,
-                    "last_closed_at": valve._last_closed_at,
-                }
-                for valve_id, valve in self.valves.items()
-            },
-        }
-        logging.debug("Publishing valve status to %s", self.topics["irrigation_status"])
-        self.mqtt.publish(self.topics["irrigation_status"], status, retain=False)
-
-    def _run_valve(self, valve: Valve, seconds: float):
-        try:
-            valve.open_for_seconds(self.gpio, seconds)
-        finally:
-            with self._lock:
-                self._active_threads.pop(valve.valve_id, None)
-            self._publish_status()
+        """Request a full status snapshot (sent from the status thread)."""
+        self.status.request_snapshot()
 
-    def _start_valve_thread(self, valve: Valve, seconds: float):
-        with self._lock:
-            if len(self._active_threads) >= int(self.config["irrigation"]["max_parallel_valves"]):
-                logging.warning("Reached max_parallel_valves. Ignoring request for %s", valve.valve_id)
-                return
-            if valve.valve_id in self._active_threads:
-                logging.info("Valve %s already active; skipping duplicate command.", valve.valve_id)
+    def _on_valve_change(self, valve_id: str):
+        _VALVE_CHANGES.inc()
+        self.status.mark_dirty(valve_id)
+        if self.history is not None:
+            # The scheduler's table: a valve closed by a reload is no longer in ``self.valves``.
+            self._record_valve(self.scheduler.valves[valve_id])
+
+    def _record_valve(self, valve: Valve):
+        prefix = f"valve.{valve.valve_id}"
+        if valve._is_open:
+            self.history.record(valve._last_opened_at, {f"{prefix}.open": 1.0})
+            return
+        values = {f"{prefix}.open": 0.0}
+        if valve._last_opened_at is not None:
+            # Rollup sums of these give run time and water per hour/day.
+            seconds = max(0.0, valve._last_closed_at - valve._last_opened_at)
+            values[f"{prefix}.seconds"] = seconds
+            values[f"{prefix}.liters"] = seconds * valve.flow_lpm / 60.0
+        self.history.record(valve._last_closed_at, values)
+
+    # NDVI planner ---------------------------------------------------------------
+    def _handle_parcels(self, payload: dict):
+        """Fold a per-parcel NDVI analysis into the planner and schedule a re-plan."""
+        if self.planner is None or not isinstance(payload, dict) or not isinstance(payload.get("parcels"), dict):
+            return
+        try:
+            timestamp = datetime.fromisoformat(payload["timestamp"]).timestamp()
+        except (KeyError, TypeError, ValueError):
+            timestamp = time.time()
+        with self._plan_lock:
+            if not self.planner.update(payload["parcels"], timestamp):
                 return
-            thread = threading.Thread(target=self._run_valve, args=(valve, seconds), daemon=True)
-            self._active_threads[valve.valve_id] = thread
-            thread.start()
-            logging.info("Started irrigation thread for %s (%.1fs)", valve.valve_id, seconds)
+            # Analyses arriving within min_replan_seconds are folded into one plan.
+            due = max(time.monotonic(), self._last_plan + self.planner.settings.min_replan_seconds)
+            self._plan_due = due if self._plan_due is None else min(self._plan_due, due)
+        if self.plan_wakeup:
+            self.plan_wakeup()
+
+    def process_plan(self, now: Optional[float] = None) -> Optional[float]:
+        """Run a due re-plan and hand it to the scheduler; return when the next one is due."""
+        now = time.monotonic() if now is None else now
+        with self._plan_lock:
+            if self._plan_due is None or now < self._plan_due:
+                return self._plan_due
+            self._plan_due = None
+            self._last_plan = now
+            plan = self.planner.plan()
+            self.planner.commit(plan)
+        if not plan.entries:
+            return None
+        # top_up extends a run that is already open or queued instead of being skipped as a duplicate.
+        self.scheduler.submit([("top_up", e.parcel_id, e.seconds, e.priority) for e in plan.entries])
+        _PLANNED_LITERS.inc(plan.liters)
+        payload = {"timestamp": datetime.now(timezone.utc).isoformat(), **plan.to_payload()}
+        self.mqtt.publish(self.topics.irrigation_plan, payload)
+        return None
+
+    def _publish_ack(self, ack: Dict):
+        self.mqtt.publish(self.topics.irrigation_ack, {"timestamp": datetime.now(timezone.utc).isoformat(), **ack})
 
     def _handle_command(self, payload: dict):
-        try:
-            valve_id = payload["parcel_id"]
-            liters = float(payload["liters"])
-        except (KeyError, ValueError, TypeError):
+        """Apply a single command or a batch (see ``commands.parse_batch``) with one scheduler wakeup."""
+        if not isinstance(payload, dict):
+            _COMMANDS.inc(action="invalid")
             logging.error("Invalid irrigation command payload: %s", payload)
             return
-        valve: Optional[Valve] = self.valves.get(str(valve_id))
-        if not valve:
-            logging.error("Unknown valve/parcel id %s", valve_id)
+        if payload.get("action") == "status" and "commands" not in payload:
+            _COMMANDS.inc(action="status")
+            self._publish_status()
             return
-        seconds = (liters / valve.flow_lpm) * 60.0
-        logging.info(
-            "Received irrigation command parcel=%s liters=%.2f -> duration=%.1fs",
-            valve_id,
-            liters,
-            seconds,
-        )
-        self._start_valve_thread(valve, seconds)
+        command_id = payload.get("id")
+        if command_id is not None:
+            seen, ack = self.seen.check(str(command_id))
+            if seen:
+                _COMMANDS.inc(action="duplicate")
+                logging.info("Dropping replayed irrigation command %s", command_id)
+                if ack is not None:
+                    self._publish_ack({**ack, "duplicate": True})
+                return
+        batch = parse_batch(payload, self.valves, self.seen)
+        self.scheduler.submit(batch.ops)
+        for entry in batch.accepted:
+            _COMMANDS.inc(action=entry["action"])
+        if batch.rejected:
+            _COMMANDS.inc(len(batch.rejected), action="invalid")
+        if batch.duplicates:
+            _COMMANDS.inc(len(batch.duplicates), action="duplicate")
 
-    def _status_loop(self):
-        interval = float(self.config["irrigation"]["publish_interval_seconds"])
-        while True:
-            self._publish_status()
-            time.sleep(interval)
+        is_batch = "commands" in payload
+        if not is_batch and batch.rejected:
+            logging.error("Invalid irrigation command (%s): %s", batch.rejected[0]["error"], payload)
+        elif not is_batch and batch.accepted:
+            entry = batch.accepted[0]
+            logging.info(
+                "Received irrigation %s parcel=%s liters=%.2f -> %.1fs",
+                entry["action"],
+                entry["parcel_id"],
+                entry["liters"],
+                entry["seconds"],
+            )
+        else:
+            logging.info(
+                "Irrigation batch %s: %d command(s) -> %d parcel run(s), %d merged, %d rejected, %d replayed",
+                batch.command_id,
+                batch.items,
+                len(batch.accepted),
+                batch.merged,
+                len(batch.rejected),
+                len(batch.duplicates),
+            )
+        if is_batch or command_id is not None:
+            ack = batch.ack()
+            if command_id is not None:
+                self.seen.remember(str(command_id), ack)
+            if self.command_settings.ack:
+                self._publish_ack(ack)
 
     def start(self):
-        self.mqtt.subscribe(self.topics["irrigation_command"], self._handle_command)
+        self.scheduler.start()
+        self._subscribe(self.topics.irrigation_command, self._handle_command)
+        if self.planner is not None:
+            self._subscribe(self.parcel_topic, self._handle_parcels)
+            logging.info("Irrigation planner following %s", self.parcel_topic)
         self.mqtt.loop_start()
-        status_thread = threading.Thread(target=self._status_loop, daemon=True)
-        status_thread.start()
-        logging.info("Irrigation controller started. Awaiting MQTT commands on %s", self.topics["irrigation_command"])
+        self.status.start()
+        logging.info("Irrigation controller started. Awaiting MQTT commands on %s", self.topics.irrigation_command)
         try:
             while True:
                 time.sleep(1)
+                if self.planner is not None:
+                    self.process_plan()
         except KeyboardInterrupt:
             logging.info("Stopping irrigation controller...")
+        finally:
+            self.scheduler.stop()
+            self.status.stop()
@@ -0,0 +1,215 @@
+# NDVI-driven irrigation planning: per-parcel need, water-budget allocation and valve slot packing.
+import heapq
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..utils.gpio import Valve
+
+
+@dataclass
+class PlannerSettings:
+    budget_liters: float = 200.0  # per period, across all parcels
+    period_hours: float = 24.0
+    max_liters_per_parcel: float = 60.0  # demand at full need
+    min_liters: float = 1.0  # smaller allocations are not worth opening a valve for
+    stress_weight: float = 0.7
+    ndvi_weight: float = 0.3
+    ndvi_target: float = 0.6
+    stale_hours: float = 48.0  # parcels without a recent analysis are not watered
+    min_replan_seconds: float = 60.0
+
+    @classmethod
+    def from_config(cls, raw: Optional[dict]) -> Optional["PlannerSettings"]:
+        raw = raw or {}
+        if not raw.get("enabled", False):
+            return None
+        return cls(**{name: float(raw.get(name, getattr(cls, name))) for name in cls.__dataclass_fields__})
+
+
+@dataclass
+class PlanEntry:
+    parcel_id: str
+    liters: float
+    seconds: float
+    slot: int  # valve slot (0 .. max_parallel - 1) in the packed schedule
+    start_offset: float  # seconds after the plan starts, if every run takes its nominal time
+    priority: int  # scheduler priority realizing the packing (below manual commands at 0)
+
+
+@dataclass
+class Plan:
+    entries: List[PlanEntry] = field(default_factory=list)
+    makespan_seconds: float = 0.0
+    liters: float = 0.0
+    budget_left: float = 0.0
+
+    def to_payload(self) -> Dict:
+        return {
+            "makespan_seconds": round(self.makespan_seconds, 1),
+            "liters": round(self.liters, 2),
+            "budget_left_liters": round(self.budget_left, 2),
+            "entries": [
+                {
+                    "parcel_id": e.parcel_id,
+                    "liters": round(e.liters, 2),
+                    "seconds": round(e.seconds, 1),
+                    "slot": e.slot,
+                    "start_offset": round(e.start_offset, 1),
+                }
+                for e in self.entries
+            ],
+        }
+
+
+def allocate(demand: np.ndarray, need: np.ndarray, flow_lpm: np.ndarray, budget: float, min_liters: float):
+    """
+    Liters per parcel under ``budget``: a greedy fractional knapsack.
+
+    Watering is divisible, so taking parcels by need (the value per liter),
+    with faster valves first among equal needs, and cutting the last one
+    short is optimal. The cut-off is a cumulative sum over the sorted demand,
+    so the whole allocation is a handful of array operations.
+    """
+    order = np.lexsort((-flow_lpm, -need))
+    sorted_demand = demand[order]
+    before = np.cumsum(sorted_demand) - sorted_demand
+    granted = np.clip(budget - before, 0.0, sorted_demand)
+    granted[granted < min_liters] = 0.0
+    liters = np.zeros_like(demand)
+    liters[order] = granted
+    return liters
+
+
+def pack_slots(seconds: Sequence[float], slots: int) -> Tuple[List[int], List[float], float]:
+    """
+    Longest-processing-time-first packing of runs onto ``slots`` parallel valves.
+
+    Returns (slot, start offset) per run and the makespan; LPT is within
+    4/3 of the optimal makespan. Feeding the runs to ``ValveScheduler`` in
+    the same order (as descending priorities) reproduces it, since the
+    scheduler starts the highest-priority waiting run whenever a slot frees.
+    """
+    heap = [(0.0, slot) for slot in range(max(1, slots))]
+    assigned_slot = [0] * len(seconds)
+    offsets = [0.0] * len(seconds)
+    for idx in sorted(range(len(seconds)), key=lambda i: -seconds[i]):
+        free_at, slot = heapq.heappop(heap)
+        assigned_slot[idx], offsets[idx] = slot, free_at
+        heapq.heappush(heap, (free_at + seconds[idx], slot))
+    return assigned_slot, offsets, max(free_at for free_at, _ in heap)
+
+
+class IrrigationPlanner:
+    """
+    Keeps per-parcel NDVI state in arrays indexed by valve and turns it into
+    watering plans.
+
+    ``update`` folds a parcel analysis into only the rows it mentions and
+    recomputes their need; ``plan`` allocates what is left of the period's
+    budget to what is left of each parcel's demand (liters already committed
+    this period are subtracted), so each re-plan only adds the difference
+    instead of re-issuing the whole schedule.
+    """
+
+    def __init__(self, valves: Dict[str, Valve], max_parallel: int, settings: PlannerSettings):
+        self.settings = settings
+        self.max_parallel = max(1, int(max_parallel))
+        self.ids = list(valves)
+        self._index = {parcel_id: idx for idx, parcel_id in enumerate(self.ids)}
+        n = len(self.ids)
+        self.flow_lpm = np.array([valves[parcel_id].flow_lpm for parcel_id in self.ids], dtype=np.float64)
+        self.stress = np.zeros(n)
+        self.mean = np.full(n, np.nan)
+        self.seen_at = np.full(n, -np.inf)
+        self.need = np.zeros(n)
+        self.committed = np.zeros(n)  # liters planned for each parcel this period
+        self._period_start = time.time()
+
+    def reconfigure(self, valves: Dict[str, Valve], max_parallel: int, settings: PlannerSettings):
+        """Adopt a reloaded valve table and settings; parcels that remain keep their NDVI state and committed liters."""
+        old = {name: getattr(self, name) for name in ("stress", "mean", "seen_at", "need", "committed")}
+        old_index = self._index
+        self.settings = settings
+        self.max_parallel = max(1, int(max_parallel))
+        self.ids = list(valves)
+        self._index = {parcel_id: idx for idx, parcel_id in enumerate(self.ids)}
+        self.flow_lpm = np.array([valves[parcel_id].flow_lpm for parcel_id in self.ids], dtype=np.float64)
+        kept = [(idx, old_index[parcel_id]) for idx, parcel_id in enumerate(self.ids) if parcel_id in old_index]
+        new_rows = np.array([new for new, _ in kept], dtype=np.intp)
+        old_rows = np.array([prev for _, prev in kept], dtype=np.intp)
+        fill = {"stress": 0.0, "mean": np.nan, "seen_at": -np.inf, "need": 0.0, "committed": 0.0}
+        for name, values in old.items():
+            resized = np.full(len(self.ids), fill[name])
+            resized[new_rows] = values[old_rows]
+            setattr(self, name, resized)
+
+    def update(self, parcels: Dict[str, Dict], timestamp: Optional[float] = None) -> int:
+        """Fold one ``parcel_analysis`` payload in; returns how many known parcels it updated."""
+        timestamp = time.time() if timestamp is None else timestamp
+        rows = [
+            (self._index[parcel_id], stats)
+            for parcel_id, stats in parcels.items()
+            if parcel_id in self._index and stats.get("pixels") and stats.get("mean") is not None
+        ]
+        if not rows:
+            return 0
+        idx = np.array([row for row, _ in rows])
+        self.stress[idx] = [float(stats.get("stress_ratio") or 0.0) for _, stats in rows]
+        self.mean[idx] = [float(stats["mean"]) for _, stats in rows]
+        self.seen_at[idx] = timestamp
+        s = self.settings
+        deficit = np.clip(s.ndvi_target - self.mean[idx], 0.0, None) / max(s.ndvi_target, 1e-6)
+        self.need[idx] = np.clip(s.stress_weight * self.stress[idx] + s.ndvi_weight * deficit, 0.0, 1.0)
+        return len(rows)
+
+    def _roll_period(self, now: float):
+        period = self.settings.period_hours * 3600.0
+        if now - self._period_start >= period:
+            self._period_start += period * ((now - self._period_start) // period)
+            self.committed[:] = 0.0
+
+    def plan(self, now: Optional[float] = None) -> Plan:
+        """Allocate the remaining budget; the result still has to be ``commit``-ed once applied."""
+        now = time.time() if now is None else now
+        self._roll_period(now)
+        s = self.settings
+        fresh = self.seen_at >= now - s.stale_hours * 3600.0
+        demand = np.where(fresh, np.clip(self.need * s.max_liters_per_parcel - self.committed, 0.0, None), 0.0)
+        budget_left = max(0.0, s.budget_liters - float(self.committed.sum()))
+        liters = allocate(demand, self.need, self.flow_lpm, budget_left, s.min_liters)
+        chosen = np.flatnonzero(liters)
+        seconds = (liters[chosen] / self.flow_lpm[chosen] * 60.0).tolist()
+        slots, offsets, makespan = pack_slots(seconds, self.max_parallel)
+        by_length = sorted(range(len(chosen)), key=lambda i: -seconds[i])
+        rank = {i: position for position, i in enumerate(by_length)}
+        entries = [
+            PlanEntry(
+                parcel_id=self.ids[row],
+                liters=float(liters[row]),
+                seconds=seconds[i],
+                slot=slots[i],
+                start_offset=offsets[i],
+                priority=-1 - rank[i],
+            )
+            for i, row in enumerate(chosen)
+        ]
+        entries.sort(key=lambda e: e.priority, reverse=True)
+        total = float(liters.sum())
+        return Plan(entries=entries, makespan_seconds=makespan, liters=total, budget_left=max(0.0, budget_left - total))
+
+    def commit(self, plan: Plan):
+        for entry in plan.entries:
+            self.committed[self._index[entry.parcel_id]] += entry.liters
+        if plan.entries:
+            logging.info(
+                "Irrigation plan: %d run(s), %.1f L, %.0fs makespan, %.1f L budget left",
+                len(plan.entries),
+                plan.liters,
+                plan.makespan_seconds,
+                plan.budget_left,
+            )
+
@@ -0,0 +1,236 @@
+# Single-threaded valve scheduler: one deadline heap drives every valve.
+import collections
+import heapq
+import itertools
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from ..utils.gpio import GPIOAdapter, Valve
+
+
+@dataclass(order=True)
+class _Request:
+    sort_priority: int  # negated priority so higher priorities pop first
+    seq: int  # FIFO among equal priorities
+    valve_id: str = field(compare=False)
+    seconds: float = field(compare=False)
+
+
+class ValveScheduler:
+    """
+    Drives all valves from a single thread.
+
+    Open valves are tracked as close deadlines in a heap; requests beyond
+    ``max_parallel`` wait in a priority queue (FIFO within a priority) instead
+    of being dropped. ``request``, ``cancel`` and ``extend`` only enqueue a
+    command and wake the scheduler, so GPIO writes never run on the caller's
+    (e.g. MQTT callback) thread. ``process`` holds the scheduling logic and
+    returns the next deadline, so other runtimes can drive it without the
+    built-in thread.
+    """
+
+    def __init__(
+        self,
+        valves: Dict[str, Valve],
+        gpio: GPIOAdapter,
+        max_parallel: int,
+        on_change: Optional[Callable[[str], None]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.valves = valves
+        self.gpio = gpio
+        self.max_parallel = max(1, int(max_parallel))
+        self.on_change = on_change
+        self.clock = clock
+        self._cond = threading.Condition()
+        self._commands: Deque[Tuple[str, str, float, int]] = collections.deque()
+        self._running: Dict[str, float] = {}  # valve_id -> close deadline
+        self._deadlines: List[Tuple[float, str]] = []
+        self._pending: List[_Request] = []
+        self._pending_ids: Dict[str, _Request] = {}
+        self._seq = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self._reconfig: Optional[Tuple[Dict[str, Valve], int]] = None
+        self.wakeup: Optional[Callable[[], None]] = None  # extra notifier for non-thread drivers
+
+    # Thread-safe command API -------------------------------------------------
+    def _enqueue(self, action: str, valve_id: str, seconds: float = 0.0, priority: int = 0):
+        with self._cond:
+            self._commands.append((action, valve_id, seconds, priority))
+            self._cond.notify()
+        if self.wakeup:
+            self.wakeup()
+
+    def submit(self, commands: Sequence[Tuple[str, str, float, int]]):
+        """Queue several ``(action, valve_id, seconds, priority)`` commands with one lock and one wakeup."""
+        if not commands:
+            return
+        with self._cond:
+            self._commands.extend(commands)
+            self._cond.notify()
+        if self.wakeup:
+            self.wakeup()
+
+    def request(self, valve_id: str, seconds: float, priority: int = 0):
+        """Open ``valve_id`` for ``seconds`` as soon as a parallel slot is free."""
+        self._enqueue("start", valve_id, seconds, priority)
+
+    def cancel(self, valve_id: str):
+        """Close a running valve now, or drop it from the queue."""
+        self._enqueue("cancel", valve_id)
+
+    def top_up(self, valve_id: str, seconds: float, priority: int = 0):
+        """Extend a running or queued run of ``valve_id``, or request a new one."""
+        self._enqueue("top_up", valve_id, seconds, priority)
+
+    def extend(self, valve_id: str, seconds: float):
+        """Push back the close deadline of a running (or queued) irrigation."""
+        self._enqueue("extend", valve_id, seconds)
+
+    def reconfigure(self, valves: Dict[str, Valve], max_parallel: int):
+        """
+        Swap in a new valve table and parallel limit at the start of the next
+        ``process``, ahead of the queued commands. Runs on valves that are
+        kept (same ``Valve`` object) continue untouched; valves that were
+        removed or replaced are closed and their queued runs dropped.
+        """
+        with self._cond:
+            self._reconfig = (valves, max(1, int(max_parallel)))
+            self._cond.notify()
+        if self.wakeup:
+            self.wakeup()
+
+    # Scheduling core (scheduler thread only) ---------------------------------
+    def _notify(self, valve_id: str):
+        if self.on_change:
+            try:
+                self.on_change(valve_id)
+            except Exception as exc:
+                logging.error("Valve change callback failed for %s: %s", valve_id, exc)
+
+    def _open(self, valve_id: str, seconds: float, now: float):
+        valve = self.valves[valve_id]
+        valve.open(self.gpio)
+        deadline = now + max(0.0, seconds)
+        self._running[valve_id] = deadline
+        heapq.heappush(self._deadlines, (deadline, valve_id))
+        logging.info("Opened valve %s for %.1fs (%d active)", valve_id, seconds, len(self._running))
+        self._notify(valve_id)
+
+    def _close(self, valve_id: str):
+        self._running.pop(valve_id, None)
+        self.valves[valve_id].close(self.gpio)
+        self._notify(valve_id)
+
+    def _apply(self, action: str, valve_id: str, seconds: float, priority: int, now: float):
+        if valve_id not in self.valves:
+            logging.error("Scheduler: unknown valve %s", valve_id)
+            return
+        if action == "top_up":
+            active = valve_id in self._running or valve_id in self._pending_ids
+            action = "extend" if active else "start"
+        if action == "start":
+            if valve_id in self._running or valve_id in self._pending_ids:
+                logging.info("Valve %s already active or queued; skipping duplicate command.", valve_id)
+                return
+            req = _Request(-priority, next(self._seq), valve_id, seconds)
+            heapq.heappush(self._pending, req)
+            self._pending_ids[valve_id] = req
+        elif action == "cancel":
+            if valve_id in self._running:
+                logging.info("Cancelling irrigation on %s", valve_id)
+                self._close(valve_id)
+            elif self._pending_ids.pop(valve_id, None) is not None:
+                # Lazy removal: the heap entry is skipped when popped.
+                logging.info("Removed queued irrigation for %s", valve_id)
+        elif action == "extend":
+            if valve_id in self._running:
+                deadline = self._running[valve_id] + seconds
+                self._running[valve_id] = deadline
+                heapq.heappush(self._deadlines, (deadline, valve_id))
+                logging.info("Extended irrigation on %s by %.1fs", valve_id, seconds)
+            elif valve_id in self._pending_ids:
+                self._pending_ids[valve_id].seconds += seconds
+            else:
+                logging.warning("Cannot extend %s: no running or queued irrigation.", valve_id)
+
+    def _swap_valves(self, valves: Dict[str, Valve], max_parallel: int):
+        for valve_id in list(self._running):
+            if valves.get(valve_id) is not self.valves[valve_id]:
+                logging.warning("Valve %s removed or re-pinned by a config reload; closing it.", valve_id)
+                self._close(valve_id)
+        for valve_id in [valve_id for valve_id in self._pending_ids if valve_id not in valves]:
+            logging.warning("Dropping queued irrigation for %s: valve removed by a config reload.", valve_id)
+            del self._pending_ids[valve_id]
+        self.valves = valves
+        self.max_parallel = max_parallel
+
+    def process(self, now: Optional[float] = None) -> Optional[float]:
+        """Apply queued commands, close expired valves, start waiting requests; return the next deadline."""
+        now = self.clock() if now is None else now
+        with self._cond:
+            commands = list(self._commands)
+            self._commands.clear()
+            reconfig, self._reconfig = self._reconfig, None
+        if reconfig is not None:
+            self._swap_valves(*reconfig)
+        for action, valve_id, seconds, priority in commands:
+            self._apply(action, valve_id, seconds, priority, now)
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, valve_id = heapq.heappop(self._deadlines)
+            if self._running.get(valve_id) == deadline:
+                self._close(valve_id)
+        while self._pending and len(self._running) < self.max_parallel:
+            req = heapq.heappop(self._pending)
+            if self._pending_ids.get(req.valve_id) is not req:
+                continue
+            del self._pending_ids[req.valve_id]
+            self._open(req.valve_id, req.seconds, now)
+        # Drop stale heads so the reported deadline is a real one.
+        while self._deadlines and self._running.get(self._deadlines[0][1]) != self._deadlines[0][0]:
+            heapq.heappop(self._deadlines)
+        return self._deadlines[0][0] if self._deadlines else None
+
+    def _loop(self):
+        while True:
+            next_deadline = self.process()
+            with self._cond:
+                if self._stopped:
+                    return
+                if self._commands or self._reconfig is not None:
+                    continue
+                timeout = None if next_deadline is None else max(0.0, next_deadline - self.clock())
+                self._cond.wait(timeout)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="valve-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the scheduler thread and close every open valve."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self.close_all()
+
+    def close_all(self):
+        for valve_id in list(self._running):
+            self._close(valve_id)
+        self._pending.clear()
+        self._pending_ids.clear()
+
+    # Introspection ----------------------------------------------------------
+    def active(self) -> Dict[str, float]:
+        """Seconds remaining per running valve."""
+        now = self.clock()
+        return {valve_id: max(0.0, deadline - now) for valve_id, deadline in list(self._running.items())}
+
+    def queued(self) -> List[str]:
+        return [req.valve_id for req in sorted(self._pending) if self._pending_ids.get(req.valve_id) is req]
@@ -0,0 +1,167 @@
+# Change-driven valve status publishing.
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Set
+
+from ..utils.gpio import Valve
+from ..utils.mqtt_client import MQTTClient
+
+
+def _valve_state(valve: Valve) -> dict:
+    return {
+        "is_open": valve._is_open,
+        "last_opened_at": valve._last_opened_at,
+        "last_closed_at": valve._last_closed_at,
+    }
+
+
+class StatusPublisher:
+    """
+    Publishes valve status only when something changed.
+
+    Each valve gets a retained message on ``<topic>/<valve_id>`` when its
+    state changes; changes arriving within ``coalesce_seconds`` of each other
+    go out as one burst. The full snapshot on ``<topic>`` is sent on a slow
+    heartbeat or on request, from a cached pre-encoded payload that is only
+    rebuilt after a change. Like ``ValveScheduler``, ``process`` can be driven
+    by another runtime instead of ``start``'s thread.
+    """
+
+    def __init__(
+        self,
+        mqtt_client: MQTTClient,
+        topic: str,
+        valves: Dict[str, Valve],
+        queued: Optional[Callable[[], List[str]]] = None,
+        coalesce_seconds: float = 0.2,
+        heartbeat_seconds: float = 60.0,
+    ):
+        self.mqtt = mqtt_client
+        self.topic = topic
+        self.valves = valves
+        self.queued = queued or (lambda: [])
+        self.coalesce_seconds = max(0.0, coalesce_seconds)
+        self.heartbeat_seconds = max(1.0, heartbeat_seconds)
+        self._cond = threading.Condition()
+        self._dirty: Set[str] = set()
+        self._dirty_since: Optional[float] = None
+        self._snapshot_requested = False
+        self._stopped = False
+        self._published: Dict[str, dict] = {}
+        self._snapshot: Optional[bytes] = None
+        self._changed_at = datetime.now(timezone.utc).isoformat()
+        self._next_heartbeat = time.monotonic()
+        self._thread: Optional[threading.Thread] = None
+        self.wakeup: Optional[Callable[[], None]] = None  # extra notifier for non-thread drivers
+
+    def mark_dirty(self, valve_id: str):
+        with self._cond:
+            if not self._dirty:
+                self._dirty_since = time.monotonic()
+            self._dirty.add(valve_id)
+            self._cond.notify()
+        if self.wakeup:
+            self.wakeup()
+
+    def request_snapshot(self):
+        with self._cond:
+            self._snapshot_requested = True
+            self._cond.notify()
+        if self.wakeup:
+            self.wakeup()
+
+    def _snapshot_bytes(self) -> bytes:
+        if self._snapshot is None:
+            status = {
+                "timestamp": self._changed_at,
+                "valves": {valve_id: _valve_state(valve) for valve_id, valve in self.valves.items()},
+                "queued": self.queued(),
+            }
+            self._snapshot = self.mqtt.codec.encode(status)
+        return self._snapshot
+
+    def _flush_dirty(self, dirty: Set[str]):
+        for valve_id in sorted(dirty):
+            valve = self.valves.get(valve_id)
+            if valve is None:
+                continue
+            state = _valve_state(valve)
+            if self._published.get(valve_id) == state:
+                continue
+            self._published[valve_id] = state
+            self._changed_at = datetime.now(timezone.utc).isoformat()
+            self._snapshot = None
+            logging.debug("Publishing status change for valve %s", valve_id)
+            self.mqtt.publish(f"{self.topic}/{valve_id}", dict(state, timestamp=self._changed_at), retain=True)
+        if dirty:
+            # The queue may have moved even when no valve state did.
+            self._snapshot = None
+
+    def _next_due(self) -> float:
+        if self._snapshot_requested:
+            return 0.0
+        deadlines = [self._next_heartbeat]
+        if self._dirty:
+            deadlines.append(self._dirty_since + self.coalesce_seconds)
+        return min(deadlines)
+
+    def process(self, now: Optional[float] = None) -> float:
+        """Publish whatever is due; return the monotonic time of the next due publish."""
+        now = time.monotonic() if now is None else now
+        with self._cond:
+            coalesce_due = self._dirty and now >= self._dirty_since + self.coalesce_seconds
+            dirty, self._dirty = (self._dirty, set()) if coalesce_due else (set(), self._dirty)
+            send_snapshot = self._snapshot_requested or now >= self._next_heartbeat
+            self._snapshot_requested = False
+        try:
+            self._flush_dirty(dirty)
+            if send_snapshot:
+                logging.debug("Publishing valve status snapshot to %s", self.topic)
+                self.mqtt.publish(self.topic, self._snapshot_bytes(), retain=False)
+        except Exception as exc:
+            logging.error("Valve status publish failed: %s", exc)
+        with self._cond:
+            if send_snapshot:
+                self._next_heartbeat = time.monotonic() + self.heartbeat_seconds
+            return self._next_due()
+
+    def _loop(self):
+        while True:
+            self.process()
+            with self._cond:
+                while not self._stopped and time.monotonic() < self._next_due():
+                    self._cond.wait(self._next_due() - time.monotonic())
+                if self._stopped:
+                    return
+
+    def start(self):
+        # Seed retained per-valve topics so late subscribers see the current state.
+        self.mark_dirty_all()
+        self._thread = threading.Thread(target=self._loop, name="valve-status", daemon=True)
+        self._thread.start()
+
+    def reconfigure(self, topic: str, valves: Dict[str, Valve], coalesce_seconds: float, heartbeat_seconds: float):
+        """Swap in a reloaded topic, valve table and timings; every valve is re-published on the next pass."""
+        with self._cond:
+            self.topic = topic
+            self.valves = valves
+            self.coalesce_seconds = max(0.0, coalesce_seconds)
+            self.heartbeat_seconds = max(1.0, heartbeat_seconds)
+            self._published = {}
+            self._snapshot = None
+            self._next_heartbeat = min(self._next_heartbeat, time.monotonic() + self.heartbeat_seconds)
+        self.mark_dirty_all()
+
+    def mark_dirty_all(self):
+        for valve_id in self.valves:
+            self.mark_dirty(valve_id)
+
+    def stop(self, timeout: float = 2.0):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
@@ -1,16 +1,26 @@
 import argparse
+import json
 import logging
 import pathlib
+import time
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Optional
 
-from .drone.autopilot import AutopilotClient
-from .drone.service import DroneService
-from .irrigation.controller import IrrigationController
+from .utils import profiling
 from .utils.config_loader import ConfigLoader
-from .utils.gpio import GPIOAdapter
-from .utils.mqtt_client import MQTTClient, MQTTSettings
 
+# Subcommands import what they use, so e.g. `irrigation` never loads NumPy/PIL and `--help` stays instant.
+if TYPE_CHECKING:
+    from .utils.metrics import MetricsPublisher
+    from .utils.mqtt_client import MQTTClient
+    from .utils.settings import ConfigWatcher, Settings
+
+
+def _build_mqtt(cfg: dict, client_id_suffix: str = "") -> "MQTTClient":
+    from .utils.codecs import PayloadCodec
+    from .utils.mqtt_client import MQTTClient, MQTTSettings
+    from .utils.spool import PublishSpool, SpoolSettings
 
-def _build_mqtt(cfg: dict, client_id_suffix: str = "") -> MQTTClient:
     mqtt_cfg = cfg["mqtt"]
     client_id = mqtt_cfg.get("client_id", "agriculture-drone")
     if client_id_suffix:
@@ -24,34 +34,405 @@ def _build_mqtt(cfg: dict, client_id_suffix: str = "") -> MQTTClient:
         keepalive=int(mqtt_cfg.get("keepalive", 60)),
         tls=bool(mqtt_cfg.get("tls", False)),
         cafile=mqtt_cfg.get("cafile"),
+        dispatch_workers=int(mqtt_cfg.get("dispatch", {}).get("workers", 2)),
+        dispatch_queue_size=int(mqtt_cfg.get("dispatch", {}).get("queue_size", 256)),
+    )
+    return MQTTClient(
+        settings,
+        codec=PayloadCodec.from_config(mqtt_cfg.get("payload")),
+        spool=PublishSpool(SpoolSettings.from_config(mqtt_cfg.get("spool"), client_id)),
     )
-    return MQTTClient(settings)
+
+
+def _metrics_publisher(cfg: dict, mqtt_client: "MQTTClient", source: str) -> Optional["MetricsPublisher"]:
+    """Start the /metrics endpoint when `metrics.enabled`; return the (not yet started) MQTT publisher, if any."""
+    from .utils.metrics import REGISTRY, MetricsPublisher, MetricsServer, MetricsSettings
+
+    settings = MetricsSettings.from_config(cfg.get("metrics"))
+    if not settings.enabled:
+        return None
+    if settings.http_port:
+        MetricsServer(REGISTRY, settings.http_host, settings.http_port).start()
+    if settings.publish_interval_seconds <= 0:
+        return None
+    topic = cfg["mqtt"]["topics"].get("metrics", "agriculture/metrics")
+    return MetricsPublisher(mqtt_client, topic, settings.publish_interval_seconds, source)
+
+
+def _compile(cfg: dict) -> "Settings":
+    """Typed settings for the services; an invalid config stops the command with every problem listed."""
+    from .utils.settings import ConfigError, Settings
+
+    try:
+        return Settings.compile(cfg)
+    except ConfigError as exc:
+        logging.error("%s", exc)
+        raise SystemExit(2)
+
+
+def _watch_config(args, cfg: dict, settings: "Settings", *services) -> Optional["ConfigWatcher"]:
+    """Hot-reload the config file into ``services`` (their ``apply_settings``) when `reload.enabled`."""
+    from .utils.settings import watch_config
+
+    listeners = [service.apply_settings for service in services if service is not None]
+    return watch_config(args.config, cfg, settings, listeners)
+
+
+def _submit_to_daemon(cfg: dict, args) -> bool:
+    """Hand the cycle to a running `daemon`; False when none is listening (the caller then runs it in-process)."""
+    from .daemon import DaemonSettings, DaemonUnavailable, submit
+
+    settings = DaemonSettings.from_config(cfg.get("daemon"))
+    request = {
+        "command": "drone-cycle",
+        # The daemon has its own working directory.
+        "rgb": str(pathlib.Path(args.rgb).resolve()),
+        "nir": str(pathlib.Path(args.nir).resolve()),
+        "exact": args.exact,
+    }
+    try:
+        reply = submit(args.socket or settings.socket, request, timeout=settings.request_timeout_seconds)
+    except DaemonUnavailable as exc:
+        logging.warning("Drone daemon unavailable (%s); running the cycle in-process.", exc)
+        return False
+    if not reply.get("ok"):
+        logging.error("Drone daemon failed the cycle: %s", reply.get("error"))
+        raise SystemExit(1)
+    ndvi = reply["ndvi"]
+    logging.info(
+        "Daemon NDVI mean=%.3f stress=%.1f%% in %.0f ms", ndvi["mean"], ndvi["stress_ratio"] * 100, reply["elapsed_ms"]
+    )
+    return True
 
 
 def run_drone(args):
     cfg = ConfigLoader(args.config).data
+    if args.daemon and _submit_to_daemon(cfg, args):
+        return
+    from .drone.autopilot import AutopilotClient
+    from .drone.service import DroneService
+
+    settings = _compile(cfg)
     mqtt_client = _build_mqtt(cfg, client_id_suffix="drone")
     mqtt_client.loop_start()
     autopilot = AutopilotClient(cfg["drone"]["autopilot_connection"], wait_ready=False)
-    service = DroneService(cfg, mqtt_client, autopilot)
-    service.run_capture_and_publish(args.rgb, args.nir)
+    service = DroneService(cfg, mqtt_client, autopilot, settings=settings)
+    service.run_capture_and_publish(args.rgb, args.nir, exact=args.exact)
+    mqtt_client.flush()
+    mqtt_client.disconnect()
+    if service.pyramid is not None:
+        service.pyramid.close()  # full-resolution levels are written after the preview went out
 
 
 def run_drone_waypoint_listener(args):
+    from .drone.autopilot import AutopilotClient
+    from .drone.service import DroneService
+
     cfg = ConfigLoader(args.config).data
+    settings = _compile(cfg)
     mqtt_client = _build_mqtt(cfg, client_id_suffix="drone")
     mqtt_client.loop_start()
     autopilot = AutopilotClient(cfg["drone"]["autopilot_connection"], wait_ready=False)
-    service = DroneService(cfg, mqtt_client, autopilot)
-    service.start_waypoint_ndvi_listener(rgb_path=args.rgb, nir_path=args.nir)
+    service = DroneService(cfg, mqtt_client, autopilot, settings=settings)
+    publisher = _metrics_publisher(cfg, mqtt_client, source="drone")
+    if publisher:
+        publisher.start()
+    watcher = _watch_config(args, cfg, settings, service)
+    try:
+        service.start_waypoint_ndvi_listener(rgb_path=args.rgb, nir_path=args.nir)
+    finally:
+        if watcher:
+            watcher.stop()
+        if publisher:
+            publisher.stop()
+
+
+def run_drone_telemetry(args):
+    from .drone.autopilot import AutopilotClient
+    from .drone.telemetry import TelemetrySettings, TelemetryStreamer
+
+    cfg = ConfigLoader(args.config).data
+    mqtt_client = _build_mqtt(cfg, client_id_suffix="drone-telemetry")
+    mqtt_client.loop_start()
+    autopilot = AutopilotClient(cfg["drone"]["autopilot_connection"], wait_ready=False)
+    settings = TelemetrySettings.from_config(cfg["drone"].get("telemetry"), force=True)
+    if args.rate:
+        settings.publish_hz = args.rate
+    topic = cfg["mqtt"]["topics"]["telemetry"]
+    streamer = TelemetryStreamer(autopilot, lambda payload: mqtt_client.publish(topic, payload), settings)
+    if not streamer.start():
+        return
+    publisher = _metrics_publisher(cfg, mqtt_client, source="drone-telemetry")
+    if publisher:
+        publisher.start()
+    logging.info(
+        "Streaming telemetry to %s at %.1f Hz, %d sample(s)/message", topic, settings.publish_hz, settings.batch_size
+    )
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logging.info("Stopping telemetry streaming...")
+    finally:
+        streamer.stop()
+        if publisher:
+            publisher.stop()
+        logging.info("Telemetry stats: %s", streamer.counters)
+        mqtt_client.flush()
+        mqtt_client.disconnect()
+
+
+def run_drone_batch(args):
+    from .drone.batch import BatchOptions, discover_pairs, run_batch
+
+    cfg = ConfigLoader(args.config).data
+    capture_dir = pathlib.Path(args.dir or cfg["drone"]["capture_dir"])
+    pairs = discover_pairs(capture_dir)
+    if not pairs:
+        logging.error("No RGB/NIR pairs found under %s", capture_dir)
+        return
+    options = BatchOptions.from_config(cfg["drone"], write_maps=not args.no_maps)
+    mqtt_client = None
+    if not args.no_publish:
+        mqtt_client = _build_mqtt(cfg, client_id_suffix="drone-batch")
+        mqtt_client.loop_start()
+    topic = cfg["mqtt"]["topics"]["analysis"]
+
+    def _publish(record: dict):
+        if mqtt_client is None or "error" in record:
+            return
+        payload = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "capture": record["capture"],
+            "ndvi": record["ndvi"],
+        }
+        mqtt_client.publish(topic, payload)
+
+    logging.info("Processing %d capture pair(s) from %s", len(pairs), capture_dir)
+    report = run_batch(
+        pairs,
+        options,
+        workers=args.workers,
+        chunksize=args.chunksize,
+        ordered=not args.unordered,
+        on_result=_publish,
+    )
+    logging.info(
+        "Batch done: %d processed, %d failed in %.1fs (%.2f images/s)",
+        report.processed,
+        report.failed,
+        report.elapsed_seconds,
+        report.images_per_second,
+    )
+    if mqtt_client is not None:
+        mqtt_client.flush()
+        mqtt_client.disconnect()
+
+
+def run_mosaic_query(args):
+    from .drone.mosaic import MosaicSettings, NDVIMosaic
+
+    cfg = ConfigLoader(args.config).data
+    settings = MosaicSettings.from_config(cfg["drone"])
+    if settings is None:
+        logging.error("NDVI mosaic is disabled (drone.mosaic.enabled).")
+        return
+    mosaic = NDVIMosaic(settings)
+    threshold = args.threshold if args.threshold is not None else float(cfg["drone"]["ndvi"]["stress_threshold"])
+    if args.parcel:
+        result = {"parcel": args.parcel, "ndvi": mosaic.parcel_stats(args.parcel, threshold)}
+    else:
+        bbox = mosaic.bbox_from_latlon(*args.bbox)
+        result = {"bbox": args.bbox, "ndvi": mosaic.region_stats(threshold, bbox=bbox)}
+        result["captures"] = len(mosaic.captures_in_bbox(bbox))
+        if args.hotspots:
+            result["hotspots"] = mosaic.hotspots(bbox, threshold, cell_px=args.cell_px)
+    print(json.dumps(result, indent=2))
 
 
 def run_irrigation(args):
+    from .irrigation.controller import IrrigationController
+    from .utils.gpio import GPIOAdapter
+
     cfg = ConfigLoader(args.config).data
+    settings = _compile(cfg)
     mqtt_client = _build_mqtt(cfg, client_id_suffix="irrigation")
     gpio = GPIOAdapter(dry_run=args.dry_run)
-    controller = IrrigationController(cfg, mqtt_client, gpio)
-    controller.start()
+    controller = IrrigationController(cfg, mqtt_client, gpio, settings=settings)
+    publisher = _metrics_publisher(cfg, mqtt_client, source="irrigation")
+    if publisher:
+        publisher.start()
+    watcher = _watch_config(args, cfg, settings, controller)
+    try:
+        controller.start()
+    finally:
+        if watcher:
+            watcher.stop()
+        if publisher:
+            publisher.stop()
+
+
+def run_serve(args):
+    from .drone.autopilot import AutopilotClient
+    from .drone.service import DroneService
+    from .irrigation.controller import IrrigationController
+    from .runtime import ServiceRuntime, serve
+    from .utils.gpio import GPIOAdapter
+
+    cfg = ConfigLoader(args.config).data
+    settings = _compile(cfg)
+    mqtt_client = _build_mqtt(cfg, client_id_suffix="runtime")
+    drone = irrigation = None
+    if not args.no_drone:
+        autopilot = AutopilotClient(cfg["drone"]["autopilot_connection"], wait_ready=False)
+        drone = DroneService(cfg, mqtt_client, autopilot, settings=settings)
+    if not args.no_irrigation:
+        irrigation = IrrigationController(cfg, mqtt_client, GPIOAdapter(dry_run=args.dry_run), settings=settings)
+    runtime = ServiceRuntime(
+        mqtt_client,
+        drone=drone,
+        irrigation=irrigation,
+        rgb_path=args.rgb,
+        nir_path=args.nir,
+        telemetry_interval=float(cfg.get("runtime", {}).get("telemetry_interval_seconds", 0)),
+        metrics=_metrics_publisher(cfg, mqtt_client, source="runtime"),
+    )
+    watcher = _watch_config(args, cfg, settings, drone, irrigation)
+    try:
+        serve(runtime)
+    finally:
+        if watcher:
+            watcher.stop()
+
+
+def run_fleet(args):
+    from .drone.fleet import Fleet, FleetSettings
+
+    cfg = ConfigLoader(args.config).data
+    settings = FleetSettings.from_config(cfg.get("fleet"))
+    if not settings.drones:
+        logging.error("No drones configured (fleet.drones).")
+        return
+    if args.shards:
+        settings.shards = args.shards
+    fleet = Fleet(cfg, settings, _build_mqtt)
+    fleet.start()
+    publisher = _metrics_publisher(cfg, fleet.status_mqtt, source="fleet")
+    if publisher:
+        publisher.start()
+    try:
+        while True:
+            time.sleep(max(0.1, min(1.0, fleet.process() - time.monotonic())))
+    except KeyboardInterrupt:
+        logging.info("Stopping fleet...")
+    finally:
+        if publisher:
+            publisher.stop()
+        fleet.stop()
+
+
+def _epoch(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    parsed = datetime.fromisoformat(value)
+    return (parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)).timestamp()
+
+
+def run_history(args):
+    from .utils.history import HistoryStore, window
+
+    cfg = ConfigLoader(args.config).data
+    store = HistoryStore.from_config(cfg.get("history"))
+    if store is None:
+        logging.error("History store is disabled (history.enabled).")
+        return
+    try:
+        if args.prune:
+            print(json.dumps(store.prune(), indent=2))
+            return
+        names = store.series(args.series)
+        if args.list:
+            print(json.dumps(names, indent=2))
+            return
+        start, end = window(args.days, _epoch(args.since), _epoch(args.until))
+        result = {"start": start, "end": end, "series": {}}
+        for name in names:
+            if args.trend:
+                result["series"][name] = {**store.summary(name, start, end), "trend": store.trend(name, start, end)}
+            else:
+                result["series"][name] = store.query(name, start, end, resolution=args.resolution)
+        print(json.dumps(result, indent=2))
+    finally:
+        store.close()
+
+
+def run_daemon(args):
+    from .daemon import DaemonSettings, DroneDaemon
+    from .drone.autopilot import AutopilotClient
+    from .drone.service import DroneService
+
+    cfg = ConfigLoader(args.config).data
+    compiled = _compile(cfg)
+    settings = DaemonSettings.from_config(cfg.get("daemon"))
+    if args.socket:
+        settings.socket = args.socket
+    mqtt_client = _build_mqtt(cfg, client_id_suffix="drone")
+    mqtt_client.loop_start()
+    autopilot = AutopilotClient(cfg["drone"]["autopilot_connection"], wait_ready=False)
+    service = DroneService(cfg, mqtt_client, autopilot, settings=compiled)
+    if service.telemetry is not None:
+        service.telemetry.start()
+    publisher = _metrics_publisher(cfg, mqtt_client, source="drone-daemon")
+    if publisher:
+        publisher.start()
+    watcher = _watch_config(args, cfg, compiled, service)
+
+    def _close():
+        if watcher:
+            watcher.stop()
+        if service.telemetry is not None:
+            service.telemetry.stop()
+        if publisher:
+            publisher.stop()
+        if service.mosaic is not None:
+            service.mosaic.close()
+        if service.pyramid is not None:
+            service.pyramid.close()
+        mqtt_client.flush()
+        mqtt_client.disconnect()
+
+    DroneDaemon(service, settings, on_stop=_close).run()
+
+
+def run_bench(args):
+    from . import bench
+
+    cfg = ConfigLoader(args.config).data
+    sizes = [bench.parse_size(size) for size in args.sizes.split(",")] if args.sizes else bench.DEFAULT_SIZES
+    results = bench.run_benchmarks(
+        cfg,
+        sizes=sizes,
+        repeats=args.repeats,
+        fmt=args.format,
+        messages=args.messages,
+        commands=args.commands,
+        ndvi=not args.skip_ndvi,
+        mqtt=not args.skip_mqtt,
+    )
+    text = json.dumps(results, indent=2)
+    if args.output:
+        pathlib.Path(args.output).write_text(text, encoding="utf-8")
+        logging.info("Benchmark results written to %s", args.output)
+    else:
+        print(text)
+    if args.compare:
+        baseline = json.loads(pathlib.Path(args.compare).read_text(encoding="utf-8"))
+        tolerance = args.tolerance if args.tolerance is not None else bench.DEFAULT_TOLERANCE
+        lines = bench.compare(results, baseline, tolerance=tolerance)
+        for line in lines:
+            print(line)
+        if any(line.endswith("REGRESSION") for line in lines):
+            raise SystemExit(1)
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -66,11 +447,28 @@ def build_parser() -> argparse.ArgumentParser:
         default="INFO",
         help="Python logging level (DEBUG, INFO, WARNING...).",
     )
+    parser.add_argument("--profile", metavar="PATH", help="Profile the run and write the profile to PATH.")
+    parser.add_argument(
+        "--profile-mode",
+        choices=profiling.PROFILE_MODES,
+        default="cprofile",
+        help="cprofile (main thread, pstats dump) or sampling (all threads, collapsed stacks).",
+    )
+    parser.add_argument(
+        "--profile-interval", type=float, default=5.0, help="Sampling interval in ms for --profile-mode sampling."
+    )
     sub = parser.add_subparsers(dest="command", required=True)
 
     drone = sub.add_parser("drone-cycle", help="Process RGB/NIR capture, compute NDVI, and publish over MQTT.")
     drone.add_argument("--rgb", required=True, help="Path to RGB image capture.")
     drone.add_argument("--nir", required=True, help="Path to NIR image capture.")
+    drone.add_argument(
+        "--daemon", action="store_true", help="Submit to a running `daemon` (runs in-process if none is listening)."
+    )
+    drone.add_argument("--socket", help="Daemon socket (defaults to config daemon.socket).")
+    drone.add_argument(
+        "--exact", action="store_true", help="Full-frame NDVI statistics even when drone.ndvi.mode is adaptive."
+    )
     drone.set_defaults(func=run_drone)
 
     drone_wp = sub.add_parser(
@@ -81,10 +479,99 @@ def build_parser() -> argparse.ArgumentParser:
     drone_wp.add_argument("--nir", help="Path to NIR image capture (defaults to config camera.nir_path).")
     drone_wp.set_defaults(func=run_drone_waypoint_listener)
 
+    telemetry = sub.add_parser(
+        "drone-telemetry",
+        help="Stream autopilot telemetry over MQTT from attribute listeners (decimated and batched).",
+    )
+    telemetry.add_argument("--rate", type=float, help="Samples per second (defaults to drone.telemetry.publish_hz).")
+    telemetry.set_defaults(func=run_drone_telemetry)
+
+    batch = sub.add_parser(
+        "drone-batch",
+        help="Process every RGB/NIR pair in a capture directory across all cores.",
+    )
+    batch.add_argument("--dir", help="Capture directory (defaults to config drone.capture_dir).")
+    batch.add_argument("--workers", type=int, help="Worker processes (defaults to CPU count).")
+    batch.add_argument("--chunksize", type=int, default=4, help="Pairs handed to a worker at a time.")
+    batch.add_argument("--unordered", action="store_true", help="Publish results as they finish instead of in order.")
+    batch.add_argument("--no-maps", action="store_true", help="Skip writing NDVI maps, only write summaries.")
+    batch.add_argument("--no-publish", action="store_true", help="Do not publish results over MQTT.")
+    batch.set_defaults(func=run_drone_batch)
+
+    mosaic = sub.add_parser("mosaic-query", help="Query the geo-referenced NDVI mosaic by parcel or bounding box.")
+    target = mosaic.add_mutually_exclusive_group(required=True)
+    target.add_argument("--parcel", help="Parcel id from drone.mosaic.parcels.")
+    target.add_argument(
+        "--bbox", nargs=4, type=float, metavar=("MIN_LAT", "MIN_LON", "MAX_LAT", "MAX_LON"), help="Bounding box."
+    )
+    mosaic.add_argument("--hotspots", action="store_true", help="List stressed cells inside --bbox.")
+    mosaic.add_argument("--cell-px", type=int, default=16, help="Hotspot cell size in mosaic pixels.")
+    mosaic.add_argument("--threshold", type=float, help="Stress threshold (defaults to drone.ndvi.stress_threshold).")
+    mosaic.set_defaults(func=run_mosaic_query)
+
     irr = sub.add_parser("irrigation", help="Start irrigation controller and listen for MQTT commands.")
     irr.add_argument("--dry-run", action="store_true", help="Skip real GPIO writes (for dev/test).")
     irr.set_defaults(func=run_irrigation)
 
+    srv = sub.add_parser(
+        "serve",
+        help="Host drone telemetry, waypoint NDVI and irrigation in one process on a single asyncio event loop.",
+    )
+    srv.add_argument("--rgb", help="Path to RGB image capture (defaults to config camera.rgb_path).")
+    srv.add_argument("--nir", help="Path to NIR image capture (defaults to config camera.nir_path).")
+    srv.add_argument("--no-drone", action="store_true", help="Do not run the drone service.")
+    srv.add_argument("--no-irrigation", action="store_true", help="Do not run the irrigation controller.")
+    srv.add_argument("--dry-run", action="store_true", help="Skip real GPIO writes (for dev/test).")
+    srv.set_defaults(func=run_serve)
+
+    fleet = sub.add_parser(
+        "fleet",
+        help="Run the waypoint NDVI pipeline for every drone in `fleet.drones`, sharing NDVI worker processes.",
+    )
+    fleet.add_argument("--shards", type=int, help="NDVI worker processes (defaults to fleet.shards).")
+    fleet.set_defaults(func=run_fleet)
+
+    hist = sub.add_parser("history", help="Range and trend queries over the local NDVI/irrigation history store.")
+    hist.add_argument("series", nargs="?", default="*", help="Series name or glob, e.g. 'parcel.*.stress_ratio'.")
+    hist.add_argument("--list", action="store_true", help="List matching series names only.")
+    hist.add_argument("--days", type=float, default=30.0, help="Window ending now (default 30 days).")
+    hist.add_argument("--since", help="ISO start time (overrides --days; UTC if no offset).")
+    hist.add_argument("--until", help="ISO end time (default now).")
+    hist.add_argument(
+        "--resolution", choices=("auto", "raw", "hour", "day"), default="auto", help="Bucket size for range output."
+    )
+    hist.add_argument("--trend", action="store_true", help="Summary and daily slope per series instead of buckets.")
+    hist.add_argument("--prune", action="store_true", help="Apply the retention policies now and exit.")
+    hist.set_defaults(func=run_history)
+
+    daemon_cmd = sub.add_parser(
+        "daemon",
+        help="Keep MQTT and the autopilot connected and run `drone-cycle --daemon` jobs from a Unix socket.",
+    )
+    daemon_cmd.add_argument("--socket", help="Socket path (defaults to config daemon.socket).")
+    daemon_cmd.set_defaults(func=run_daemon)
+
+    bench_cmd = sub.add_parser(
+        "bench",
+        help="Benchmark NDVI stages on synthetic captures and MQTT paths on an in-process broker (offline).",
+    )
+    bench_cmd.add_argument("--sizes", help="Comma-separated WxH capture sizes (default 640x480,1296x972,2592x1944).")
+    bench_cmd.add_argument("--repeats", type=int, default=5, help="Timed runs per stage (after one warm-up).")
+    bench_cmd.add_argument("--format", choices=("jpg", "png", "npy"), default="jpg", help="Synthetic capture format.")
+    bench_cmd.add_argument("--messages", type=int, default=2000, help="Analysis payloads to publish.")
+    bench_cmd.add_argument("--commands", type=int, default=2000, help="Irrigation commands to send.")
+    bench_cmd.add_argument("--skip-ndvi", action="store_true", help="Skip the NDVI benchmarks.")
+    bench_cmd.add_argument("--skip-mqtt", action="store_true", help="Skip the MQTT benchmarks.")
+    bench_cmd.add_argument("--output", help="Write JSON results here instead of stdout.")
+    bench_cmd.add_argument("--compare", help="Baseline JSON from an earlier run; exits 1 on a regression.")
+    bench_cmd.add_argument(
+        "--tolerance",
+        type=float,
+        default=None,
+        help="Slowdown factor tolerated by --compare (default 1.10).",
+    )
+    bench_cmd.set_defaults(func=run_bench)
+
     return parser
 
 
@@ -92,7 +579,12 @@ def main():
     parser = build_parser()
     args = parser.parse_args()
     logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.INFO), format="%(asctime)s %(levelname)s %(message)s")
-    args.func(args)
+    if args.profile:
+        profiling.run_profiled(
+            lambda: args.func(args), args.profile, mode=args.profile_mode, interval=args.profile_interval / 1000.0
+        )
+    else:
+        args.func(args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,228 @@
+# Single asyncio event loop hosting the drone and irrigation services.
+import asyncio
+import logging
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from .drone.pipeline import CaptureJob, PipelineSettings
+from .drone.service import DroneService
+from .drone.analysis import NDVI_CAPTURES
+from .irrigation.controller import IrrigationController
+from .utils import metrics
+from .utils.async_mqtt import AsyncMQTT
+from .utils.metrics import MetricsPublisher
+from .utils.mqtt_client import MQTTClient
+
+
+async def _drive(process: Callable[[], Optional[float]], wake: asyncio.Event):
+    """Call ``process`` when woken or when the deadline it returned (monotonic seconds) passes."""
+    while True:
+        wake.clear()
+        deadline = process()
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class ServiceRuntime:
+    """
+    Runs drone telemetry, waypoint NDVI and the irrigation controller on one event loop.
+
+    Valve deadlines and status publishes are awaited timers driven through
+    the components' ``process`` methods, NDVI runs in a thread pool via
+    ``run_in_executor``, and SIGINT/SIGTERM trigger an orderly shutdown:
+    tasks are cancelled, valves closed, a last status published, then MQTT
+    disconnects.
+    """
+
+    def __init__(
+        self,
+        mqtt_client: MQTTClient,
+        drone: Optional[DroneService] = None,
+        irrigation: Optional[IrrigationController] = None,
+        rgb_path: Optional[str] = None,
+        nir_path: Optional[str] = None,
+        telemetry_interval: float = 0.0,
+        metrics: Optional[MetricsPublisher] = None,
+    ):
+        self.mqtt = mqtt_client
+        self.drone = drone
+        self.irrigation = irrigation
+        self.rgb_path = rgb_path
+        self.nir_path = nir_path
+        self.telemetry_interval = telemetry_interval
+        self.metrics = metrics
+        self._stop: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._publish_executor: Optional[ThreadPoolExecutor] = None
+        self.dropped_captures = 0
+
+    def request_stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    # Irrigation ----------------------------------------------------------------
+    def _start_irrigation(self, amqtt: AsyncMQTT, loop: asyncio.AbstractEventLoop):
+        controller = self.irrigation
+        scheduler_wake, status_wake = asyncio.Event(), asyncio.Event()
+        controller.scheduler.wakeup = lambda: loop.call_soon_threadsafe(scheduler_wake.set)
+        controller.status.wakeup = lambda: loop.call_soon_threadsafe(status_wake.set)
+        commands = amqtt.subscribe(controller.topics.irrigation_command)
+
+        async def _consume():
+            while True:
+                payload = await commands.get()
+                # Only enqueues into the scheduler; GPIO work happens in its process() call.
+                controller._handle_command(payload)
+
+        if controller.planner is not None:
+            plan_wake = asyncio.Event()
+            controller.plan_wakeup = lambda: loop.call_soon_threadsafe(plan_wake.set)
+            parcels = amqtt.subscribe(controller.parcel_topic)
+
+            async def _consume_parcels():
+                while True:
+                    controller._handle_parcels(await parcels.get())
+
+            self._tasks += [
+                asyncio.create_task(_drive(controller.process_plan, plan_wake), name="irrigation-planner"),
+                asyncio.create_task(_consume_parcels(), name="irrigation-parcels"),
+            ]
+
+        controller.status.mark_dirty_all()
+        self._tasks += [
+            asyncio.create_task(_drive(controller.scheduler.process, scheduler_wake), name="valve-scheduler"),
+            asyncio.create_task(_drive(controller.status.process, status_wake), name="valve-status"),
+            asyncio.create_task(_consume(), name="irrigation-commands"),
+        ]
+        logging.info("Irrigation controller awaiting commands on %s", controller.topics.irrigation_command)
+
+    # Drone ---------------------------------------------------------------------
+    def _start_drone(self, loop: asyncio.AbstractEventLoop):
+        service = self.drone
+        settings = PipelineSettings.from_config(service.drone_cfg.get("pipeline"))
+        if settings.executor != "thread":
+            logging.info("Async runtime runs NDVI in threads; ignoring drone.pipeline.executor=%s", settings.executor)
+        self._executor = ThreadPoolExecutor(settings.workers, thread_name_prefix="ndvi")
+        # Mosaic/zonal/publish stay on one thread, as with the threaded pipeline.
+        self._publish_executor = ThreadPoolExecutor(1, thread_name_prefix="ndvi-publish")
+        jobs: "asyncio.Queue[CaptureJob]" = asyncio.Queue(maxsize=settings.queue_depth)
+        drone = service.identity["id"] if service.identity else "default"
+        metrics.gauge(
+            "ndvi_queue_depth", "Captures waiting for an NDVI worker, by drone.", fn=jobs.qsize, labels={"drone": drone}
+        )
+
+        def _enqueue(job: CaptureJob):
+            if jobs.full():
+                jobs.get_nowait()
+                self.dropped_captures += 1
+                NDVI_CAPTURES.inc(result="dropped")
+                logging.warning("NDVI queue full; dropped the oldest capture.")
+            jobs.put_nowait(job)
+
+        def _on_waypoint(seq: Optional[int]):
+            # dronekit thread: match telemetry to trigger time, then hand over to the loop.
+            logging.info("Triggering NDVI capture on waypoint seq=%s", seq)
+            triggered_at = time.time()
+            rgb, nir = service._capture_paths(self.rgb_path, self.nir_path)  # follows config reloads
+            job = CaptureJob(rgb, nir, seq=seq, triggered_at=triggered_at, telemetry=service.telemetry_at(triggered_at))
+            loop.call_soon_threadsafe(_enqueue, job)
+
+        async def _worker():
+            while True:
+                job = await jobs.get()
+                try:
+                    summary = await loop.run_in_executor(self._executor, service.analyze, job.rgb_path, job.nir_path)
+                    await loop.run_in_executor(self._publish_executor, service._publish_job, job, summary)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    NDVI_CAPTURES.inc(result="failed")
+                    logging.error("NDVI capture seq=%s failed: %s", job.seq, exc)
+
+        if service.autopilot.add_waypoint_reached_handler(_on_waypoint):
+            self._tasks += [asyncio.create_task(_worker(), name=f"ndvi-{idx}") for idx in range(settings.workers)]
+            rgb, nir = service._capture_paths(self.rgb_path, self.nir_path)
+            logging.info("Waiting for waypoint events to trigger NDVI (RGB=%s, NIR=%s)...", rgb, nir)
+        else:
+            logging.error("Waypoint NDVI disabled because autopilot is disconnected.")
+
+        if service.telemetry is not None and service.telemetry.attach():
+            # Attribute listeners keep the snapshot current; only the decimated sampling is a timer.
+            sampler = _drive(service.telemetry.process, asyncio.Event())
+            self._tasks.append(asyncio.create_task(sampler, name="telemetry"))
+        elif self.telemetry_interval > 0:
+
+            async def _telemetry():
+                while True:
+                    await loop.run_in_executor(None, service.publish_telemetry_only)
+                    await asyncio.sleep(self.telemetry_interval)
+
+            self._tasks.append(asyncio.create_task(_telemetry(), name="telemetry"))
+
+    # Lifecycle -----------------------------------------------------------------
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self._stop.set)
+            except (NotImplementedError, RuntimeError):  # pragma: no cover - non-POSIX / non-main thread
+                pass
+        amqtt = AsyncMQTT(self.mqtt, loop)
+        if self.irrigation is not None:
+            # Subscribing before connecting is fine: subscriptions are replayed on connect.
+            self._start_irrigation(amqtt, loop)
+        await amqtt.connect()
+        if self.drone is not None:
+            self._start_drone(loop)
+        if self.metrics is not None:
+            # Snapshot and publish run on a worker thread, off the event loop.
+            self._tasks.append(asyncio.create_task(self._publish_metrics(loop), name="metrics"))
+        try:
+            await self._stop.wait()
+        finally:
+            logging.info("Shutting down service runtime...")
+            await self._shutdown(amqtt, loop)
+
+    async def _publish_metrics(self, loop: asyncio.AbstractEventLoop):
+        while True:
+            await asyncio.sleep(self.metrics.interval)
+            await loop.run_in_executor(None, self.metrics.publish)
+
+    async def _shutdown(self, amqtt: AsyncMQTT, loop: asyncio.AbstractEventLoop):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for executor in (self._executor, self._publish_executor):
+            if executor is not None:
+                await loop.run_in_executor(None, executor.shutdown)
+        if self.irrigation is not None:
+            self.irrigation.scheduler.close_all()
+            # Publish the closed valves before the connection goes away (spooled if offline).
+            self.irrigation.status.process(float("inf"))
+        if self.drone is not None:
+            if self.drone.telemetry is not None:
+                self.drone.autopilot.remove_attribute_listeners()
+                self.drone.telemetry.flush()
+            if self.drone.mosaic is not None:
+                self.drone.mosaic.close()
+            if self.drone.pyramid is not None:
+                self.drone.pyramid.close()
+            if self.dropped_captures:
+                logging.info("Dropped %d capture(s) on a full NDVI queue.", self.dropped_captures)
+        await amqtt.disconnect()
+
+
+def serve(runtime: ServiceRuntime):
+    """Run ``runtime`` until SIGINT/SIGTERM."""
+    try:
+        asyncio.run(runtime.run())
+    except KeyboardInterrupt:  # signal handlers unavailable on this platform
+        pass
@@ -0,0 +1,51 @@
+# asyncio facade over MQTTClient.
+import asyncio
+import logging
+from typing import Optional, Union
+
+from .mqtt_client import MQTTClient
+
+
+class AsyncMQTT:
+    """
+    Exposes an ``MQTTClient`` to coroutines.
+
+    paho keeps its own network thread; subscriptions hand decoded payloads
+    to the event loop with ``call_soon_threadsafe``. Publishing never blocks
+    (offline messages are spooled), so it runs directly on the loop.
+    """
+
+    def __init__(self, client: MQTTClient, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.client = client
+        self.loop = loop or asyncio.get_running_loop()
+
+    async def connect(self, timeout: float = 10.0) -> bool:
+        """Start the network loop and wait (without blocking the event loop) for the connection."""
+        await self.loop.run_in_executor(None, self.client.loop_start)
+        connected = await self.loop.run_in_executor(None, self.client.wait_connected, timeout)
+        if not connected:
+            logging.warning("MQTT not connected after %.0fs; publishes are spooled until it connects.", timeout)
+        return connected
+
+    async def publish(self, topic: str, payload: Union[dict, bytes], qos: int = 0, retain: bool = False):
+        self.client.publish(topic, payload, qos=qos, retain=retain)
+
+    def subscribe(self, topic: str, qos: int = 0, maxsize: int = 64) -> "asyncio.Queue[dict]":
+        """Return a queue receiving payloads published on ``topic``; overflow drops the newest message."""
+        messages: "asyncio.Queue[dict]" = asyncio.Queue(maxsize=maxsize)
+
+        def _put(payload: dict):
+            try:
+                messages.put_nowait(payload)
+            except asyncio.QueueFull:
+                logging.warning("Async MQTT queue for %s full; dropped message.", topic)
+
+        def _handler(payload: dict):
+            # Runs on a dispatcher worker thread.
+            self.loop.call_soon_threadsafe(_put, payload)
+
+        self.client.subscribe(topic, _handler, qos=qos)
+        return messages
+
+    async def disconnect(self):
+        await self.loop.run_in_executor(None, self.client.disconnect)
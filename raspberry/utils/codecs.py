@@ -0,0 +1,155 @@
+import base64
+import json
+import logging
+import zlib
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Framed payloads start with MAGIC followed by one byte: high nibble = format,
+# low nibble = compression. Anything else is treated as plain JSON, so
+# legacy publishers and subscribers keep working unchanged.
+MAGIC = 0xA5
+FORMATS = {"json": 1, "msgpack": 2, "cbor": 3}
+COMPRESSIONS = {"none": 0, "zlib": 1, "zstd": 2}
+_FORMAT_NAMES = {v: k for k, v in FORMATS.items()}
+_COMPRESSION_NAMES = {v: k for k, v in COMPRESSIONS.items()}
+
+
+class CodecError(Exception):
+    pass
+
+
+def _json_default(value: Any):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(value)).decode("ascii")
+    if hasattr(value, "tolist"):  # numpy scalars/arrays
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _json_encode(payload: Any) -> bytes:
+    return json.dumps(payload, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+
+def _json_decode(data: bytes) -> Any:
+    return json.loads(data.decode("utf-8"))
+
+
+def _load_format(name: str) -> Optional[Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]]:
+    if name == "json":
+        return _json_encode, _json_decode
+    if name == "msgpack":
+        try:
+            import msgpack  # type: ignore
+        except ImportError:
+            return None
+        return (
+            lambda payload: msgpack.packb(payload, use_bin_type=True, default=_json_default),
+            lambda data: msgpack.unpackb(data, raw=False),
+        )
+    if name == "cbor":
+        try:
+            import cbor2  # type: ignore
+        except ImportError:
+            return None
+        return (lambda payload: cbor2.dumps(payload, default=lambda enc, v: enc.encode(_json_default(v))), cbor2.loads)
+    raise CodecError(f"Unknown payload format {name!r}")
+
+
+def _load_compression(name: str) -> Optional[Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]]:
+    if name == "none":
+        return (lambda data: data), (lambda data: data)
+    if name == "zlib":
+        return (lambda data: zlib.compress(data, 6)), zlib.decompress
+    if name == "zstd":
+        try:
+            import zstandard  # type: ignore
+        except ImportError:
+            return None
+        return zstandard.ZstdCompressor(level=3).compress, lambda data: zstandard.ZstdDecompressor().decompress(data)
+    raise CodecError(f"Unknown payload compression {name!r}")
+
+
+@dataclass
+class PayloadCodec:
+    """
+    Serializer for MQTT payloads: JSON, MessagePack or CBOR with optional
+    zlib/zstd compression. Non-JSON or compressed payloads carry a two-byte
+    content-type marker; plain JSON stays unframed for compatibility.
+    Compression is skipped for payloads shorter than ``min_compress_bytes``.
+    """
+
+    format: str = "json"
+    compression: str = "none"
+    min_compress_bytes: int = 256
+
+    def __post_init__(self):
+        if self.format not in FORMATS:
+            raise CodecError(f"Unknown payload format {self.format!r}")
+        if self.compression not in COMPRESSIONS:
+            raise CodecError(f"Unknown payload compression {self.compression!r}")
+        if _load_format(self.format) is None:
+            logging.warning("Payload format %s unavailable (missing module); falling back to json.", self.format)
+            self.format = "json"
+        if _load_compression(self.compression) is None:
+            logging.warning("Compression %s unavailable (missing module); falling back to zlib.", self.compression)
+            self.compression = "zlib"
+        self._encode, _ = _load_format(self.format)
+        self._compress, _ = _load_compression(self.compression)
+        self._decoders: Dict[int, Callable[[bytes], Any]] = {}
+        self._decompressors: Dict[int, Callable[[bytes], bytes]] = {}
+
+    @classmethod
+    def from_config(cls, raw: Optional[dict]) -> "PayloadCodec":
+        raw = raw or {}
+        return cls(
+            format=str(raw.get("format", "json")),
+            compression=str(raw.get("compression", "none")),
+            min_compress_bytes=int(raw.get("min_compress_bytes", 256)),
+        )
+
+    @property
+    def content_type(self) -> str:
+        return f"application/{self.format}" + ("" if self.compression == "none" else f"+{self.compression}")
+
+    def encode(self, payload: Any) -> bytes:
+        body = self._encode(payload)
+        compression = self.compression
+        if compression != "none" and len(body) >= self.min_compress_bytes:
+            body = self._compress(body)
+        else:
+            compression = "none"
+        if self.format == "json" and compression == "none":
+            return body
+        return bytes((MAGIC, (FORMATS[self.format] << 4) | COMPRESSIONS[compression])) + body
+
+    def decode(self, data: bytes) -> Any:
+        if len(data) < 2 or data[0] != MAGIC:
+            return _json_decode(data)
+        fmt_id, comp_id = data[1] >> 4, data[1] & 0x0F
+        decoder = self._decoders.get(fmt_id)
+        if decoder is None:
+            loaded = _load_format(_FORMAT_NAMES.get(fmt_id, "?")) if fmt_id in _FORMAT_NAMES else None
+            if loaded is None:
+                raise CodecError(f"Cannot decode payload format id {fmt_id}")
+            decoder = self._decoders[fmt_id] = loaded[1]
+        decompress = self._decompressors.get(comp_id)
+        if decompress is None:
+            loaded = _load_compression(_COMPRESSION_NAMES[comp_id]) if comp_id in _COMPRESSION_NAMES else None
+            if loaded is None:
+                raise CodecError(f"Cannot decode payload compression id {comp_id}")
+            decompress = self._decompressors[comp_id] = loaded[1]
+        return decoder(decompress(data[2:]))
+
+
+class LazyJSON:
+    """Defers json.dumps until a log record is actually emitted."""
+
+    __slots__ = ("payload", "indent")
+
+    def __init__(self, payload: Any, indent: Optional[int] = None):
+        self.payload = payload
+        self.indent = indent
+
+    def __str__(self) -> str:
+        return json.dumps(self.payload, indent=self.indent, default=_json_default)
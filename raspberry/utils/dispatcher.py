@@ -0,0 +1,201 @@
+# Topic-routed MQTT message dispatch on a bounded worker pool.
+import logging
+import queue
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+MessageHandler = Callable[[dict], None]
+
+
+@dataclass
+class _Node:
+    children: Dict[str, "_Node"] = field(default_factory=dict)
+    handlers: List[Tuple[str, MessageHandler]] = field(default_factory=list)  # (filter, handler) ending here
+    wildcard_handlers: List[Tuple[str, MessageHandler]] = field(default_factory=list)  # "#" below this level
+
+
+class TopicTrie:
+    """Topic filters (with ``+`` and ``#``) compiled into a trie keyed by topic level."""
+
+    def __init__(self):
+        self._root = _Node()
+        self._lock = threading.Lock()
+
+    def add(self, topic_filter: str, handler: MessageHandler):
+        levels = topic_filter.split("/")
+        if "#" in levels[:-1]:
+            raise ValueError(f"'#' must be the last level of a topic filter: {topic_filter}")
+        with self._lock:
+            node = self._root
+            for level in levels:
+                if level == "#":
+                    node.wildcard_handlers.append((topic_filter, handler))
+                    return
+                node = node.children.setdefault(level, _Node())
+            node.handlers.append((topic_filter, handler))
+
+    def remove(self, topic_filter: str) -> bool:
+        removed = False
+        with self._lock:
+            node = self._root
+            for level in topic_filter.split("/"):
+                if level == "#":
+                    before = len(node.wildcard_handlers)
+                    node.wildcard_handlers = [h for h in node.wildcard_handlers if h[0] != topic_filter]
+                    return before != len(node.wildcard_handlers)
+                node = node.children.get(level)
+                if node is None:
+                    return False
+            before = len(node.handlers)
+            node.handlers = [h for h in node.handlers if h[0] != topic_filter]
+            removed = before != len(node.handlers)
+        return removed
+
+    def match(self, topic: str) -> List[Tuple[str, MessageHandler]]:
+        levels = topic.split("/")
+        matches: List[Tuple[str, MessageHandler]] = []
+        frontier = [self._root]
+        for depth, level in enumerate(levels):
+            next_frontier = []
+            for node in frontier:
+                # Per MQTT, wildcards at the first level do not match topics starting with '$'.
+                if not (depth == 0 and level.startswith("$")):
+                    matches.extend(node.wildcard_handlers)
+                    plus = node.children.get("+")
+                    if plus is not None:
+                        next_frontier.append(plus)
+                exact = node.children.get(level)
+                if exact is not None:
+                    next_frontier.append(exact)
+            frontier = next_frontier
+            if not frontier:
+                return matches
+        for node in frontier:
+            matches.extend(node.handlers)
+            matches.extend(node.wildcard_handlers)  # "a/#" also matches "a"
+        return matches
+
+
+class HandlerStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        avg = self.total_ms / self.calls if self.calls else 0.0
+        return {"calls": self.calls, "errors": self.errors, "avg_ms": avg, "max_ms": self.max_ms}
+
+
+class MessageDispatcher:
+    """
+    Routes raw MQTT messages to subscribed handlers on a pool of workers.
+
+    Each topic hashes to one worker queue, so messages on the same topic are
+    decoded and handled in arrival order while different topics proceed in
+    parallel. ``submit`` never blocks the network thread: when a worker queue
+    is full the message is dropped and counted.
+    """
+
+    def __init__(self, decode: Callable[[bytes], Any], workers: int = 2, queue_size: int = 256):
+        self.decode = decode
+        self.trie = TopicTrie()
+        self._queues: List["queue.Queue[Optional[Tuple[str, bytes, float]]]"] = [
+            queue.Queue(maxsize=queue_size) for _ in range(max(1, workers))
+        ]
+        self._threads: List[threading.Thread] = []
+        self._stats_lock = threading.Lock()
+        self.handler_stats: Dict[str, HandlerStats] = {}
+        self.counters = {"received": 0, "dropped": 0, "unrouted": 0, "undecodable": 0}
+        self.max_wait_ms = 0.0  # longest time a message sat in a worker queue
+
+    def add_route(self, topic_filter: str, handler: MessageHandler):
+        self.trie.add(topic_filter, handler)
+        with self._stats_lock:
+            self.handler_stats.setdefault(topic_filter, HandlerStats())
+
+    def remove_route(self, topic_filter: str) -> bool:
+        return self.trie.remove(topic_filter)
+
+    def start(self):
+        if self._threads:
+            return
+        for idx, q in enumerate(self._queues):
+            thread = threading.Thread(target=self._worker, args=(q,), name=f"mqtt-dispatch-{idx}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 2.0):
+        for q in self._queues:
+            try:
+                q.put_nowait(None)
+            except queue.Full:
+                pass
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, topic: str, payload: bytes):
+        """Called on the network thread: enqueue only."""
+        q = self._queues[zlib.crc32(topic.encode("utf-8")) % len(self._queues)]
+        try:
+            q.put_nowait((topic, payload, time.perf_counter()))
+            self._count("received")
+        except queue.Full:
+            self._count("dropped")
+            logging.warning("MQTT dispatch queue full; dropped message on %s", topic)
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self.counters[name] += 1
+
+    def _worker(self, q: "queue.Queue"):
+        while True:
+            item = q.get()
+            if item is None:
+                return
+            topic, raw, enqueued = item
+            wait_ms = (time.perf_counter() - enqueued) * 1000.0
+            if wait_ms > self.max_wait_ms:
+                self.max_wait_ms = wait_ms
+            routes = self.trie.match(topic)
+            if not routes:
+                self._count("unrouted")
+                continue
+            try:
+                payload = self.decode(raw)
+            except Exception as exc:
+                self._count("undecodable")
+                logging.warning("MQTT: discarded undecodable payload on %s (%s)", topic, exc)
+                continue
+            for topic_filter, handler in routes:
+                started = time.perf_counter()
+                failed = False
+                try:
+                    handler(payload)
+                except Exception as exc:
+                    failed = True
+                    logging.error("MQTT handler for %s failed: %s", topic_filter, exc)
+                elapsed = (time.perf_counter() - started) * 1000.0
+                with self._stats_lock:
+                    stats = self.handler_stats.setdefault(topic_filter, HandlerStats())
+                    stats.calls += 1
+                    stats.errors += int(failed)
+                    stats.total_ms += elapsed
+                    stats.max_ms = max(stats.max_ms, elapsed)
+
+    def queue_depths(self) -> List[int]:
+        return [q.qsize() for q in self._queues]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "queue_depths": self.queue_depths(),
+                "counters": dict(self.counters),
+                "max_wait_ms": self.max_wait_ms,
+                "handlers": {name: stats.as_dict() for name, stats in self.handler_stats.items()},
+            }
@@ -60,17 +60,24 @@ class Valve:
     _last_opened_at: Optional[float] = None
     _last_closed_at: Optional[float] = None
 
-    def open_for_seconds(self, gpio: GPIOAdapter, seconds: float):
-        logging.info("Opening valve %s on pin %s for %.1fs", self.valve_id, self.gpio_pin, seconds)
+    def open(self, gpio: GPIOAdapter):
+        logging.info("Opening valve %s on pin %s", self.valve_id, self.gpio_pin)
         gpio.write(self.gpio_pin, True)
         self._is_open = True
         self._last_opened_at = time.time()
-        time.sleep(max(0.0, seconds))
+
+    def close(self, gpio: GPIOAdapter):
         gpio.write(self.gpio_pin, False)
         self._is_open = False
         self._last_closed_at = time.time()
         logging.info("Closed valve %s", self.valve_id)
 
+    def open_for_seconds(self, gpio: GPIOAdapter, seconds: float):
+        """Blocking open/sleep/close; the controller uses the scheduler instead."""
+        self.open(gpio)
+        time.sleep(max(0.0, seconds))
+        self.close(gpio)
+
 
 def load_valves(raw_valves: list) -> Dict[str, Valve]:
     valves: Dict[str, Valve] = {}
@@ -0,0 +1,287 @@
+# Embedded SQLite time-series store with hourly/daily rollups, retention and trend queries.
+import logging
+import pathlib
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+HOUR = 3600
+DAY = 86400
+RESOLUTIONS = {"raw": 0, "hour": HOUR, "day": DAY}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+-- Clustered on (series, ts): range scans read one contiguous run of the b-tree.
+CREATE TABLE IF NOT EXISTS points (
+    series_id INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (series_id, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollups (
+    series_id INTEGER NOT NULL,
+    resolution INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    sum REAL NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    PRIMARY KEY (series_id, resolution, bucket)
+) WITHOUT ROWID;
+"""
+
+_ROLLUP_UPSERT = """
+INSERT INTO rollups (series_id, resolution, bucket, count, sum, min, max) VALUES (?, ?, ?, 1, ?, ?, ?)
+ON CONFLICT (series_id, resolution, bucket) DO UPDATE SET
+    count = count + 1,
+    sum = sum + excluded.sum,
+    min = MIN(min, excluded.min),
+    max = MAX(max, excluded.max)
+"""
+
+
+@dataclass
+class HistorySettings:
+    path: pathlib.Path
+    raw_retention_days: float = 14.0
+    hourly_retention_days: float = 180.0
+    daily_retention_days: float = 1825.0
+    prune_interval_seconds: float = 3600.0
+
+    @classmethod
+    def from_config(cls, raw: Optional[dict]) -> Optional["HistorySettings"]:
+        raw = raw or {}
+        if not raw.get("enabled", False):
+            return None
+        return cls(
+            path=pathlib.Path(raw.get("path", "history.sqlite")),
+            raw_retention_days=float(raw.get("raw_retention_days", cls.raw_retention_days)),
+            hourly_retention_days=float(raw.get("hourly_retention_days", cls.hourly_retention_days)),
+            daily_retention_days=float(raw.get("daily_retention_days", cls.daily_retention_days)),
+            prune_interval_seconds=float(raw.get("prune_interval_minutes", cls.prune_interval_seconds / 60)) * 60,
+        )
+
+
+class HistoryStore:
+    """
+    Append-only samples per named series, with hourly and daily rollups kept
+    up to date on insert (count/sum/min/max upserts), so range and trend
+    queries at hour/day resolution never touch the raw rows. Raw samples,
+    hourly and daily rollups each have their own retention.
+
+    The database is in WAL mode, so the drone and irrigation processes can
+    both append while a CLI query reads.
+    """
+
+    def __init__(self, settings: HistorySettings):
+        self.settings = settings
+        settings.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(settings.path), check_same_thread=False, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._series_ids: Dict[str, int] = {}
+        self._next_prune = 0.0
+
+    @classmethod
+    def from_config(cls, raw: Optional[dict]) -> Optional["HistoryStore"]:
+        settings = HistorySettings.from_config(raw)
+        return cls(settings) if settings else None
+
+    # Writes --------------------------------------------------------------------
+    def _series_id(self, name: str) -> int:
+        series_id = self._series_ids.get(name)
+        if series_id is None:
+            self._conn.execute("INSERT OR IGNORE INTO series (name) VALUES (?)", (name,))
+            series_id = self._conn.execute("SELECT id FROM series WHERE name = ?", (name,)).fetchone()[0]
+            self._series_ids[name] = series_id
+        return series_id
+
+    def record(self, timestamp: float, values: Dict[str, float]):
+        """Append one sample per series at ``timestamp`` (epoch seconds) and fold it into the rollups."""
+        values = {name: float(value) for name, value in values.items() if value is not None}
+        if not values:
+            return
+        with self._lock:
+            try:
+                with self._conn:
+                    for name, value in values.items():
+                        series_id = self._series_id(name)
+                        # A repeated (series, ts) keeps the first sample so rollups never count it twice.
+                        cursor = self._conn.execute(
+                            "INSERT OR IGNORE INTO points (series_id, ts, value) VALUES (?, ?, ?)",
+                            (series_id, timestamp, value),
+                        )
+                        if cursor.rowcount:
+                            for resolution in (HOUR, DAY):
+                                bucket = int(timestamp // resolution) * resolution
+                                self._conn.execute(_ROLLUP_UPSERT, (series_id, resolution, bucket, value, value, value))
+            except sqlite3.Error as exc:
+                self._series_ids.clear()  # ids cached inside a rolled-back transaction may not exist
+                logging.error("History write failed: %s", exc)
+                return
+        if time.monotonic() >= self._next_prune:
+            self._next_prune = time.monotonic() + self.settings.prune_interval_seconds
+            self.prune()
+
+    def prune(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Apply the retention policies; returns deleted row counts."""
+        now = time.time() if now is None else now
+        settings = self.settings
+        deleted = {}
+        with self._lock, self._conn:
+            deleted["raw"] = self._conn.execute(
+                "DELETE FROM points WHERE ts < ?", (now - settings.raw_retention_days * DAY,)
+            ).rowcount
+            for label, resolution, days in (
+                ("hour", HOUR, settings.hourly_retention_days),
+                ("day", DAY, settings.daily_retention_days),
+            ):
+                deleted[label] = self._conn.execute(
+                    "DELETE FROM rollups WHERE resolution = ? AND bucket < ?", (resolution, now - days * DAY)
+                ).rowcount
+        if any(deleted.values()):
+            logging.info("History retention removed %s", deleted)
+        return deleted
+
+    # Reads ---------------------------------------------------------------------
+    def series(self, pattern: str = "*") -> List[str]:
+        """Series names matching a glob ``pattern`` (e.g. ``parcel.*.stress_ratio``)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT name FROM series WHERE name GLOB ? ORDER BY name", (pattern,))
+            return [row[0] for row in rows]
+
+    def _resolution(self, resolution: str, start: float, end: float) -> int:
+        if resolution == "auto":
+            span = end - start
+            # Roughly 50-500 points for a chart; raw only while the raw rows still cover the range.
+            if span > 14 * DAY:
+                return DAY
+            if span > 2 * DAY or start < time.time() - self.settings.raw_retention_days * DAY:
+                return HOUR
+            return 0
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution {resolution!r} (expected auto, {', '.join(RESOLUTIONS)})")
+        return RESOLUTIONS[resolution]
+
+    def query(self, name: str, start: float, end: float, resolution: str = "auto") -> List[Dict]:
+        """``[{t, count, sum, mean, min, max}]`` buckets (or raw samples) in ``[start, end)``."""
+        step = self._resolution(resolution, start, end)
+        with self._lock:
+            series_id = self._conn.execute("SELECT id FROM series WHERE name = ?", (name,)).fetchone()
+            if series_id is None:
+                return []
+            if step == 0:
+                rows = self._conn.execute(
+                    "SELECT ts, value FROM points WHERE series_id = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                    (series_id[0], start, end),
+                ).fetchall()
+                return [{"t": ts, "count": 1, "sum": v, "mean": v, "min": v, "max": v} for ts, v in rows]
+            rows = self._conn.execute(
+                "SELECT bucket, count, sum, min, max FROM rollups"
+                " WHERE series_id = ? AND resolution = ? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+                (series_id[0], step, int(start // step) * step, end),
+            ).fetchall()
+        return [{"t": b, "count": c, "sum": s, "mean": s / c, "min": lo, "max": hi} for b, c, s, lo, hi in rows]
+
+    def summary(self, name: str, start: float, end: float) -> Dict:
+        """Count/sum/mean/min/max over ``[start, end)`` from whole daily buckets (hourly at the ragged ends)."""
+        buckets = self._cover(name, start, end)
+        count = sum(c for _, c, _, _, _ in buckets)
+        if not count:
+            return {"count": 0}
+        total = sum(s for _, _, s, _, _ in buckets)
+        return {
+            "count": count,
+            "sum": total,
+            "mean": total / count,
+            "min": min(lo for _, _, _, lo, _ in buckets),
+            "max": max(hi for _, _, _, _, hi in buckets),
+        }
+
+    def _cover(self, name: str, start: float, end: float) -> Sequence[Tuple[int, int, float, float, float]]:
+        # Hour-aligned edges; whole days in between come from the daily rollup.
+        start_h = int(start // HOUR) * HOUR
+        first_day = -(-start_h // DAY) * DAY
+        last_day = int(end // DAY) * DAY
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM series WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return []
+            query = (
+                "SELECT bucket, count, sum, min, max FROM rollups"
+                " WHERE series_id = ? AND resolution = ? AND bucket >= ? AND bucket < ?"
+            )
+            if first_day >= last_day:
+                return self._conn.execute(query, (row[0], HOUR, start_h, end)).fetchall()
+            return (
+                self._conn.execute(query, (row[0], HOUR, start_h, first_day)).fetchall()
+                + self._conn.execute(query, (row[0], DAY, first_day, last_day)).fetchall()
+                + self._conn.execute(query, (row[0], HOUR, last_day, end)).fetchall()
+            )
+
+    def trend(self, name: str, start: float, end: float, resolution: str = "day") -> Dict:
+        """
+        Least-squares slope of the bucket means (per day), weighted by sample
+        count, plus the first/last bucket means. Aggregated in SQL over the
+        rollup rows only.
+        """
+        step = RESOLUTIONS.get(resolution)
+        if not step:
+            raise ValueError("trend resolution must be hour or day")
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM series WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return {"buckets": 0}
+            # x in days relative to start keeps the sums well-conditioned; y is each bucket mean.
+            n, sw, sx, sy, sxx, sxy = self._conn.execute(
+                """
+                SELECT COUNT(*), SUM(count), SUM(count * x), SUM(count * y), SUM(count * x * x), SUM(count * x * y)
+                FROM (SELECT count, (bucket - ?) / 86400.0 AS x, sum / count AS y FROM rollups
+                      WHERE series_id = ? AND resolution = ? AND bucket >= ? AND bucket < ?)
+                """,
+                (start, row[0], step, int(start // step) * step, end),
+            ).fetchone()
+            bounds = (row[0], step, int(start // step) * step, end)
+            edge_query = (
+                "SELECT sum / count FROM rollups WHERE series_id = ? AND resolution = ? AND bucket >= ? AND bucket < ?"
+                " ORDER BY bucket {} LIMIT 1"
+            )
+            first = self._conn.execute(edge_query.format("ASC"), bounds).fetchone()
+            last = self._conn.execute(edge_query.format("DESC"), bounds).fetchone()
+        if not n:
+            return {"buckets": 0}
+        result = {"buckets": n, "samples": int(sw), "first": first[0], "last": last[0]}
+        result["change"] = result["last"] - result["first"]
+        denominator = sw * sxx - sx * sx
+        result["slope_per_day"] = (sw * sxy - sx * sy) / denominator if n > 1 and denominator > 0 else 0.0
+        return result
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def analysis_values(ndvi_summary: Dict, parcels: Optional[Dict[str, Dict]] = None) -> Dict[str, float]:
+    """Series values for one published NDVI analysis (``ndvi.*``, ``<index>.*``, ``parcel.<id>.*``)."""
+    values = {f"ndvi.{key}": ndvi_summary.get(key) for key in ("mean", "min", "max", "stress_ratio")}
+    for name, summary in (ndvi_summary.get("indices") or {}).items():
+        values.update({f"{name}.{key}": summary.get(key) for key in ("mean", "stress_ratio")})
+    for parcel_id, stats in (parcels or {}).items():
+        if stats.get("pixels"):
+            values.update({f"parcel.{parcel_id}.{key}": stats.get(key) for key in ("mean", "stress_ratio")})
+    return values
+
+
+def window(days: Optional[float], since: Optional[float] = None, until: Optional[float] = None) -> Tuple[float, float]:
+    """``(start, end)`` epoch seconds: an explicit ``since``/``until`` or the last ``days``."""
+    end = until if until is not None else time.time()
+    start = since if since is not None else end - (days or 30.0) * DAY
+    return start, end
+
@@ -0,0 +1,145 @@
+# In-process MQTT broker stand-in for offline benchmarks and dry runs.
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import paho.mqtt.client as mqtt
+
+from .dispatcher import TopicTrie
+
+
+@dataclass
+class _PublishResult:
+    rc: int = mqtt.MQTT_ERR_SUCCESS
+    mid: int = 0
+
+
+@dataclass
+class _Message:
+    topic: str
+    payload: bytes
+    qos: int = 0
+    retain: bool = False
+
+
+class LoopbackBroker:
+    """
+    Routes publishes between ``LoopbackTransport`` clients in the same process.
+
+    Delivery happens synchronously on the publishing thread, where paho's
+    network thread would normally run the ``on_message`` callback. Retained
+    messages are kept per topic and replayed on subscribe, like a broker.
+    """
+
+    def __init__(self):
+        self._trie = TopicTrie()  # filter -> marker; subscribers per filter are kept below
+        self._subscribers: Dict[str, List["LoopbackTransport"]] = {}
+        self._retained: Dict[str, _Message] = {}
+        self._lock = threading.Lock()
+        self.counters = {"published": 0, "delivered": 0, "bytes": 0}
+
+    def client(self, client_id: str = "") -> "LoopbackTransport":
+        return LoopbackTransport(self, client_id)
+
+    def _subscribe(self, transport: "LoopbackTransport", topic_filter: str):
+        with self._lock:
+            subscribers = self._subscribers.get(topic_filter)
+            if subscribers is None:
+                subscribers = self._subscribers[topic_filter] = []
+                self._trie.add(topic_filter, None)
+            subscribers.append(transport)
+            retained = [m for m in self._retained.values() if self._targets(m.topic, only=transport)]
+        for message in retained:
+            transport._deliver(message)
+
+    def _unsubscribe(self, transport: "LoopbackTransport", topic_filter: str):
+        with self._lock:
+            subscribers = self._subscribers.get(topic_filter, [])
+            if transport in subscribers:
+                subscribers.remove(transport)
+            if not subscribers:
+                self._subscribers.pop(topic_filter, None)
+                self._trie.remove(topic_filter)
+
+    def _targets(self, topic: str, only: Optional["LoopbackTransport"] = None) -> List["LoopbackTransport"]:
+        # One delivery per client, even when several of its filters match (caller holds the lock).
+        targets: Dict[int, LoopbackTransport] = {}
+        for topic_filter, _ in self._trie.match(topic):
+            for transport in self._subscribers.get(topic_filter, ()):
+                if only is None or transport is only:
+                    targets.setdefault(id(transport), transport)
+        return list(targets.values())
+
+    def _publish(self, message: _Message):
+        with self._lock:
+            self.counters["published"] += 1
+            self.counters["bytes"] += len(message.payload)
+            if message.retain:
+                self._retained[message.topic] = message
+            targets = self._targets(message.topic)
+            self.counters["delivered"] += len(targets)
+        for transport in targets:
+            transport._deliver(message)
+
+
+class LoopbackTransport:
+    """The subset of ``paho.mqtt.client.Client`` used by ``MQTTClient``."""
+
+    def __init__(self, broker: LoopbackBroker, client_id: str = ""):
+        self.broker = broker
+        self.client_id = client_id
+        self.connected = False
+        self._filters: List[str] = []
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+
+    def username_pw_set(self, username: str, password: Optional[str] = None):
+        pass
+
+    def tls_set(self, *args, **kwargs):
+        pass
+
+    def connect(self, host: str = "", port: int = 0, keepalive: int = 60):
+        self.connected = True
+        if self.on_connect:
+            self.on_connect(self, None, {}, 0)
+
+    connect_async = connect
+
+    def loop_start(self):
+        pass
+
+    def loop_forever(self):
+        pass
+
+    def disconnect(self):
+        for topic_filter in self._filters:
+            self.broker._unsubscribe(self, topic_filter)
+        self._filters = []
+        if self.connected:
+            self.connected = False
+            if self.on_disconnect:
+                self.on_disconnect(self, None, 0)
+
+    def subscribe(self, topic: str, qos: int = 0):
+        if topic not in self._filters:
+            self._filters.append(topic)
+            self.broker._subscribe(self, topic)
+        return mqtt.MQTT_ERR_SUCCESS, 0
+
+    def unsubscribe(self, topic: str):
+        if topic in self._filters:
+            self._filters.remove(topic)
+            self.broker._unsubscribe(self, topic)
+        return mqtt.MQTT_ERR_SUCCESS, 0
+
+    def publish(self, topic: str, payload: bytes = b"", qos: int = 0, retain: bool = False) -> _PublishResult:
+        if not self.connected:
+            return _PublishResult(rc=mqtt.MQTT_ERR_NO_CONN)
+        self.broker._publish(_Message(topic, bytes(payload), qos, retain))
+        return _PublishResult()
+
+    def _deliver(self, message: _Message):
+        if self.on_message:
+            self.on_message(self, None, message)
@@ -0,0 +1,386 @@
+# Process-wide counters, gauges and latency histograms with Prometheus text and MQTT exposition.
+import bisect
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Millisecond buckets spanning a dispatcher hand-off (<1 ms) to a full-resolution NDVI capture (seconds).
+DEFAULT_MS_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 500.0, 1000.0, 2500.0, 5000.0, 10000.0)
+
+
+def _key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+        self._values: Dict[LabelKey, float] = {}
+        self._functions: Dict[LabelKey, Callable[[], float]] = {}  # series read at collection time
+
+    def set_function(self, fn: Optional[Callable[[], float]], **labels: str):
+        """
+        Read the ``labels`` series from ``fn`` at collection time; None removes it.
+        Each instance behind a metric (MQTT client, pipeline, ...) registers its own labels.
+        """
+        key = _key(labels)
+        with self._lock:
+            if fn is None:
+                self._functions.pop(key, None)
+            else:
+                self._functions[key] = fn
+
+    def values(self) -> Dict[LabelKey, float]:
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for key, fn in functions:
+            try:
+                values[key] = float(fn())
+            except Exception as exc:
+                logging.debug("Metric %s callback failed: %s", self.name, exc)
+        return values
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+    def snapshot(self):
+        values = self.values()
+        if set(values) <= {()}:
+            return values.get((), 0.0)
+        return {",".join(f"{k}={v}" for k, v in key): value for key, value in values.items()}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str):
+        with self._lock:
+            self._values[_key(labels)] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str):
+        self.inc(-amount, **labels)
+
+
+class _HistogramSeries:
+    __slots__ = ("counts", "total", "count", "maximum")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * (buckets + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+        self.maximum = 0.0
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_MS_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        self._series: Dict[LabelKey, _HistogramSeries] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = _key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _HistogramSeries(len(self.buckets))
+            series.counts[idx] += 1
+            series.total += value
+            series.count += 1
+            series.maximum = max(series.maximum, value)
+
+    def time(self, **labels: str) -> "_Timer":
+        """``with histogram.time(): ...`` observes the block's duration in milliseconds."""
+        return _Timer(self, labels)
+
+    def _copy(self) -> Dict[LabelKey, _HistogramSeries]:
+        with self._lock:
+            copies = {}
+            for key, series in self._series.items():
+                copy = _HistogramSeries(len(self.buckets))
+                copy.counts = list(series.counts)
+                copy.total, copy.count, copy.maximum = series.total, series.count, series.maximum
+                copies[key] = copy
+            return copies
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self._copy().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series.counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(series.total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series.count}")
+        return lines
+
+    def _quantile(self, series: _HistogramSeries, q: float) -> float:
+        # Upper bound of the bucket holding the q-th observation (capped by the observed maximum).
+        rank = q * series.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, series.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, series.maximum)
+        return series.maximum
+
+    def snapshot(self):
+        out = {}
+        for key, series in self._copy().items():
+            label = ",".join(f"{k}={v}" for k, v in key)
+            out[label] = {
+                "count": series.count,
+                "avg": series.total / series.count if series.count else 0.0,
+                "p50": self._quantile(series, 0.5),
+                "p95": self._quantile(series, 0.95),
+                "max": series.maximum,
+            }
+        if set(out) <= {""}:
+            return out.get("", {"count": 0})
+        return out
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe((time.perf_counter() - self.started) * 1000.0, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """Named metrics, created on first use; asking for an existing name returns the same object."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _get(self, cls, name: str, factory: Callable[[], _Metric]) -> _Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as a {metric.kind}")
+            return metric
+
+    def counter(
+        self, name: str, help_text: str, fn: Optional[Callable[[], float]] = None, labels: Optional[Dict] = None
+    ) -> Counter:
+        metric = self._get(Counter, name, lambda: Counter(name, help_text))
+        if fn is not None:
+            metric.set_function(fn, **(labels or {}))
+        return metric
+
+    def gauge(
+        self, name: str, help_text: str, fn: Optional[Callable[[], float]] = None, labels: Optional[Dict] = None
+    ) -> Gauge:
+        metric = self._get(Gauge, name, lambda: Gauge(name, help_text))
+        if fn is not None:
+            metric.set_function(fn, **(labels or {}))
+        return metric
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_MS_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, lambda: Histogram(name, help_text, buckets))
+
+    def metrics(self) -> List[_Metric]:
+        with self._lock:
+            return sorted(self._metrics.values(), key=lambda m: m.name)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+        for metric in self.metrics():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict:
+        return {metric.name: metric.snapshot() for metric in self.metrics()}
+
+
+REGISTRY = MetricsRegistry()
+
+
+def counter(
+    name: str, help_text: str, fn: Optional[Callable[[], float]] = None, labels: Optional[Dict] = None
+) -> Counter:
+    return REGISTRY.counter(name, help_text, fn, labels)
+
+
+def gauge(name: str, help_text: str, fn: Optional[Callable[[], float]] = None, labels: Optional[Dict] = None) -> Gauge:
+    return REGISTRY.gauge(name, help_text, fn, labels)
+
+
+def histogram(name: str, help_text: str, buckets: Sequence[float] = DEFAULT_MS_BUCKETS) -> Histogram:
+    return REGISTRY.histogram(name, help_text, buckets)
+
+
+# Exposition -------------------------------------------------------------------
+@dataclass
+class MetricsSettings:
+    enabled: bool = False
+    http_host: str = "127.0.0.1"
+    http_port: int = 9108  # 0 disables the HTTP endpoint
+    publish_interval_seconds: float = 30.0  # 0 disables the MQTT metrics topic
+
+    @classmethod
+    def from_config(cls, raw: Optional[dict]) -> "MetricsSettings":
+        raw = raw or {}
+        return cls(
+            enabled=bool(raw.get("enabled", cls.enabled)),
+            http_host=str(raw.get("http_host", cls.http_host)),
+            http_port=int(raw.get("http_port", cls.http_port)),
+            publish_interval_seconds=float(raw.get("publish_interval_seconds", cls.publish_interval_seconds)),
+        )
+
+
+class MetricsServer:
+    """Serves ``GET /metrics`` in Prometheus text format from a daemon thread."""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY, host: str = "127.0.0.1", port: int = 9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> bool:
+        # Imported here: http.server pulls in the email package, which CLI startup should not pay for.
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self.registry
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):  # noqa: N802 - http.server naming
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                logging.debug("metrics http: " + fmt, *args)
+
+        try:
+            self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        except OSError as exc:
+            logging.error("Metrics endpoint not started on %s:%s (%s)", self.host, self.port, exc)
+            return False
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+        logging.info("Metrics endpoint on http://%s:%s/metrics", self.host, self.port)
+        return True
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class MetricsPublisher:
+    """
+    Publishes a registry snapshot to an MQTT topic every ``interval`` seconds.
+
+    Like the status publisher, ``process`` returns the next due time so the
+    asyncio runtime can drive it; ``start`` runs it on its own thread.
+    """
+
+    def __init__(self, mqtt_client, topic: str, interval: float, source: str, registry: MetricsRegistry = REGISTRY):
+        self.mqtt = mqtt_client
+        self.topic = topic
+        self.interval = max(1.0, float(interval))
+        self.source = source
+        self.registry = registry
+        self._next = time.monotonic() + self.interval
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def publish(self):
+        payload = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "source": self.source,
+            "metrics": self.registry.snapshot(),
+        }
+        try:
+            self.mqtt.publish(self.topic, payload)
+        except Exception as exc:
+            logging.error("Metrics publish failed: %s", exc)
+
+    def process(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        if now >= self._next:
+            self.publish()
+            self._next = max(now, self._next + self.interval)
+        return self._next
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            self._stopped.wait(max(0.0, self.process() - time.monotonic()))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="metrics-publisher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
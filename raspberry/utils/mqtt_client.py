@@ -1,14 +1,22 @@
-import json
 import logging
 import ssl
 import threading
+import time
 from dataclasses import dataclass
-from typing import Callable, Optional
+from typing import Dict, Optional, Union
 
 import paho.mqtt.client as mqtt
 
+from . import metrics
+from .codecs import PayloadCodec
+from .dispatcher import MessageDispatcher, MessageHandler
+from .spool import PublishSpool
 
-MessageHandler = Callable[[dict], None]
+_MESSAGES_OUT = metrics.counter("mqtt_messages_out_total", "Outgoing messages by path (direct or spooled).")
+_MESSAGES_IN = metrics.counter("mqtt_messages_in_total", "Messages received from the broker.")
+_PUBLISH_MS = metrics.histogram("mqtt_publish_ms", "Time spent in MQTTClient.publish (encode and hand-off), ms.")
+_RECONNECTS = metrics.counter("mqtt_reconnects_total", "Successful connections after the first one.")
+_CONNECTED = metrics.gauge("mqtt_connected", "1 while connected to the broker, by client id.")
 
 
 @dataclass
@@ -21,58 +29,170 @@ class MQTTSettings:
     keepalive: int
     tls: bool = False
     cafile: Optional[str] = None
+    dispatch_workers: int = 2
+    dispatch_queue_size: int = 256
 
 
 class MQTTClient:
-    """Minimal MQTT wrapper with JSON payloads."""
+    """
+    Minimal MQTT wrapper; payloads are dicts serialized by a PayloadCodec (JSON by default).
 
-    def __init__(self, settings: MQTTSettings):
+    Inbound messages are only enqueued on paho's network thread; decoding and
+    handlers run on a ``MessageDispatcher`` worker pool, routed by topic filter.
+    ``publish`` never waits for the broker: while offline (or while a backlog
+    is draining) messages go through a ``PublishSpool``.
+    """
+
+    def __init__(
+        self,
+        settings: MQTTSettings,
+        codec: Optional[PayloadCodec] = None,
+        spool: Optional[PublishSpool] = None,
+        transport=None,
+    ):
         self.settings = settings
-        self._client = mqtt.Client(client_id=settings.client_id, clean_session=True)
+        self.codec = codec or PayloadCodec()
+        self.spool = spool or PublishSpool()
+        # ``transport`` stands in for the paho client (e.g. utils.loopback for offline benchmarks).
+        self._client = transport or mqtt.Client(client_id=settings.client_id, clean_session=True)
         if settings.username:
             self._client.username_pw_set(settings.username, settings.password)
         if settings.tls:
             self._client.tls_set(ca_certs=settings.cafile, cert_reqs=ssl.CERT_REQUIRED)
-        self._message_handler: Optional[MessageHandler] = None
+        self.dispatcher = MessageDispatcher(
+            self.codec.decode,
+            workers=settings.dispatch_workers,
+            queue_size=settings.dispatch_queue_size,
+        )
+        self._subscriptions: Dict[str, int] = {}
+        self._subscriptions_lock = threading.Lock()
         self._connected_event = threading.Event()
+        self._connections = 0
         self._client.on_connect = self._on_connect
+        self._client.on_disconnect = self._on_disconnect
         self._client.on_message = self._on_message
+        self.spool.start(self._send)
+        # One series per client: fleet mode runs several clients in one process.
+        self._metric_labels = {"client": settings.client_id}
+        self._metrics = [
+            metrics.gauge(
+                "mqtt_spool_pending",
+                "Messages waiting in the offline spool, by client id.",
+                fn=self.spool.pending,
+                labels=self._metric_labels,
+            ),
+            metrics.counter(
+                "mqtt_spool_replayed_total",
+                "Spooled messages sent after a reconnect, by client id.",
+                fn=self._spool_replayed,
+                labels=self._metric_labels,
+            ),
+            metrics.gauge(
+                "mqtt_dispatch_queue_depth",
+                "Inbound messages waiting for a handler worker, by client id.",
+                fn=lambda: sum(self.dispatcher.queue_depths()),
+                labels=self._metric_labels,
+            ),
+            metrics.counter(
+                "mqtt_dispatch_dropped_total",
+                "Inbound messages dropped on a full dispatch queue, by client id.",
+                fn=lambda: self.dispatcher.counters["dropped"],
+                labels=self._metric_labels,
+            ),
+        ]
+        _CONNECTED.set(0, **self._metric_labels)
+
+    def _spool_replayed(self) -> int:
+        return self.spool.counters["replayed"]
 
     def _on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             logging.info("MQTT connected to %s:%s", self.settings.broker, self.settings.port)
             self._connected_event.set()
+            self._connections += 1
+            if self._connections > 1:
+                _RECONNECTS.inc()
+            _CONNECTED.set(1, **self._metric_labels)
+            # clean_session drops subscriptions on the broker side; restore them after every (re)connect.
+            with self._subscriptions_lock:
+                subscriptions = list(self._subscriptions.items())
+            for topic, qos in subscriptions:
+                client.subscribe(topic, qos=qos)
+            self.spool.set_connected(True)
         else:
             logging.error("MQTT connection failed (rc=%s)", rc)
 
+    def _on_disconnect(self, client, userdata, rc):
+        self._connected_event.clear()
+        _CONNECTED.set(0, **self._metric_labels)
+        self.spool.set_connected(False)
+        if rc != 0:
+            logging.warning("MQTT connection lost (rc=%s); spooling outgoing messages.", rc)
+
     def _on_message(self, client, userdata, msg):
-        if not self._message_handler:
-            return
-        try:
-            payload = json.loads(msg.payload.decode("utf-8"))
-        except json.JSONDecodeError:
-            logging.warning("MQTT: discarded non-JSON payload on %s", msg.topic)
-            return
-        self._message_handler(payload)
-
-    def publish(self, topic: str, payload: dict, qos: int = 0, retain: bool = False):
-        if not self._connected_event.is_set():
-            logging.debug("MQTT publish waited for connection...")
-            self._connected_event.wait(timeout=5)
-        logging.debug("MQTT publishing to %s: %s", topic, payload)
-        self._client.publish(topic, json.dumps(payload), qos=qos, retain=retain)
+        _MESSAGES_IN.inc()
+        self.dispatcher.submit(msg.topic, msg.payload)
+
+    def wait_connected(self, timeout: Optional[float] = None) -> bool:
+        return self._connected_event.wait(timeout)
+
+    def _send(self, topic: str, data: bytes, qos: int, retain: bool) -> bool:
+        return self._client.publish(topic, data, qos=qos, retain=retain).rc == mqtt.MQTT_ERR_SUCCESS
+
+    def publish(self, topic: str, payload: Union[dict, bytes], qos: int = 0, retain: bool = False):
+        """Publish a dict through the codec; bytes are treated as an already encoded payload. Never blocks."""
+        started = time.perf_counter()
+        data = bytes(payload) if isinstance(payload, (bytes, bytearray)) else self.codec.encode(payload)
+        # Straight to paho only when connected with no backlog, so spooled messages keep their order.
+        if self._connected_event.is_set() and not self.spool.pending() and self._send(topic, data, qos, retain):
+            logging.debug("MQTT publishing %d bytes to %s", len(data), topic)
+            path = "direct"
+        else:
+            logging.debug("MQTT spooling %d bytes for %s", len(data), topic)
+            self.spool.put(topic, data, qos, retain)
+            path = "spooled"
+        _MESSAGES_OUT.inc(path=path)
+        _PUBLISH_MS.observe((time.perf_counter() - started) * 1000.0)
+
+    def spool_stats(self) -> dict:
+        """Queued (memory/disk), spilled, dropped, expired and replayed message counts."""
+        return self.spool.stats()
 
     def subscribe(self, topic: str, handler: MessageHandler, qos: int = 0):
-        self._message_handler = handler
+        """Route messages matching ``topic`` (``+``/``#`` allowed) to ``handler``; handlers accumulate."""
+        self.dispatcher.add_route(topic, handler)
+        self.dispatcher.start()
+        with self._subscriptions_lock:
+            qos = self._subscriptions[topic] = max(qos, self._subscriptions.get(topic, 0))
         self._client.subscribe(topic, qos=qos)
 
+    def unsubscribe(self, topic: str):
+        self.dispatcher.remove_route(topic)
+        with self._subscriptions_lock:
+            self._subscriptions.pop(topic, None)
+        self._client.unsubscribe(topic)
+
+    def dispatch_stats(self) -> dict:
+        """Dispatcher queue depths, drop counters and per-filter handler latency."""
+        return self.dispatcher.stats()
+
     def loop_start(self):
-        self._client.connect(self.settings.broker, self.settings.port, self.settings.keepalive)
+        # connect_async lets paho keep retrying in the background when the broker is unreachable at startup.
+        self._client.connect_async(self.settings.broker, self.settings.port, self.settings.keepalive)
         self._client.loop_start()
 
     def loop_forever(self):
         self._client.connect(self.settings.broker, self.settings.port, self.settings.keepalive)
         self._client.loop_forever()
 
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Give the spool up to ``timeout`` seconds to send its backlog (e.g. before a short-lived CLI exits)."""
+        return self.spool.drain(timeout)
+
     def disconnect(self):
+        # Anything still unsent is persisted by the spool (when it has a directory) for the next run.
+        self.spool.stop()
         self._client.disconnect()
+        self.dispatcher.stop()
+        for metric in self._metrics:
+            metric.set_function(None, **self._metric_labels)
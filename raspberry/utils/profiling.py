@@ -0,0 +1,110 @@
+# Opt-in cProfile / sampling profiles of a CLI run, written to disk when the run ends.
+import collections
+import io
+import logging
+import pathlib
+import sys
+import threading
+import time
+from typing import Callable, Counter, Optional
+
+PROFILE_MODES = ("cprofile", "sampling")
+
+
+class SamplingProfiler:
+    """
+    Samples every thread's stack at a fixed interval from a background thread.
+
+    Unlike cProfile this sees the worker, dispatcher and pipeline threads and
+    adds little overhead, so it suits long-running services. Output is the
+    collapsed-stack format ("thread;outer;...;inner count") read by
+    flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = max(0.0005, float(interval))
+        self.samples: Counter[str] = collections.Counter()
+        self.sample_count = 0
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({pathlib.Path(code.co_filename).name}:{code.co_firstlineno})"
+
+    def _sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_name(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.samples[";".join(reversed(stack))] += 1
+        self.sample_count += 1
+
+    def _loop(self):
+        while not self._stopped.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def write(self, path: pathlib.Path):
+        with path.open("w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _write_cprofile(profile, path: pathlib.Path, top: int = 40):
+    import pstats
+
+    profile.dump_stats(str(path))
+    text = io.StringIO()
+    pstats.Stats(profile, stream=text).sort_stats("cumulative").print_stats(top)
+    path.with_suffix(path.suffix + ".txt").write_text(text.getvalue(), encoding="utf-8")
+
+
+def run_profiled(func: Callable[[], object], path: str, mode: str = "cprofile", interval: float = 0.005):
+    """
+    Run ``func`` under the chosen profiler and write the profile to ``path``.
+
+    ``cprofile`` writes a pstats dump (``snakeviz``/``pstats`` readable) plus a
+    ``.txt`` top-functions summary; it only covers the calling thread.
+    ``sampling`` writes collapsed stacks for all threads. The profile is
+    written even when the run is interrupted with Ctrl+C.
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode {mode!r} (expected one of {', '.join(PROFILE_MODES)})")
+    target = pathlib.Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    if mode == "cprofile":
+        import cProfile  # with pstats, only loaded when profiling: main.py imports this module on every run
+
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func)
+        finally:
+            _write_cprofile(profile, target)
+            logging.info("cProfile of %.1fs run written to %s", time.perf_counter() - started, target)
+    sampler = SamplingProfiler(interval)
+    sampler.start()
+    try:
+        return func()
+    finally:
+        sampler.stop()
+        sampler.write(target)
+        elapsed = time.perf_counter() - started
+        logging.info("%d stack samples over %.1fs written to %s", sampler.sample_count, elapsed, target)
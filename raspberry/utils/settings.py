@@ -0,0 +1,393 @@
+# Typed settings compiled once from the YAML config, and a watcher that hot-reloads them.
+import dataclasses
+import logging
+import math
+import os
+import pathlib
+import sys
+import threading
+from typing import Callable, List, Optional, Tuple
+
+from . import metrics
+
+
+def _frozen(cls):
+    # slots=True needs Python 3.10; older interpreters still get immutable instances.
+    if sys.version_info >= (3, 10):
+        return dataclasses.dataclass(frozen=True, slots=True)(cls)
+    return dataclasses.dataclass(frozen=True)(cls)
+
+
+class ConfigError(ValueError):
+    """Raised by ``Settings.compile`` with every problem found in the config."""
+
+    def __init__(self, problems: List[str]):
+        self.problems = problems
+        super().__init__("Invalid config:\n  - " + "\n  - ".join(problems))
+
+
+@_frozen
+class TopicSettings:
+    telemetry: str = "agriculture/drone/telemetry"
+    analysis: str = "agriculture/drone/analysis"
+    irrigation_command: str = "agriculture/irrigation/command"
+    irrigation_status: str = "agriculture/irrigation/status"
+    parcel_analysis: str = "agriculture/drone/parcels"
+    metrics: str = "agriculture/metrics"
+    irrigation_plan: str = "agriculture/irrigation/plan"
+    irrigation_ack: str = "agriculture/irrigation/ack"
+    fleet_status: str = "agriculture/fleet/status"
+
+
+@_frozen
+class ValveSpec:
+    valve_id: str
+    gpio_pin: int
+    flow_lpm: float
+
+
+@_frozen
+class IrrigationSettings:
+    valves: Tuple[ValveSpec, ...]
+    max_parallel_valves: int
+    publish_interval_seconds: float
+    status_coalesce_seconds: float = 0.2
+
+
+RAW_DTYPES = ("uint8", "uint16", "float32")
+
+
+@_frozen
+class RawFormat:
+    """
+    Frame size and sample type of ``.raw``/``.bin`` band dumps. RGB dumps are
+    read as interleaved ``(height, width, 3)``, single-band dumps (NIR,
+    red-edge) as ``(height, width)``.
+    """
+
+    height: int
+    width: int
+    dtype: str = "uint8"
+
+    def shape(self, channels: int = 1) -> Tuple[int, ...]:
+        return (self.height, self.width) if channels == 1 else (self.height, self.width, channels)
+
+    @classmethod
+    def from_config(cls, camera_cfg: dict) -> Optional["RawFormat"]:
+        """``camera.raw_shape`` ([height, width]) and ``camera.raw_dtype``; None when no raw shape is configured."""
+        raw_shape = camera_cfg.get("raw_shape")
+        if raw_shape is None:
+            return None
+        try:
+            sides = tuple(int(side) for side in raw_shape)
+        except (TypeError, ValueError):
+            sides = ()
+        # [h, w, 3] is accepted for older configs; the channel count now follows from the capture.
+        if len(sides) == 3 and sides[2] == 3:
+            sides = sides[:2]
+        if len(sides) != 2 or min(sides) <= 0:
+            raise ValueError(f"drone.camera.raw_shape must be [height, width], got {raw_shape!r}")
+        dtype = str(camera_cfg.get("raw_dtype", "uint8"))
+        if dtype not in RAW_DTYPES:
+            raise ValueError(f"drone.camera.raw_dtype must be one of {', '.join(RAW_DTYPES)}, got {dtype!r}")
+        return cls(height=sides[0], width=sides[1], dtype=dtype)
+
+
+@_frozen
+class CameraSettings:
+    rgb_path: str
+    nir_path: str
+    width: int
+    height: int
+    raw_format: Optional[RawFormat] = None
+
+    @property
+    def resize(self) -> Tuple[int, int]:
+        return self.width, self.height
+
+
+@_frozen
+class NDVISettings:
+    stress_threshold: float
+    tile_rows: int
+    histogram_bins: int = 0
+    preview_max_side: int = 0
+
+
+@_frozen
+class DroneSettings:
+    camera: CameraSettings
+    ndvi: NDVISettings
+
+
+@_frozen
+class ReloadSettings:
+    enabled: bool = False
+    interval_seconds: float = 2.0
+
+
+@_frozen
+class Settings:
+    """The hot-path parts of the config; other sections keep their own ``from_config`` settings."""
+
+    topics: TopicSettings
+    drone: Optional[DroneSettings]
+    irrigation: Optional[IrrigationSettings]
+    reload: ReloadSettings
+
+    @classmethod
+    def compile(cls, raw: dict) -> "Settings":
+        """Validate ``raw`` and build the settings; raises ``ConfigError`` listing every problem."""
+        problems: List[str] = []
+        mqtt_cfg = raw.get("mqtt") or {}
+        topics = cls._topics(mqtt_cfg.get("topics") or {}, problems)
+        drone = cls._drone(raw["drone"], problems) if raw.get("drone") else None
+        irrigation = cls._irrigation(raw["irrigation"], problems) if raw.get("irrigation") else None
+        reload_cfg = raw.get("reload") or {}
+        interval = _number(reload_cfg, "interval_seconds", 2.0, "reload", problems, minimum=0.1)
+        if problems:
+            raise ConfigError(problems)
+        return cls(
+            topics=topics,
+            drone=drone,
+            irrigation=irrigation,
+            reload=ReloadSettings(enabled=bool(reload_cfg.get("enabled", False)), interval_seconds=interval),
+        )
+
+    @staticmethod
+    def _topics(raw: dict, problems: List[str]) -> TopicSettings:
+        values = {}
+        for item in dataclasses.fields(TopicSettings):
+            value = raw.get(item.name, item.default)
+            if not isinstance(value, str) or not value or any(char in value for char in "+#"):
+                problems.append(f"mqtt.topics.{item.name} must be a topic name without wildcards, got {value!r}")
+                continue
+            values[item.name] = value
+        return TopicSettings(**values)
+
+    @staticmethod
+    def _drone(raw: dict, problems: List[str]) -> Optional[DroneSettings]:
+        camera_cfg, ndvi_cfg = raw.get("camera") or {}, raw.get("ndvi") or {}
+        count = len(problems)
+        raw_format = None
+        try:
+            raw_format = RawFormat.from_config(camera_cfg)
+        except ValueError as exc:
+            problems.append(str(exc))
+        for key in ("rgb_path", "nir_path"):
+            if not camera_cfg.get(key):
+                problems.append(f"drone.camera.{key} is required")
+        camera = dict(
+            rgb_path=str(camera_cfg.get("rgb_path", "")),
+            nir_path=str(camera_cfg.get("nir_path", "")),
+            width=int(_number(camera_cfg, "width", None, "drone.camera", problems, minimum=1)),
+            height=int(_number(camera_cfg, "height", None, "drone.camera", problems, minimum=1)),
+            raw_format=raw_format,
+        )
+        ndvi = dict(
+            stress_threshold=_number(ndvi_cfg, "stress_threshold", None, "drone.ndvi", problems, -1.0, 1.0),
+            tile_rows=int(_number(ndvi_cfg, "tile_rows", 256, "drone.ndvi", problems, minimum=1)),
+            histogram_bins=int(_number(ndvi_cfg, "histogram_bins", 0, "drone.ndvi", problems, minimum=0)),
+            preview_max_side=int(_number(ndvi_cfg, "preview_max_side", 0, "drone.ndvi", problems, minimum=0)),
+        )
+        if len(problems) > count:
+            return None
+        return DroneSettings(camera=CameraSettings(**camera), ndvi=NDVISettings(**ndvi))
+
+    @staticmethod
+    def _irrigation(raw: dict, problems: List[str]) -> Optional[IrrigationSettings]:
+        count = len(problems)
+        valves: List[ValveSpec] = []
+        ids, pins = set(), set()
+        for index, entry in enumerate(raw.get("valves") or []):
+            where = f"irrigation.valves[{index}]"
+            if not isinstance(entry, dict) or "id" not in entry:
+                problems.append(f"{where} needs an id")
+                continue
+            valve_id = str(entry["id"])
+            pin = int(_number(entry, "gpio_pin", None, where, problems, minimum=0))
+            flow = _number(entry, "flow_lpm", None, where, problems, exclusive_minimum=0.0)
+            if valve_id in ids:
+                problems.append(f"{where}: duplicate valve id {valve_id!r}")
+            if pin in pins:
+                problems.append(f"{where}: GPIO pin {pin} is already used by another valve")
+            ids.add(valve_id)
+            pins.add(pin)
+            valves.append(ValveSpec(valve_id, pin, flow))
+        settings = dict(
+            max_parallel_valves=int(_number(raw, "max_parallel_valves", None, "irrigation", problems, minimum=1)),
+            publish_interval_seconds=_number(raw, "publish_interval_seconds", None, "irrigation", problems, 1.0),
+            status_coalesce_seconds=_number(raw, "status_coalesce_seconds", 0.2, "irrigation", problems, 0.0),
+        )
+        if len(problems) > count:
+            return None
+        return IrrigationSettings(valves=tuple(valves), **settings)
+
+
+def _number(
+    raw: dict,
+    key: str,
+    default: Optional[float],
+    where: str,
+    problems: List[str],
+    minimum: Optional[float] = None,
+    maximum: Optional[float] = None,
+    exclusive_minimum: Optional[float] = None,
+) -> float:
+    """``raw[key]`` as a finite float within bounds; a problem is recorded (and 0 returned) otherwise."""
+    value = raw.get(key, default)
+    if value is None:
+        problems.append(f"{where}.{key} is required")
+        return 0.0
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        problems.append(f"{where}.{key} must be a number, got {value!r}")
+        return 0.0
+    if not math.isfinite(number):
+        problems.append(f"{where}.{key} must be finite, got {value!r}")
+    elif minimum is not None and number < minimum:
+        problems.append(f"{where}.{key} must be >= {minimum:g}, got {value!r}")
+    elif maximum is not None and number > maximum:
+        problems.append(f"{where}.{key} must be <= {maximum:g}, got {value!r}")
+    elif exclusive_minimum is not None and number <= exclusive_minimum:
+        problems.append(f"{where}.{key} must be > {exclusive_minimum:g}, got {value!r}")
+    else:
+        return number
+    return 0.0
+
+
+# Config paths a running service does not pick up: the connection, the components built at startup
+# and the sections read once by the subcommands. Changing them is logged as needing a restart.
+RESTART_KEYS = (
+    "mqtt.broker",
+    "mqtt.port",
+    "mqtt.username",
+    "mqtt.password",
+    "mqtt.client_id",
+    "mqtt.keepalive",
+    "mqtt.tls",
+    "mqtt.cafile",
+    "mqtt.payload",
+    "mqtt.spool",
+    "mqtt.dispatch",
+    "drone.autopilot_connection",
+    "drone.ndvi.indices",
+    "drone.ndvi.index_thresholds",
+    "drone.ndvi.mode",
+    "drone.ndvi.sampling",
+    "drone.pyramid",
+    "drone.cache",
+    "drone.parcels",
+    "drone.mosaic",
+    "drone.telemetry",
+    "drone.pipeline",
+    "irrigation.planner.enabled",
+    "runtime",
+    "history",
+    "fleet",
+    "daemon",
+    "metrics",
+)
+
+
+def _lookup(raw: dict, dotted_key: str):
+    current = raw
+    for part in dotted_key.split("."):
+        if not isinstance(current, dict) or part not in current:
+            return None
+        current = current[part]
+    return current
+
+
+def restart_required(old: dict, new: dict) -> List[str]:
+    """Changed config paths (from ``RESTART_KEYS``) that only take effect after a restart."""
+    return [key for key in RESTART_KEYS if _lookup(old, key) != _lookup(new, key)]
+
+
+_RELOADS = metrics.counter("config_reloads_total", "Config file reloads, by result (applied, invalid, failed).")
+
+Listener = Callable[[dict, Settings], None]
+
+
+class ConfigWatcher:
+    """
+    Polls the config file and applies changes without a restart.
+
+    Every ``interval`` seconds the file's mtime and size are compared with
+    the last load; on a change it is parsed and compiled, and only a config
+    that compiles is handed to the listeners (``listener(raw, settings)``), so
+    a half-saved or invalid file leaves the running settings untouched.
+    Listeners swap the new values in themselves; sections they cannot apply
+    live are logged as needing a restart.
+    """
+
+    def __init__(self, path, raw: dict, listeners: List[Listener], interval: float = 2.0):
+        self.path = pathlib.Path(path)
+        self.raw = raw
+        self.listeners = list(listeners)
+        self.interval = interval
+        self._stamp = self._stat()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def check(self) -> bool:
+        """Reload when the file changed; True when a new config was applied."""
+        stamp = self._stat()
+        if stamp is None or stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        # Imported here so this module stays usable without PyYAML (settings can be compiled from any dict).
+        from .config_loader import ConfigLoader
+
+        try:
+            raw = ConfigLoader(self.path).data
+            settings = Settings.compile(raw)
+        except Exception as exc:
+            _RELOADS.inc(result="invalid")
+            logging.error("Ignoring config change in %s: %s", self.path, exc)
+            return False
+        for key in restart_required(self.raw, raw):
+            logging.warning("Config %s changed; it takes effect after a restart.", key)
+        ok = True
+        for listener in self.listeners:
+            try:
+                listener(raw, settings)
+            except Exception as exc:
+                ok = False
+                logging.error("Applying reloaded config failed: %s", exc)
+        self.raw = raw
+        _RELOADS.inc(result="applied" if ok else "failed")
+        logging.info("Reloaded config from %s", self.path)
+        return True
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="config-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.interval + 1.0)
+            self._thread = None
+
+
+def watch_config(path, raw: dict, settings: Settings, listeners: List[Listener]) -> Optional[ConfigWatcher]:
+    """A started watcher when `reload.enabled`, else None."""
+    if not settings.reload.enabled:
+        return None
+    watcher = ConfigWatcher(path, raw, listeners, settings.reload.interval_seconds)
+    watcher.start()
+    logging.info("Watching %s for config changes every %.1fs", path, settings.reload.interval_seconds)
+    return watcher
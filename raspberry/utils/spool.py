@@ -0,0 +1,342 @@
+# Offline-tolerant outgoing message queue: memory ring + append-only disk segments.
+import collections
+import logging
+import os
+import pathlib
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+# Record: enqueue time, qos, retain, topic length, payload length, then topic and payload bytes.
+_HEADER = struct.Struct("<dBBHI")
+_SEGMENT_PATTERN = "seg-*.spool"
+
+# (topic, payload, qos, retain, enqueued_at)
+Message = Tuple[str, bytes, int, bool, float]
+Sender = Callable[[str, bytes, int, bool], bool]
+
+
+@dataclass
+class SpoolSettings:
+    directory: Optional[pathlib.Path] = None  # None keeps the spool in memory only
+    memory_items: int = 1000
+    segment_bytes: int = 1024 * 1024
+    max_bytes: int = 64 * 1024 * 1024
+    retention_seconds: float = 24 * 3600.0
+    replay_rate: float = 50.0  # messages per second while draining a backlog
+    replay_batch: int = 20
+
+    @classmethod
+    def from_config(cls, raw: Optional[dict], client_id: str = "") -> "SpoolSettings":
+        raw = raw or {}
+        directory = raw.get("directory")
+        return cls(
+            # One sub-directory per client so the drone and irrigation processes never share segments.
+            directory=pathlib.Path(directory) / (client_id or "default") if directory else None,
+            memory_items=max(1, int(raw.get("memory_items", cls.memory_items))),
+            segment_bytes=int(float(raw.get("segment_kb", cls.segment_bytes / 1024)) * 1024),
+            max_bytes=int(float(raw.get("max_mb", cls.max_bytes / (1024 * 1024))) * 1024 * 1024),
+            retention_seconds=float(raw.get("retention_hours", cls.retention_seconds / 3600.0)) * 3600.0,
+            replay_rate=float(raw.get("replay_rate", cls.replay_rate)),
+            replay_batch=max(1, int(raw.get("replay_batch", cls.replay_batch))),
+        )
+
+
+def _encode_record(message: Message) -> bytes:
+    topic, data, qos, retain, enqueued_at = message
+    topic_bytes = topic.encode("utf-8")
+    return _HEADER.pack(enqueued_at, qos, int(retain), len(topic_bytes), len(data)) + topic_bytes + data
+
+
+def _read_segment(path: pathlib.Path) -> List[Message]:
+    """Decode every complete record; a torn trailing record (crash mid-write) is ignored."""
+    buf = path.read_bytes()
+    messages: List[Message] = []
+    offset = 0
+    while offset + _HEADER.size <= len(buf):
+        enqueued_at, qos, retain, topic_len, data_len = _HEADER.unpack_from(buf, offset)
+        start = offset + _HEADER.size
+        end = start + topic_len + data_len
+        if end > len(buf):
+            logging.warning("Spool segment %s has a truncated record; ignoring the tail.", path.name)
+            break
+        topic = buf[start : start + topic_len].decode("utf-8")
+        messages.append((topic, buf[start + topic_len : end], qos, bool(retain), enqueued_at))
+        offset = end
+    return messages
+
+
+class PublishSpool:
+    """
+    Non-blocking outgoing queue in front of the MQTT client.
+
+    Messages that cannot go out immediately wait in a bounded in-memory ring;
+    when it fills up, the flusher thread appends its contents to the newest
+    on-disk segment (``seg-<n>.spool``), so the disk always holds the oldest
+    backlog and ``put`` never waits on a write or fsync. Until the spill
+    happens the ring may grow to twice ``memory_items``. The flusher drains
+    disk segments and then memory, in order, in batches
+    of ``replay_batch`` at no more than ``replay_rate`` messages per second
+    once the client reports a connection. Messages older than the retention
+    window are discarded on replay; past ``max_bytes`` the oldest segment is
+    dropped. Without a directory the ring drops its oldest message instead.
+    """
+
+    def __init__(self, settings: Optional[SpoolSettings] = None):
+        self.settings = settings or SpoolSettings()
+        self._cond = threading.Condition()
+        self._memory: Deque[Message] = collections.deque()
+        self._spilling: List[Message] = []  # taken from the ring, being written by the flusher
+        self._replaying: Deque[Message] = collections.deque()  # head segment loaded for replay
+        self._replaying_path: Optional[pathlib.Path] = None
+        self._segments: List[pathlib.Path] = []
+        self._segment_counts: Dict[pathlib.Path, int] = {}
+        self._writer = None
+        self._writer_path: Optional[pathlib.Path] = None
+        self._next_segment = 0
+        self._connected = False
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        self._send: Optional[Sender] = None
+        self.counters = {"enqueued": 0, "spilled": 0, "dropped": 0, "expired": 0, "replayed": 0}
+        if self.settings.directory is not None:
+            self._load_segments()
+
+    # Disk segments ---------------------------------------------------------------
+    def _load_segments(self):
+        directory = self.settings.directory
+        directory.mkdir(parents=True, exist_ok=True)
+        self._segments = sorted(directory.glob(_SEGMENT_PATTERN))
+        for path in self._segments:
+            self._segment_counts[path] = len(_read_segment(path))
+        if self._segments:
+            self._next_segment = int(self._segments[-1].stem.split("-")[1]) + 1
+            logging.info(
+                "Spool: %d message(s) from a previous run waiting in %s", sum(self._segment_counts.values()), directory
+            )
+
+    def _disk_bytes(self) -> int:
+        return sum(path.stat().st_size for path in self._segments if path.exists())
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._writer_path = None
+
+    def _spill_due(self) -> bool:
+        return self.settings.directory is not None and len(self._memory) >= self.settings.memory_items
+
+    def _append_segment(self, messages: List[Message]) -> Optional[pathlib.Path]:
+        """
+        Write ``messages`` to the newest segment and fsync; returns the path of a newly opened segment.
+        Only the flusher thread (or ``stop`` once it has ended) touches the writer, so no lock is needed.
+        """
+        new_path = None
+        if self._writer is None or self._writer.tell() >= self.settings.segment_bytes:
+            self._close_writer()
+            new_path = self.settings.directory / f"seg-{self._next_segment:012d}.spool"
+            self._next_segment += 1
+            self._writer = open(new_path, "ab")
+            self._writer_path = new_path
+        self._writer.write(b"".join(_encode_record(message) for message in messages))
+        self._writer.flush()
+        os.fsync(self._writer.fileno())
+        return new_path
+
+    def _record_spill(self, spilled: int, new_path: Optional[pathlib.Path]):
+        """Account for a written spill (caller holds the lock)."""
+        if new_path is not None:
+            self._segments.append(new_path)
+            self._segment_counts[new_path] = 0
+        self._segment_counts[self._writer_path] += spilled
+        self.counters["spilled"] += spilled
+        while len(self._segments) > 1 and self._disk_bytes() > self.settings.max_bytes:
+            self._drop_segment(self._segments[0], reason="spool size limit")
+
+    def _spill(self) -> bool:
+        """Move the memory ring to disk without holding the lock during the write (flusher thread)."""
+        with self._cond:
+            messages = self._spilling = list(self._memory)
+            self._memory.clear()
+        try:
+            new_path = self._append_segment(messages)
+        except OSError as exc:
+            logging.error("Spool: cannot write to %s (%s)", self.settings.directory, exc)
+            self._close_writer()
+            with self._cond:
+                self._spilling = []
+                self._memory.extendleft(reversed(messages))
+                while len(self._memory) > 2 * self.settings.memory_items:
+                    self._memory.popleft()
+                    self.counters["dropped"] += 1
+            return False
+        with self._cond:
+            self._spilling = []
+            self._record_spill(len(messages), new_path)
+        return True
+
+    def _drop_segment(self, path: pathlib.Path, reason: str):
+        if path == self._writer_path:
+            self._close_writer()
+        self._segments.remove(path)
+        count = self._segment_counts.pop(path, 0)
+        self.counters["dropped"] += count
+        path.unlink(missing_ok=True)
+        logging.warning("Spool: dropped %d message(s) from %s (%s)", count, path.name, reason)
+
+    def _next_batch(self) -> List[Message]:
+        """Oldest messages first: loaded segment, then further segments, then memory (caller holds the lock)."""
+        if not self._replaying and self._segments:
+            path = self._segments[0]
+            if path == self._writer_path:
+                self._close_writer()
+            self._replaying.extend(_read_segment(path))
+            self._replaying_path = path
+            self._segments.pop(0)
+            self._segment_counts.pop(path, None)
+            # The file stays until fully replayed: after a crash the segment is replayed again (at-least-once).
+        source = self._replaying if self._replaying else self._memory
+        batch = []
+        while source and len(batch) < self.settings.replay_batch:
+            batch.append(source.popleft())
+        return batch
+
+    def _requeue(self, messages: List[Message]):
+        # Unsent messages go back to the front so ordering survives a disconnect mid-replay.
+        self._replaying.extendleft(reversed(messages))
+
+    # Public API ------------------------------------------------------------------
+    def pending(self) -> int:
+        with self._cond:
+            return (
+                len(self._memory) + len(self._spilling) + len(self._replaying) + sum(self._segment_counts.values())
+            )
+
+    def put(self, topic: str, data: bytes, qos: int = 0, retain: bool = False):
+        """Queue a message; never blocks on the network or the disk (the flusher thread spills)."""
+        limit = self.settings.memory_items
+        if self.settings.directory is not None:
+            limit *= 2  # headroom while the flusher spills the ring
+        with self._cond:
+            if len(self._memory) >= limit:
+                self._memory.popleft()
+                self.counters["dropped"] += 1
+            self._memory.append((topic, data, qos, retain, time.time()))
+            self.counters["enqueued"] += 1
+            self._cond.notify()
+
+    def set_connected(self, connected: bool):
+        with self._cond:
+            self._connected = connected
+            self._cond.notify()
+
+    def start(self, send: Sender):
+        """Start the flusher; ``send`` returns False when the message could not be handed to the broker."""
+        self._send = send
+        self._thread = threading.Thread(target=self._loop, name="mqtt-spool", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        interval = 1.0 / self.settings.replay_rate if self.settings.replay_rate > 0 else 0.0
+        while True:
+            with self._cond:
+                while not self._stopped and not self._spill_due() and not (self._connected and self._has_pending()):
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                spill = self._spill_due()
+                batch = [] if spill else self._next_batch()
+            if spill:
+                if not self._spill():
+                    with self._cond:
+                        self._cond.wait(1.0)  # back off before retrying a failing disk
+                continue
+            started = time.monotonic()
+            sent = self._send_batch(batch)
+            if sent < len(batch):
+                with self._cond:
+                    self._requeue(batch[sent:])
+                    # Back off; a disconnect also flips ``_connected`` via set_connected.
+                    self._cond.wait(1.0)
+                continue
+            with self._cond:
+                if not self._replaying and self._replaying_path is not None:
+                    self._replaying_path.unlink(missing_ok=True)
+                    self._replaying_path = None
+                self._cond.notify_all()
+            delay = interval * len(batch) - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+    def _has_pending(self) -> bool:
+        return bool(self._memory or self._spilling or self._replaying or self._segments)
+
+    def _send_batch(self, batch: List[Message]) -> int:
+        cutoff = time.time() - self.settings.retention_seconds
+        sent = 0
+        for topic, data, qos, retain, enqueued_at in batch:
+            if enqueued_at < cutoff:
+                with self._cond:
+                    self.counters["expired"] += 1
+                sent += 1
+                continue
+            try:
+                ok = self._send(topic, data, qos, retain)
+            except Exception as exc:
+                logging.error("Spool: publish to %s failed: %s", topic, exc)
+                ok = False
+            if not ok:
+                break
+            sent += 1
+            with self._cond:
+                self.counters["replayed"] += 1
+        return sent
+
+    def drain(self, timeout: float) -> bool:
+        """Wait up to ``timeout`` seconds for the backlog to be sent; True when nothing is left."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._has_pending():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def stop(self, timeout: float = 2.0):
+        """Stop the flusher and persist whatever is still queued in memory."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        with self._cond:
+            if self.settings.directory is not None:
+                try:
+                    if self._replaying and self._replaying_path is not None:
+                        # Back under the head segment's name so it still sorts before the rest.
+                        self._replaying_path.write_bytes(b"".join(_encode_record(m) for m in self._replaying))
+                        self._segments.insert(0, self._replaying_path)
+                        self._segment_counts[self._replaying_path] = len(self._replaying)
+                        self._replaying.clear()
+                    self._memory.extendleft(reversed(self._replaying))
+                    self._replaying.clear()
+                    if self._memory:
+                        # The flusher has ended, so the write can run under the lock here.
+                        spilled = list(self._memory)
+                        self._record_spill(len(spilled), self._append_segment(spilled))
+                        self._memory.clear()
+                except OSError as exc:
+                    logging.error("Spool: cannot persist %d queued message(s): %s", len(self._memory), exc)
+            self._close_writer()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            stats = dict(self.counters)
+            stats["queued_memory"] = len(self._memory) + len(self._replaying)
+            stats["queued_disk"] = sum(self._segment_counts.values())
+        return stats